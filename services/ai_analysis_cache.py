@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from utils.logger import get_logger
+from utils.trading_calendar import current_trading_day, next_session_open
+
+# 获取日志器
+logger = get_logger()
+
+class AIAnalysisCache:
+    """
+    AI分析结果持久化缓存
+
+    AI分析的提示词由最近的行情和技术指标确定性生成，同一交易日内相同的提示词、模型和API地址
+    得到的分析可以直接复用（键中包含API密钥的哈希，不同密钥之间不共享）。结果保存在SQLite中，有效期到下一个交易日开盘为止
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化AI分析缓存
+
+        Args:
+            db_path: 数据库文件路径，默认为项目下的data/cache/ai_analysis.db，可通过AI_CACHE_DB环境变量配置
+        """
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'ai_analysis.db')
+        self.db_path = db_path or os.getenv('AI_CACHE_DB') or default_path
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_analysis (
+                cache_key TEXT PRIMARY KEY,
+                stock_code TEXT,
+                market_type TEXT,
+                model TEXT,
+                trading_day TEXT,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+        logger.debug(f"初始化AIAnalysisCache，数据库: {self.db_path}")
+
+    @staticmethod
+    def make_key(prompt: str, model: str, api_url: str, api_key_hash: str = '') -> str:
+        """
+        生成缓存键
+
+        Args:
+            prompt: 提示词
+            model: 模型名称
+            api_url: API地址
+            api_key_hash: API密钥的哈希，不同密钥的分析结果互不复用
+
+        Returns:
+            缓存键
+        """
+        payload = "\x1f".join([prompt, model or '', api_url or '', api_key_hash or ''])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        获取缓存的分析内容
+
+        Args:
+            cache_key: 缓存键
+
+        Returns:
+            分析内容，未命中或已过期时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM ai_analysis WHERE cache_key = ? AND expires_at > ?",
+                (cache_key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, cache_key: str, content: str, stock_code: str = '', market_type: str = 'A',
+            model: str = '', now: Optional[datetime] = None) -> None:
+        """
+        保存分析内容，有效期到该市场下一个交易日开盘
+
+        Args:
+            cache_key: 缓存键
+            content: 分析内容
+            stock_code: 股票代码
+            market_type: 市场类型
+            model: 模型名称
+            now: 参考时间，默认为当前时间
+        """
+        if not content:
+            return
+
+        expires_at = next_session_open(market_type, now).timestamp()
+        trading_day = current_trading_day(market_type, now).isoformat()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_analysis VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, stock_code, market_type, model, trading_day, content, time.time(), expires_at)
+            )
+            # 顺带清理过期的结果
+            self._conn.execute("DELETE FROM ai_analysis WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    async def aget(self, cache_key: str) -> Optional[str]:
+        """在线程池中执行get，避免阻塞事件循环；出错时视为未命中"""
+        try:
+            return await asyncio.to_thread(self.get, cache_key)
+        except Exception as e:
+            logger.error(f"读取AI分析缓存时出错: {str(e)}")
+            return None
+
+    async def aput(self, cache_key: str, content: str, stock_code: str = '', market_type: str = 'A', model: str = '') -> None:
+        """在线程池中执行put，避免阻塞事件循环"""
+        try:
+            await asyncio.to_thread(self.put, cache_key, content, stock_code, market_type, model)
+        except Exception as e:
+            logger.error(f"保存AI分析缓存时出错: {str(e)}")
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -1,14 +1,29 @@
+import asyncio
 import pandas as pd
 import os
 import json
-import httpx
-import re
-from typing import AsyncGenerator
+import copy
+import functools
+import hashlib
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Tuple
 from dotenv import load_dotenv
 from utils.logger import get_logger
 from utils.api_utils import APIUtils
+from utils.http_client import http_client_pool
+from utils.sse import iter_sse_data, loads as sse_loads
+from services.ai_analysis_cache import AIAnalysisCache
+from services.llm_hedge import LLMHedge
+from services.llm_metrics import LLMCall, llm_metrics
+from services.llm_scheduler import LLMScheduler, llm_scheduler, parse_retry_after
+from services.llm_stream_hub import LLMStreamHub, llm_stream_hub
+from services.analysis_demuxer import AnalysisDemuxer
+from services.recommendation_matcher import RecommendationTracker
+from services.prompt_encoder import PromptEncoder, estimate_tokens, format_summary
 from datetime import datetime
 
+# 加载环境变量（进程内只需加载一次）
+load_dotenv()
+
 # 获取日志器
 logger = get_logger()
 
@@ -18,7 +33,15 @@ class AIAnalyzer:
     负责调用AI API对股票数据进行分析
     """
     
-    def __init__(self, custom_api_url=None, custom_api_key=None, custom_api_model=None, custom_api_timeout=None):
+    # 回放缓存的分析结果时每个分块的字符数
+    CACHE_REPLAY_CHUNK_SIZE = 20
+    
+    # 按首个内容片段延迟的分位数计算对冲等待时间所需的最少样本数
+    HEDGE_MIN_SAMPLES = 20
+    
+    def __init__(self, custom_api_url=None, custom_api_key=None, custom_api_model=None, custom_api_timeout=None,
+                 analysis_cache: Optional[AIAnalysisCache] = None, scheduler: Optional[LLMScheduler] = None,
+                 stream_hub: Optional[LLMStreamHub] = None, fallback_providers: Optional[List[dict]] = None):
         """
         初始化AI分析服务
         
@@ -27,18 +50,103 @@ class AIAnalyzer:
             custom_api_key: 自定义API密钥
             custom_api_model: 自定义API模型
             custom_api_timeout: 自定义API超时时间
+            analysis_cache: AI分析结果缓存，为空时不缓存
+            scheduler: AI请求调度器，默认使用进程内共享的调度器
+            stream_hub: 进行中AI请求的共享中心，默认使用进程内共享的实例
+            fallback_providers: 按优先级排列的备用服务商配置 [{"url", "key", "model", "timeout"}]，
+                为空时读取AI_FALLBACK_PROVIDERS
         """
-        # 加载环境变量
-        load_dotenv()
-        
         # 设置API配置
         self.API_URL = custom_api_url or os.getenv('API_URL')
         self.API_KEY = custom_api_key or os.getenv('API_KEY')
         self.API_MODEL = custom_api_model or os.getenv('API_MODEL', 'gpt-3.5-turbo')
         self.API_TIMEOUT = int(custom_api_timeout or os.getenv('API_TIMEOUT', 60))
         
+        self.analysis_cache = analysis_cache
+        self.prompt_encoder = PromptEncoder()
+        
+        # 请求调度器按服务商限流，并在用户之间公平分配；user为发起请求的用户标识
+        self.scheduler = scheduler if scheduler is not None else llm_scheduler
+        self.user = ''
+        
+        # 相同的AI请求同时只发起一次，其余请求订阅其输出
+        self.stream_hub = stream_hub if stream_hub is not None else llm_stream_hub
+        
+        # 并发AI分析的上限，可按上游服务分别配置
+        self.max_concurrency = LLMScheduler.concurrency_limit(self.API_URL)
+        
+        # 批量扫描时每次请求合并分析的股票数，为1时逐只分析
+        self.batch_size = max(1, int(os.getenv('AI_BATCH_SIZE', 5)))
+        
+        # 备用服务商：首个内容片段超过对冲等待时间仍未到达时向下一个服务商发起对冲请求；
+        # 等待时间取当前服务商首个内容片段延迟的分位数，样本不足时使用AI_HEDGE_DELAY
+        self.fallback_providers = fallback_providers if fallback_providers is not None else self._load_fallback_providers()
+        self.hedge_quantile = float(os.getenv('AI_HEDGE_QUANTILE', 0.95))
+        self.hedge_delay = float(os.getenv('AI_HEDGE_DELAY', 10))
+        
         logger.debug(f"初始化AIAnalyzer: API_URL={self.API_URL}, API_MODEL={self.API_MODEL}, API_KEY={'已提供' if self.API_KEY else '未提供'}, API_TIMEOUT={self.API_TIMEOUT}")
     
+    def with_config(self, custom_api_url=None, custom_api_key=None, custom_api_model=None, custom_api_timeout=None,
+                    user=None) -> 'AIAnalyzer':
+        """
+        基于当前实例生成使用自定义API配置的轻量副本
+        
+        未提供的配置沿用当前实例的配置，不重新读取环境变量
+        
+        Args:
+            custom_api_url: 自定义API URL
+            custom_api_key: 自定义API密钥
+            custom_api_model: 自定义API模型
+            custom_api_timeout: 自定义API超时时间
+            user: 发起请求的用户标识，用于请求调度的公平分配
+            
+        Returns:
+            AI分析服务实例，没有自定义配置时返回当前实例；自定义了API时不再使用备用服务商
+        """
+        if not any([custom_api_url, custom_api_key, custom_api_model, custom_api_timeout, user]):
+            return self
+        
+        analyzer = copy.copy(self)
+        analyzer.user = user or self.user
+        analyzer.API_URL = custom_api_url or self.API_URL
+        analyzer.API_KEY = custom_api_key or self.API_KEY
+        analyzer.API_MODEL = custom_api_model or self.API_MODEL
+        analyzer.API_TIMEOUT = int(custom_api_timeout or self.API_TIMEOUT)
+        if analyzer.API_URL != self.API_URL:
+            analyzer.max_concurrency = LLMScheduler.concurrency_limit(analyzer.API_URL)
+        if any([custom_api_url, custom_api_key, custom_api_model]):
+            analyzer.fallback_providers = []
+        return analyzer
+    
+    @property
+    def api_key_hash(self) -> str:
+        """实际使用的API密钥的哈希，用于区分共享上游请求的键，不暴露密钥本身"""
+        return hashlib.sha256((self.API_KEY or '').encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _load_fallback_providers() -> List[dict]:
+        """
+        读取AI_FALLBACK_PROVIDERS中的备用服务商配置
+        
+        格式为JSON数组，如 [{"url": "https://api.deepseek.com", "key": "sk-...", "model": "deepseek-chat", "timeout": 60}]
+        
+        Returns:
+            备用服务商配置列表，未配置或格式无效时为空列表
+        """
+        value = os.getenv('AI_FALLBACK_PROVIDERS', '').strip()
+        if not value:
+            return []
+        try:
+            providers = json.loads(value)
+        except json.JSONDecodeError:
+            logger.warning("AI_FALLBACK_PROVIDERS配置无效，应为JSON数组")
+            return []
+        if not isinstance(providers, list) or not all(isinstance(item, dict) and item.get('url') and item.get('model')
+                                                      for item in providers):
+            logger.warning("AI_FALLBACK_PROVIDERS配置无效，每个服务商都需要提供url和model")
+            return []
+        return providers
+    
     async def get_ai_analysis(self, df: pd.DataFrame, stock_code: str, market_type: str = 'A', stream: bool = False) -> AsyncGenerator[str, None]:
         """
         对股票数据进行AI分析
@@ -56,368 +164,853 @@ class AIAnalyzer:
             logger.info(f"开始AI分析 {stock_code}, 流式模式: {stream}")
             
             # 提取关键技术指标
-            latest_data = df.iloc[-1]
+            technical_summary, indicator_fields = self._summarize(df)
             
-            # 计算技术指标
-            rsi = latest_data.get('RSI')
-            price = latest_data.get('Close')
-            price_change = latest_data.get('Change')
+            # AI 分析内容
+            # 在token预算内将近期行情编码为紧凑的CSV表格（只含所需字段，数值取整）
+            overhead = estimate_tokens(self._build_prompt(stock_code, market_type, technical_summary, '', self.prompt_encoder.max_rows))
+            recent_data, rows = self.prompt_encoder.encode_table(df, max_tokens=self.prompt_encoder.token_budget - overhead)
+            prompt = self._build_prompt(stock_code, market_type, technical_summary, recent_data, rows)
+            prompt_stats = self.prompt_encoder.record(prompt, rows)
+            logger.info(f"AI分析提示词: {stock_code}, 交易日数: {rows}, 字符数: {prompt_stats['chars']}, 估算token: {prompt_stats['estimated_tokens']}")
             
-            # 确定MA趋势
-            ma_trend = 'UP' if latest_data.get('MA5', 0) > latest_data.get('MA20', 0) else 'DOWN'
+            # 准备请求地址、请求数据和请求头
+            api_url, request_data, headers = self._build_request(prompt, stream)
             
-            # 确定MACD信号
-            macd = latest_data.get('MACD', 0)
-            macd_signal = latest_data.get('MACD_Signal', 0)
-            macd_signal_type = 'BUY' if macd > macd_signal else 'SELL'
+            # 先发送技术指标数据
+            yield json.dumps({
+                "stock_code": stock_code,
+                "status": "analyzing",
+                **indicator_fields
+            })
             
-            # 确定成交量状态
-            volume_ratio = latest_data.get('Volume_Ratio', 1)
-            volume_status = 'HIGH' if volume_ratio > 1.5 else ('LOW' if volume_ratio < 0.5 else 'NORMAL')
+            # 同一交易日内相同的提示词、模型、API地址和API密钥直接复用已有的分析结果
+            cache_key = None
+            if self.analysis_cache is not None:
+                cache_key = self.analysis_cache.make_key(prompt, self.API_MODEL, api_url, self.api_key_hash)
+                cached_content = await self.analysis_cache.aget(cache_key)
+                if cached_content is not None:
+                    logger.info(f"命中AI分析缓存: {stock_code}, 模型: {self.API_MODEL}")
+                    async for message in self._replay_cached_analysis(cached_content, stock_code, stream, technical_summary, indicator_fields):
+                        yield message
+                    return
             
-            # AI 分析内容
-            # 最近14天的股票数据记录
-            recent_data = df.tail(14).to_dict('records')
-            
-            # 包含trend, volatility, volume_trend, rsi_level的字典
-            technical_summary = {
-                'trend': 'upward' if df.iloc[-1]['MA5'] > df.iloc[-1]['MA20'] else 'downward',
-                'volatility': f"{df.iloc[-1]['Volatility']:.2f}%",
-                'volume_trend': 'increasing' if df.iloc[-1]['Volume_Ratio'] > 1 else 'decreasing',
-                'rsi_level': df.iloc[-1]['RSI']
-            }
-            
-            # 根据市场类型调整分析提示
-            if market_type in ['ETF', 'LOF']:
-                prompt = f"""
-                分析基金 {stock_code}：
-
-                技术指标概要：
-                {technical_summary}
-                
-                近14日交易数据：
-                {recent_data}
-                
-                请提供：
-                1. 净值走势分析（包含支撑位和压力位）
-                2. 成交量分析及其对净值的影响
-                3. 风险评估（包含波动率和折溢价分析）
-                4. 短期和中期净值预测
-                5. 关键价格位分析
-                6. 申购赎回建议（包含止损位）
-                
-                请基于技术指标和市场表现进行分析，给出具体数据支持。
-                """
-            elif market_type == 'US':
-                prompt = f"""
-                分析美股 {stock_code}：
-
-                技术指标概要：
-                {technical_summary}
-                
-                近14日交易数据：
-                {recent_data}
-                
-                请提供：
-                1. 趋势分析（包含支撑位和压力位，美元计价）
-                2. 成交量分析及其含义
-                3. 风险评估（包含波动率和美股市场特有风险）
-                4. 短期和中期目标价位（美元）
-                5. 关键技术位分析
-                6. 具体交易建议（包含止损位）
-                
-                请基于技术指标和美股市场特点进行分析，给出具体数据支持。
-                """
-            elif market_type == 'HK':
-                prompt = f"""
-                分析港股 {stock_code}：
-
-                技术指标概要：
-                {technical_summary}
-                
-                近14日交易数据：
-                {recent_data}
-                
-                请提供：
-                1. 趋势分析（包含支撑位和压力位，港币计价）
-                2. 成交量分析及其含义
-                3. 风险评估（包含波动率和港股市场特有风险）
-                4. 短期和中期目标价位（港币）
-                5. 关键技术位分析
-                6. 具体交易建议（包含止损位）
-                
-                请基于技术指标和港股市场特点进行分析，给出具体数据支持。
-                """
-            else:  # A股
-                prompt = f"""
-                分析A股 {stock_code}：
+            # 相同的提示词、模型和API密钥同时只向上游发起一次请求，其余请求重放已收到的输出并跟随实时输出
+            hub_key = self.stream_hub.make_key(prompt, self.API_MODEL, api_url, stream, self.api_key_hash)
+            async for message in self.stream_hub.subscribe(hub_key, lambda: self._request_with_fallback(
+                    stock_code, market_type, stream, prompt, prompt_stats, api_url, request_data, headers,
+                    technical_summary, indicator_fields, cache_key)):
+                yield message
 
-                技术指标概要：
-                {technical_summary}
-                
-                近14日交易数据：
-                {recent_data}
-                
-                请提供：
-                1. 趋势分析（包含支撑位和压力位）
-                2. 成交量分析及其含义
-                3. 风险评估（包含波动率分析）
-                4. 短期和中期目标价位
-                5. 关键技术位分析
-                6. 具体交易建议（包含止损位）
-                
-                请基于技术指标和A股市场特点进行分析，给出具体数据支持。
-                """
-            
-            # 格式化API URL
-            api_url = APIUtils.format_api_url(self.API_URL)
-            
-            # 准备请求数据
-            request_data = {
-                "model": self.API_MODEL,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7,
-                "stream": stream
-            }
-            
-            # 准备请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.API_KEY}"
-            }
-            
-            # 获取当前日期作为分析日期
-            analysis_date = datetime.now().strftime("%Y-%m-%d")
-            
-            # 异步请求API
-            async with httpx.AsyncClient(timeout=self.API_TIMEOUT) as client:
-                # 记录请求
-                logger.debug(f"发送AI请求: URL={api_url}, MODEL={self.API_MODEL}, STREAM={stream}")
-                
-                # 先发送技术指标数据
+        except Exception as e:
+            logger.error(f"AI分析出错: {str(e)}", exc_info=True)
+            import traceback
+            trace = traceback.format_exc()
+            logger.error(f"错误堆栈:\n{trace}")
+            yield json.dumps({
+                "stock_code": stock_code,
+                "error": f"分析出错: {str(e)}\n堆栈信息: {trace}",
+                "status": "error"
+            })
+            
+    def _request_with_fallback(self, stock_code: str, market_type: str, stream: bool, prompt: str, prompt_stats: dict,
+                               api_url: str, request_data: dict, headers: dict, technical_summary: dict,
+                               indicator_fields: dict, cache_key: Optional[str]) -> AsyncIterator[str]:
+        """
+        向上游请求单只股票的AI分析，配置了备用服务商时使用对冲请求
+        
+        备用服务商只使用自身配置的地址、密钥和模型，结果写入该服务商自己的缓存键，缓存中记录的模型即实际生成结果的模型
+        
+        Args:
+            与_request_analysis相同
+            
+        Returns:
+            异步迭代器，生成分析结果字符串
+        """
+        request = functools.partial(self._request_analysis, stock_code, market_type, stream, prompt, prompt_stats)
+        if not self.fallback_providers:
+            return request(api_url, request_data, headers, technical_summary, indicator_fields, cache_key)
+        
+        attempts = [(self.API_MODEL, api_url, functools.partial(
+            request, api_url, request_data, headers, technical_summary, indicator_fields, cache_key))]
+        for provider in self.fallback_providers:
+            analyzer = self._fallback_analyzer(provider)
+            fallback_url, fallback_data, fallback_headers = analyzer._build_request(prompt, stream)
+            fallback_key = None
+            if cache_key is not None:
+                fallback_key = self.analysis_cache.make_key(prompt, analyzer.API_MODEL, fallback_url, analyzer.api_key_hash)
+            attempts.append((analyzer.API_MODEL, fallback_url, functools.partial(
+                analyzer._request_analysis, stock_code, market_type, stream, prompt, prompt_stats,
+                fallback_url, fallback_data, fallback_headers, technical_summary, indicator_fields, fallback_key)))
+        
+        delays = [self._hedge_delay(model, url) for model, url, _ in attempts]
+        return LLMHedge(attempts, delays).run()
+    
+    def _fallback_analyzer(self, provider: dict) -> 'AIAnalyzer':
+        """
+        生成使用备用服务商配置的副本
+        
+        地址、密钥和模型只取自备用服务商的配置，不沿用当前服务商的配置，避免把当前服务商的密钥发送给其他服务商
+        
+        Args:
+            provider: 备用服务商配置
+            
+        Returns:
+            AI分析服务实例
+        """
+        analyzer = copy.copy(self)
+        analyzer.API_URL = provider['url']
+        analyzer.API_KEY = provider.get('key') or None
+        analyzer.API_MODEL = provider['model']
+        analyzer.API_TIMEOUT = int(provider.get('timeout') or self.API_TIMEOUT)
+        analyzer.max_concurrency = LLMScheduler.concurrency_limit(analyzer.API_URL)
+        analyzer.fallback_providers = []
+        return analyzer
+    
+    def _hedge_delay(self, model: str, api_url: str) -> float:
+        """
+        计算服务商的对冲等待时间
+        
+        包含在调度器中排队的时间，排队过久同样会触发对冲
+        
+        Args:
+            model: 模型名称
+            api_url: API地址
+            
+        Returns:
+            等待时间（秒）
+        """
+        delay = llm_metrics.ttft_quantile(model, api_url, self.hedge_quantile, self.HEDGE_MIN_SAMPLES)
+        return delay if delay is not None else self.hedge_delay
+    
+    async def _request_analysis(self, stock_code: str, market_type: str, stream: bool, prompt: str, prompt_stats: dict,
+                                api_url: str, request_data: dict, headers: dict, technical_summary: dict,
+                                indicator_fields: dict, cache_key: Optional[str]) -> AsyncGenerator[str, None]:
+        """
+        向上游请求单只股票的AI分析
+        
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+            stream: 是否使用流式响应
+            prompt: 提示词
+            prompt_stats: 提示词大小信息
+            api_url: 格式化后的API URL
+            request_data: 请求数据
+            headers: 请求头
+            technical_summary: 技术指标概要
+            indicator_fields: 技术指标数据
+            cache_key: AI分析缓存键，为空时不写入缓存
+            
+        Returns:
+            异步生成器，生成分析结果字符串
+        """
+        collected_messages = []
+        stream_error = False
+        failed = False
+        # 边接收边匹配投资建议，建议一旦出现即推送给前端
+        tracker = RecommendationTracker()
+        
+        async for kind, value in self._send_request([stock_code], api_url, request_data, headers, stream, prompt,
+                                                    prompt_stats['estimated_tokens']):
+            if kind == "status":
+                yield value
+                continue
+            if kind == "content":
+                collected_messages.append(value)
+                if stream:
+                    # 直接发送每个内容片段，不累积
+                    yield json.dumps({
+                        "stock_code": stock_code,
+                        "ai_analysis_chunk": value,
+                        "status": "analyzing"
+                    })
+                if tracker.feed(value) and stream:
+                    yield self._recommendation_message(stock_code, tracker)
+                continue
+            
+            stream_error = True
+            failed = failed or kind == "fatal"
+            yield json.dumps({
+                "stock_code": stock_code,
+                "error": value,
+                "status": "error"
+            })
+        if failed:
+            return
+        
+        # 完整的分析内容
+        full_content = "".join(collected_messages)
+        
+        if stream:
+            logger.info(f"AI流式处理完成，共收到 {len(collected_messages)} 个内容片段，总长度: {len(full_content)}")
+            # 如果内容不为空且不以换行符结束，发送一个换行符
+            if full_content and not full_content.endswith('\n'):
+                logger.debug("发送换行符")
                 yield json.dumps({
                     "stock_code": stock_code,
-                    "status": "analyzing",
-                    "rsi": rsi,
-                    "price": price,
-                    "price_change": price_change,
-                    "ma_trend": ma_trend,
-                    "macd_signal": macd_signal_type,
-                    "volume_status": volume_status,
-                    "analysis_date": analysis_date
+                    "ai_analysis_chunk": "\n",
+                    "status": "analyzing"
                 })
+        
+        # 投资建议和评分关键词已在接收时匹配完成
+        recommendation = self._extract_recommendation(full_content, tracker)
+        score = self._calculate_analysis_score(full_content, technical_summary, tracker)
+        
+        # 完整且无错误的分析结果写入缓存
+        if cache_key is not None and full_content and not stream_error:
+            await self.analysis_cache.aput(cache_key, full_content, stock_code, market_type, self.API_MODEL)
+        
+        # 发送完成状态和评分、建议，非流式响应同时发送完整的分析结果
+        if stream:
+            yield json.dumps({
+                "stock_code": stock_code,
+                "status": "completed",
+                "score": score,
+                "recommendation": recommendation
+            })
+        else:
+            yield json.dumps({
+                "stock_code": stock_code,
+                "status": "completed",
+                "analysis": full_content,
+                "score": score,
+                "recommendation": recommendation,
+                **indicator_fields
+            })
+    
+    async def _send_request(self, stock_codes: List[str], api_url: str, request_data: dict, headers: dict, stream: bool,
+                            prompt: str, estimated_tokens: int) -> AsyncGenerator[Tuple[str, str], None]:
+        """
+        经调度器排队发送AI请求
+        
+        在调度器中排队等待服务商的并发名额和token预算，上游限流时按Retry-After暂停该服务商后重新排队，
+        单只股票和批量分析共用
+        
+        Args:
+            stock_codes: 本次请求分析的股票代码，排队和重试状态推送给这些股票
+            api_url: 格式化后的API URL
+            request_data: 请求数据
+            headers: 请求头
+            stream: 是否使用流式响应
+            prompt: 提示词，用于记录请求指标
+            estimated_tokens: 提示词的估算token数
+            
+        Returns:
+            异步生成器，生成 (类型, 内容) 元组：status为排队或重试的状态消息，content为内容片段，
+            error为流中的错误事件，fatal为无法继续的错误（之后不再生成）
+        """
+        # 异步请求API（复用共享连接池中的长连接）
+        async with http_client_pool.client(api_url) as client, llm_metrics.track(self.API_MODEL, api_url, prompt) as call, \
+            self.scheduler.ticket(api_url, self.user, estimated_tokens) as ticket:
+            while True:
+                # 排队位置推送给前端
+                async for position in ticket.wait():
+                    for message in self._status_messages(stock_codes, queue_position=position):
+                        yield "status", message
+                call.begin()
+                
+                # 记录请求
+                logger.debug(f"发送AI请求: URL={api_url}, MODEL={self.API_MODEL}, STREAM={stream}, 股票数={len(stock_codes)}")
                 
                 if stream:
-                    # 流式响应处理
-                    async with client.stream("POST", api_url, json=request_data, headers=headers) as response:
-                        if response.status_code != 200:
-                            error_text = await response.aread()
-                            error_data = json.loads(error_text)
-                            error_message = error_data.get('error', {}).get('message', '未知错误')
-                            logger.error(f"AI API请求失败: {response.status_code} - {error_message}")
-                            yield json.dumps({
-                                "stock_code": stock_code,
-                                "error": f"API请求失败: {error_message}",
-                                "status": "error"
-                            })
+                    async with client.stream("POST", api_url, json=request_data, headers=headers, timeout=self.API_TIMEOUT) as response:
+                        if response.status_code == 200:
+                            async for event in self._iter_stream_events(response, call):
+                                yield event
                             return
-                            
-                        # 处理流式响应
-                        buffer = ""
-                        collected_messages = []
-                        chunk_count = 0
-                        
-                        async for chunk in response.aiter_text():
-                            if chunk:
-                                # 分割多行响应（处理某些API可能在一个chunk中返回多行）
-                                lines = chunk.strip().split('\n')
-                                for line in lines:
-                                    line = line.strip()
-                                    if not line:
-                                        continue
-                                        
-                                    # 处理以data:开头的行
-                                    if line.startswith("data: "):
-                                        line = line[6:]  # 去除"data: "前缀
-                                     
-                                    if line == "[DONE]":
-                                        logger.debug("收到流结束标记 [DONE]")
-                                        continue
-                                        
-                                    try:
-                                        # 处理特殊错误情况
-                                        if "error" in line.lower():
-                                            error_msg = line
-                                            try:
-                                                error_data = json.loads(line)
-                                                error_msg = error_data.get("error", line)
-                                            except:
-                                                pass
-                                            
-                                            logger.error(f"流式响应中收到错误: {error_msg}")
-                                            yield json.dumps({
-                                                "stock_code": stock_code,
-                                                "error": f"流式响应错误: {error_msg}",
-                                                "status": "error"
-                                            })
-                                            continue
-                                        
-                                        # 尝试解析JSON
-                                        chunk_data = json.loads(line)
-                                        
-                                        # 健壮性处理：choices为空时直接报错并continue
-                                        choices = chunk_data.get("choices", [])
-                                        if not choices:
-                                            # logger.error(f"AI返回choices为空，原始数据: {chunk_data}")
-                                            # yield json.dumps({
-                                            #     "stock_code": stock_code,
-                                            #     "error": "AI返回choices为空，分析失败",
-                                            #     "status": "error"
-                                            # })
-                                            continue
-                                        # 检查是否有finish_reason
-                                        finish_reason = choices[0].get("finish_reason")
-                                        if finish_reason == "stop":
-                                            logger.debug("收到finish_reason=stop，流结束")
-                                            continue
-                                        
-                                        # 获取delta内容
-                                        delta = choices[0].get("delta", {})
-                                        
-                                        # 检查delta是否为空对象
-                                        if not delta or delta == {}:
-                                            logger.debug("收到空的delta对象，跳过")
-                                            continue
-                                        
-                                        content = delta.get("content", "")
-                                        
-                                        if content:
-                                            chunk_count += 1
-                                            buffer += content
-                                            collected_messages.append(content)
-                                            
-                                            # 直接发送每个内容片段，不累积
-                                            yield json.dumps({
-                                                "stock_code": stock_code,
-                                                "ai_analysis_chunk": content,
-                                                "status": "analyzing"
-                                            })
-                                    except json.JSONDecodeError:
-                                        # 记录解析错误并尝试恢复
-                                        # logger.error(f"JSON解析错误，块内容: {line}")
-                                        
-                                        # 如果是特定错误模式，处理它
-                                        if "streaming failed after retries" in line.lower():
-                                            logger.error("检测到流式传输失败")
-                                            yield json.dumps({
-                                                "stock_code": stock_code,
-                                                "error": "流式传输失败，请稍后重试",
-                                                "status": "error"
-                                            })
-                                            return
-                                        continue
-                        
-                        logger.info(f"AI流式处理完成，共收到 {chunk_count} 个内容片段，总长度: {len(buffer)}")
-                        
-                        # 如果buffer不为空且不以换行符结束，发送一个换行符
-                        if buffer and not buffer.endswith('\n'):
-                            logger.debug("发送换行符")
-                            yield json.dumps({
-                                "stock_code": stock_code,
-                                "ai_analysis_chunk": "\n",
-                                "status": "analyzing"
-                            })
-                        
-                        # 完整的分析内容
-                        full_content = buffer
-                        
-                        # 尝试从分析内容中提取投资建议
-                        recommendation = self._extract_recommendation(full_content)
-                        
-                        # 计算分析评分
-                        score = self._calculate_analysis_score(full_content, technical_summary)
-                        
-                        # 发送完成状态和评分、建议
-                        yield json.dumps({
-                            "stock_code": stock_code,
-                            "status": "completed",
-                            "score": score,
-                            "recommendation": recommendation
-                        })
+                        retry = self.scheduler.should_retry(ticket, response.status_code)
+                        if not retry:
+                            error_message = await self._read_api_error(response)
                 else:
-                    # 非流式响应处理
-                    response = await client.post(api_url, json=request_data, headers=headers)
-                    
-                    if response.status_code != 200:
-                        error_data = response.json()
-                        error_message = error_data.get('error', {}).get('message', '未知错误')
-                        logger.error(f"AI API请求失败: {response.status_code} - {error_message}")
-                        yield json.dumps({
-                            "stock_code": stock_code,
-                            "error": f"API请求失败: {error_message}",
-                            "status": "error"
-                        })
+                    response = await client.post(api_url, json=request_data, headers=headers, timeout=self.API_TIMEOUT)
+                    if response.status_code == 200:
+                        response_data = response.json()
+                        analysis_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+                        call.on_chunk(analysis_text)
+                        if analysis_text:
+                            yield "content", analysis_text
                         return
-                    
-                    response_data = response.json()
-                    analysis_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    
-                    # 尝试从分析内容中提取投资建议
-                    recommendation = self._extract_recommendation(analysis_text)
-                    
-                    # 计算分析评分
-                    score = self._calculate_analysis_score(analysis_text, technical_summary)
-                    
-                    # 发送完整的分析结果
-                    yield json.dumps({
+                    retry = self.scheduler.should_retry(ticket, response.status_code)
+                    if not retry:
+                        error_message = await self._read_api_error(response)
+                
+                if retry:
+                    # 上游限流：按Retry-After暂停该服务商后重新排队
+                    delay = await ticket.backoff(parse_retry_after(response.headers.get('Retry-After')))
+                    for message in self._status_messages(stock_codes, retry_after=round(delay, 1)):
+                        yield "status", message
+                    continue
+                
+                call.fail()
+                logger.error(f"AI API请求失败: {response.status_code} - {error_message}")
+                yield "fatal", f"API请求失败: {error_message}"
+                return
+    
+    async def get_batch_ai_analysis(self, stocks: List[Tuple[str, pd.DataFrame]], market_type: str = 'A',
+                                    stream: bool = False) -> AsyncGenerator[str, None]:
+        """
+        在一次请求中对多只股票进行AI分析
+        
+        各股票的紧凑概要合并到同一个提示词中，共用一份分析要求；回复按每只股票的标记行分节，
+        边接收边拆分为各自带有stock_code的消息，消息格式与单只股票的分析相同。
+        回复中缺少的股票退回单独分析
+        
+        Args:
+            stocks: [(股票代码, 包含技术指标的DataFrame)] 列表
+            market_type: 市场类型，默认为'A'股
+            stream: 是否使用流式响应
+            
+        Returns:
+            异步生成器，生成分析结果字符串
+        """
+        stock_codes = [stock_code for stock_code, _ in stocks]
+        try:
+            logger.info(f"开始批量AI分析 {len(stocks)} 只股票: {', '.join(stock_codes)}, 流式模式: {stream}")
+            
+            summaries = {}
+            sections = []
+            # 每只股票的表格预算为单只股票提示词预算的一半，共用的分析要求只出现一次
+            section_budget = self.prompt_encoder.token_budget // 2
+            for stock_code, df in stocks:
+                technical_summary, indicator_fields = self._summarize(df)
+                summaries[stock_code] = (technical_summary, indicator_fields)
+                summary_text = format_summary(technical_summary)
+                recent_data, rows = self.prompt_encoder.encode_table(df, max_tokens=section_budget - estimate_tokens(summary_text))
+                sections.append((stock_code, summary_text, recent_data, rows))
+            
+            prompt = self._build_batch_prompt(market_type, sections)
+            prompt_stats = self.prompt_encoder.record(prompt, min(rows for *_, rows in sections))
+            logger.info(f"批量AI分析提示词: {len(stocks)} 只股票, 字符数: {prompt_stats['chars']}, 估算token: {prompt_stats['estimated_tokens']}")
+            
+            api_url, request_data, headers = self._build_request(prompt, stream)
+            
+            # 先发送各股票的技术指标数据
+            for stock_code in stock_codes:
+                yield json.dumps({
+                    "stock_code": stock_code,
+                    "status": "analyzing",
+                    **summaries[stock_code][1]
+                })
+            
+            demuxer = AnalysisDemuxer(stock_codes)
+            trackers = {stock_code: RecommendationTracker() for stock_code in stock_codes}
+            completed = set()
+            stream_error = False
+            
+            def complete(stock_code: str):
+                """生成单只股票的完成消息"""
+                completed.add(stock_code)
+                content = demuxer.text(stock_code)
+                technical_summary, indicator_fields = summaries[stock_code]
+                tracker = trackers[stock_code]
+                recommendation = self._extract_recommendation(content, tracker)
+                score = self._calculate_analysis_score(content, technical_summary, tracker)
+                if not stream:
+                    return [json.dumps({
                         "stock_code": stock_code,
                         "status": "completed",
-                        "analysis": analysis_text,
+                        "analysis": content,
                         "score": score,
                         "recommendation": recommendation,
-                        "rsi": rsi,
-                        "price": price,
-                        "price_change": price_change,
-                        "ma_trend": ma_trend,
-                        "macd_signal": macd_signal_type,
-                        "volume_status": volume_status,
-                        "analysis_date": analysis_date
-                    })
+                        **indicator_fields
+                    })]
+                
+                messages = []
+                if not content.endswith('\n'):
+                    messages.append(json.dumps({"stock_code": stock_code, "ai_analysis_chunk": "\n", "status": "analyzing"}))
+                messages.append(json.dumps({
+                    "stock_code": stock_code,
+                    "status": "completed",
+                    "score": score,
+                    "recommendation": recommendation
+                }))
+                return messages
+            
+            def dispatch(pieces):
+                """输出拆分后的内容片段，切换到下一只股票时上一只股票即分析完成"""
+                messages = []
+                for stock_code, text in pieces:
+                    if stock_code in completed:
+                        continue
+                    for previous in stock_codes:
+                        if previous != stock_code and previous in demuxer.sections and previous not in completed:
+                            messages.extend(complete(previous))
+                    if stream:
+                        messages.append(json.dumps({"stock_code": stock_code, "ai_analysis_chunk": text, "status": "analyzing"}))
+                    if trackers[stock_code].feed(text) and stream:
+                        messages.append(self._recommendation_message(stock_code, trackers[stock_code]))
+                return messages
+            
+            # 同一交易日内相同的批量提示词直接复用已有的分析结果
+            cache_key = None
+            cached_content = None
+            if self.analysis_cache is not None:
+                cache_key = self.analysis_cache.make_key(prompt, self.API_MODEL, api_url, self.api_key_hash)
+                cached_content = await self.analysis_cache.aget(cache_key)
+            
+            if cached_content is not None:
+                logger.info(f"命中批量AI分析缓存: {', '.join(stock_codes)}, 模型: {self.API_MODEL}")
+                for start in range(0, len(cached_content), self.CACHE_REPLAY_CHUNK_SIZE):
+                    for message in dispatch(demuxer.feed(cached_content[start:start + self.CACHE_REPLAY_CHUNK_SIZE])):
+                        yield message
+                    # 让出事件循环，避免长内容阻塞其他请求
+                    await asyncio.sleep(0)
+            else:
+                collected_messages = []
+                failed = False
+                async for kind, value in self._send_request(stock_codes, api_url, request_data, headers, stream, prompt,
+                                                            prompt_stats['estimated_tokens']):
+                    if kind == "status":
+                        yield value
+                        continue
+                    if kind == "content":
+                        collected_messages.append(value)
+                        for message in dispatch(demuxer.feed(value)):
+                            yield message
+                        continue
                     
+                    # 错误无法归属到单只股票，发送给所有尚未完成的股票
+                    stream_error = True
+                    failed = failed or kind == "fatal"
+                    for stock_code in stock_codes:
+                        if stock_code not in completed:
+                            yield json.dumps({"stock_code": stock_code, "error": value, "status": "error"})
+                if failed:
+                    return
+
+            for message in dispatch(demuxer.flush()):
+                yield message
+            for stock_code in stock_codes:
+                if stock_code in demuxer.sections and stock_code not in completed:
+                    for message in complete(stock_code):
+                        yield message
+            
+            missing = demuxer.missing
+            full_content = "".join(collected_messages) if cached_content is None else ""
+            if cache_key is not None and full_content and not stream_error and not missing:
+                await self.analysis_cache.aput(cache_key, full_content, ','.join(stock_codes), market_type, self.API_MODEL)
+            
+            # 回复中缺少的股票退回单独分析
+            if missing:
+                logger.warning(f"批量AI分析结果中缺少 {len(missing)} 只股票，改为单独分析: {', '.join(missing)}")
+                frames = dict(stocks)
+                for stock_code in missing:
+                    async for message in self.get_ai_analysis(frames[stock_code], stock_code, market_type, stream):
+                        yield message
+            
         except Exception as e:
-            logger.error(f"AI分析出错: {str(e)}", exc_info=True)
-            import traceback
-            trace = traceback.format_exc()
-            logger.error(f"错误堆栈:\n{trace}")
+            logger.error(f"批量AI分析出错: {str(e)}", exc_info=True)
+            for stock_code in stock_codes:
+                yield json.dumps({
+                    "stock_code": stock_code,
+                    "error": f"分析出错: {str(e)}",
+                    "status": "error"
+                })
+    
+    def _build_prompt(self, stock_code: str, market_type: str, technical_summary: dict, recent_data: str, rows: int) -> str:
+        """
+        根据市场类型生成分析提示词
+        
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+            technical_summary: 技术指标概要
+            recent_data: 编码后的近期交易数据
+            rows: 交易数据的天数
+            
+        Returns:
+            提示词文本
+        """
+        # 根据市场类型调整分析提示
+        if market_type in ['ETF', 'LOF']:
+            prompt = f"""
+            分析基金 {stock_code}：
+
+            技术指标概要：
+            {format_summary(technical_summary)}
+            
+            近{rows}日交易数据（CSV）：
+            {recent_data}
+            
+            请提供：
+            1. 净值走势分析（包含支撑位和压力位）
+            2. 成交量分析及其对净值的影响
+            3. 风险评估（包含波动率和折溢价分析）
+            4. 短期和中期净值预测
+            5. 关键价格位分析
+            6. 申购赎回建议（包含止损位）
+            
+            请基于技术指标和市场表现进行分析，给出具体数据支持。
+            """
+        elif market_type == 'US':
+            prompt = f"""
+            分析美股 {stock_code}：
+
+            技术指标概要：
+            {format_summary(technical_summary)}
+            
+            近{rows}日交易数据（CSV）：
+            {recent_data}
+            
+            请提供：
+            1. 趋势分析（包含支撑位和压力位，美元计价）
+            2. 成交量分析及其含义
+            3. 风险评估（包含波动率和美股市场特有风险）
+            4. 短期和中期目标价位（美元）
+            5. 关键技术位分析
+            6. 具体交易建议（包含止损位）
+            
+            请基于技术指标和美股市场特点进行分析，给出具体数据支持。
+            """
+        elif market_type == 'HK':
+            prompt = f"""
+            分析港股 {stock_code}：
+
+            技术指标概要：
+            {format_summary(technical_summary)}
+            
+            近{rows}日交易数据（CSV）：
+            {recent_data}
+            
+            请提供：
+            1. 趋势分析（包含支撑位和压力位，港币计价）
+            2. 成交量分析及其含义
+            3. 风险评估（包含波动率和港股市场特有风险）
+            4. 短期和中期目标价位（港币）
+            5. 关键技术位分析
+            6. 具体交易建议（包含止损位）
+            
+            请基于技术指标和港股市场特点进行分析，给出具体数据支持。
+            """
+        else:  # A股
+            prompt = f"""
+            分析A股 {stock_code}：
+
+            技术指标概要：
+            {format_summary(technical_summary)}
+            
+            近{rows}日交易数据（CSV）：
+            {recent_data}
+            
+            请提供：
+            1. 趋势分析（包含支撑位和压力位）
+            2. 成交量分析及其含义
+            3. 风险评估（包含波动率分析）
+            4. 短期和中期目标价位
+            5. 关键技术位分析
+            6. 具体交易建议（包含止损位）
+            
+            请基于技术指标和A股市场特点进行分析，给出具体数据支持。
+            """
+        
+        # 去除模板每行的缩进，减少无意义的token
+        return '\n'.join(line.strip() for line in prompt.strip().splitlines())
+    
+    def _summarize(self, df: pd.DataFrame) -> Tuple[dict, dict]:
+        """
+        提取最新交易日的技术指标
+        
+        Args:
+            df: 包含技术指标的DataFrame
+            
+        Returns:
+            (技术指标概要, 发送给前端的技术指标数据)
+        """
+        latest_data = df.iloc[-1]
+        
+        # 计算技术指标
+        rsi = latest_data.get('RSI')
+        price = latest_data.get('Close')
+        price_change = latest_data.get('Change')
+        
+        # 确定MA趋势
+        ma_trend = 'UP' if latest_data.get('MA5', 0) > latest_data.get('MA20', 0) else 'DOWN'
+        
+        # 确定MACD信号
+        macd = latest_data.get('MACD', 0)
+        macd_signal = latest_data.get('Signal', 0)
+        macd_signal_type = 'BUY' if macd > macd_signal else 'SELL'
+        
+        # 确定成交量状态
+        volume_ratio = latest_data.get('Volume_Ratio', 1)
+        volume_status = 'HIGH' if volume_ratio > 1.5 else ('LOW' if volume_ratio < 0.5 else 'NORMAL')
+        
+        # 包含trend, volatility, volume_trend, rsi_level的字典
+        technical_summary = {
+            'trend': 'upward' if latest_data['MA5'] > latest_data['MA20'] else 'downward',
+            'volatility': f"{latest_data['Volatility']:.2f}%",
+            'volume_trend': 'increasing' if latest_data['Volume_Ratio'] > 1 else 'decreasing',
+            'rsi_level': latest_data['RSI']
+        }
+        
+        # 技术指标数据
+        indicator_fields = {
+            "rsi": rsi,
+            "price": price,
+            "price_change": price_change,
+            "ma_trend": ma_trend,
+            "macd_signal": macd_signal_type,
+            "volume_status": volume_status,
+            "analysis_date": datetime.now().strftime("%Y-%m-%d")
+        }
+        return technical_summary, indicator_fields
+    
+    @staticmethod
+    def _status_messages(stock_codes: List[str], **fields) -> List[str]:
+        """
+        生成排队或限流重试的状态消息
+        
+        状态沿用analyzing，前端无需识别新的状态即可继续渲染
+        
+        Args:
+            stock_codes: 股票代码列表
+            fields: queue_position（排队位置）或retry_after（重试等待秒数）
+            
+        Returns:
+            每只股票一条的JSON消息列表
+        """
+        return [json.dumps({"stock_code": stock_code, "status": "analyzing", **fields}) for stock_code in stock_codes]
+    
+    @classmethod
+    def _recommendation_message(cls, stock_code: str, tracker: RecommendationTracker) -> str:
+        """
+        生成分析过程中的投资建议消息
+        
+        Args:
+            stock_code: 股票代码
+            tracker: 投资建议跟踪器
+            
+        Returns:
+            JSON消息，recommendation_final表示建议是否已不会再变化，完成消息中的建议为最终结果
+        """
+        return cls._status_messages([stock_code], recommendation=tracker.recommendation,
+                                    recommendation_final=tracker.final)[0]
+    
+    def _build_request(self, prompt: str, stream: bool) -> Tuple[str, dict, dict]:
+        """
+        准备AI请求
+        
+        Args:
+            prompt: 提示词
+            stream: 是否使用流式响应
+            
+        Returns:
+            (API URL, 请求数据, 请求头)
+        """
+        api_url = APIUtils.format_api_url(self.API_URL)
+        request_data = {
+            "model": self.API_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.7,
+            "stream": stream
+        }
+        headers = {"Content-Type": "application/json"}
+        # 没有配置密钥的服务商（如本地部署的模型）不发送认证头
+        if self.API_KEY:
+            headers["Authorization"] = f"Bearer {self.API_KEY}"
+        return api_url, request_data, headers
+    
+    async def _iter_stream_events(self, response, call: LLMCall) -> AsyncGenerator[Tuple[str, str], None]:
+        """
+        解析流式响应
+        
+        按字节增量解码SSE事件，跨网络数据块的行不会被截断
+        
+        Args:
+            response: httpx流式响应
+            call: 本次请求的计时器，记录内容片段的到达时间
+            
+        Returns:
+            异步生成器，生成 (类型, 内容) 元组：content为内容片段，error为流中的错误事件，
+            fatal为无法继续的错误（之后不再生成）
+        """
+        async for data in iter_sse_data(response.aiter_bytes()):
+            if data == "[DONE]":
+                logger.debug("收到流结束标记 [DONE]")
+                continue
+            
+            try:
+                chunk_data = sse_loads(data)
+            except ValueError:
+                # 如果是特定错误模式，处理它
+                if "streaming failed after retries" in data.lower():
+                    logger.error("检测到流式传输失败")
+                    call.fail()
+                    yield "fatal", "流式传输失败，请稍后重试"
+                    return
+                logger.debug(f"无法解析的流式数据: {data[:200]}")
+                continue
+            
+            if not isinstance(chunk_data, dict):
+                continue
+            
+            # 处理流式响应中的错误事件
+            if chunk_data.get("error"):
+                error_msg = chunk_data["error"]
+                logger.error(f"流式响应中收到错误: {error_msg}")
+                call.fail()
+                yield "error", f"流式响应错误: {error_msg}"
+                continue
+            
+            # 健壮性处理：choices为空时直接跳过
+            choices = chunk_data.get("choices") or []
+            if not choices:
+                continue
+            # 检查是否有finish_reason
+            if choices[0].get("finish_reason") == "stop":
+                logger.debug("收到finish_reason=stop，流结束")
+                continue
+            
+            # 获取delta内容，检查delta是否为空对象
+            delta = choices[0].get("delta") or {}
+            content = delta.get("content")
+            if content:
+                call.on_chunk(content)
+                yield "content", content
+    
+    @staticmethod
+    async def _read_api_error(response) -> str:
+        """读取API错误响应中的错误信息"""
+        error_text = await response.aread()
+        try:
+            error_data = json.loads(error_text)
+            error = error_data.get('error', {}) if isinstance(error_data, dict) else {}
+            return (error.get('message') if isinstance(error, dict) else str(error)) or '未知错误'
+        except ValueError:
+            return error_text.decode('utf-8', errors='replace')[:200] or '未知错误'
+    
+    def _build_batch_prompt(self, market_type: str, sections: List[Tuple[str, str, str, int]]) -> str:
+        """
+        生成批量分析提示词
+        
+        Args:
+            market_type: 市场类型
+            sections: [(股票代码, 技术指标概要文本, 编码后的近期交易数据, 交易数据的天数)] 列表
+            
+        Returns:
+            提示词文本
+        """
+        if market_type in ['ETF', 'LOF']:
+            subject = '基金'
+            items = [
+                "净值走势分析（包含支撑位和压力位）",
+                "成交量分析及其对净值的影响",
+                "风险评估（包含波动率和折溢价分析）",
+                "短期和中期净值预测",
+            ]
+        else:
+            subject, currency = {'US': ('美股', '，美元计价'), 'HK': ('港股', '，港币计价')}.get(market_type, ('A股', ''))
+            items = [
+                f"趋势分析（包含支撑位和压力位{currency}）",
+                "成交量分析及其含义",
+                "风险评估（包含波动率分析）",
+                "短期和中期目标价位",
+            ]
+        
+        lines = [
+            f"分别分析以下{len(sections)}只{subject}。",
+            "每只的分析必须以单独一行的标记开头，标记行只包含代码，格式为：=== 代码 ===，按给出的顺序依次输出。",
+            "每只请简要提供：",
+        ]
+        lines += [f"{i}. {item}" for i, item in enumerate(items, 1)]
+        lines += [
+            f"{len(items) + 1}. 以“## 投资建议”小节给出明确的买入、持有或卖出建议（包含止损位）",
+            "请基于技术指标和市场特点进行分析，给出具体数据支持。",
+        ]
+        for stock_code, summary_text, recent_data, rows in sections:
+            lines += [
+                "",
+                f"=== {stock_code} ===",
+                f"技术指标概要：{summary_text}",
+                f"近{rows}日交易数据（CSV）：",
+                recent_data,
+            ]
+        return '\n'.join(lines)
+    
+    async def _replay_cached_analysis(self, content: str, stock_code: str, stream: bool, technical_summary: dict,
+                                      indicator_fields: dict) -> AsyncGenerator[str, None]:
+        """
+        以与实时分析相同的消息格式输出缓存的分析结果
+        
+        Args:
+            content: 缓存的分析内容
+            stock_code: 股票代码
+            stream: 是否使用流式响应
+            technical_summary: 技术指标概要
+            indicator_fields: 技术指标数据
+            
+        Returns:
+            异步生成器，生成分析结果字符串
+        """
+        if not stream:
+            tracker = RecommendationTracker.scan(content)
             yield json.dumps({
                 "stock_code": stock_code,
-                "error": f"分析出错: {str(e)}\n堆栈信息: {trace}",
-                "status": "error"
+                "status": "completed",
+                "analysis": content,
+                "score": self._calculate_analysis_score(content, technical_summary, tracker),
+                "recommendation": self._extract_recommendation(content, tracker),
+                **indicator_fields
             })
+            return
+        
+        tracker = RecommendationTracker()
+        # 按固定长度分块输出，前端按流式结果渲染
+        for start in range(0, len(content), self.CACHE_REPLAY_CHUNK_SIZE):
+            chunk = content[start:start + self.CACHE_REPLAY_CHUNK_SIZE]
+            yield json.dumps({
+                "stock_code": stock_code,
+                "ai_analysis_chunk": chunk,
+                "status": "analyzing"
+            })
+            if tracker.feed(chunk):
+                yield self._recommendation_message(stock_code, tracker)
+            # 让出事件循环，避免长内容阻塞其他请求
+            await asyncio.sleep(0)
+        
+        if not content.endswith('\n'):
+            yield json.dumps({
+                "stock_code": stock_code,
+                "ai_analysis_chunk": "\n",
+                "status": "analyzing"
+            })
+        
+        yield json.dumps({
+            "stock_code": stock_code,
+            "status": "completed",
+            "score": self._calculate_analysis_score(content, technical_summary, tracker),
+            "recommendation": self._extract_recommendation(content, tracker)
+        })
+    
+    def _extract_recommendation(self, analysis_text: str, tracker: Optional[RecommendationTracker] = None) -> str:
+        """
+        从分析文本中提取投资建议
+        
+        Args:
+            analysis_text: 分析内容
+            tracker: 流式接收时已输入全部内容的跟踪器，为空时扫描分析内容
             
-    def _extract_recommendation(self, analysis_text: str) -> str:
-        """从分析文本中提取投资建议"""
-        # 查找投资建议部分
-        investment_advice_pattern = r"##\s*投资建议\s*\n(.*?)(?:\n##|\Z)"
-        match = re.search(investment_advice_pattern, analysis_text, re.DOTALL)
-        
-        if match:
-            advice_text = match.group(1).strip()
-            
-            # 提取关键建议
-            if "买入" in advice_text or "增持" in advice_text:
-                return "买入"
-            elif "卖出" in advice_text or "减持" in advice_text:
-                return "卖出"
-            elif "持有" in advice_text:
-                return "持有"
-            else:
-                return "观望"
+        Returns:
+            “## 投资建议”小节中的建议（买入、卖出、持有），没有该小节或关键词时为观望
+        """
+        if tracker is None:
+            tracker = RecommendationTracker.scan(analysis_text)
+        return tracker.recommendation
         
-        return "观望"  # 默认建议
+    def _calculate_analysis_score(self, analysis_text: str, technical_summary: dict,
+                                  tracker: Optional[RecommendationTracker] = None) -> int:
+        """
+        计算分析评分
         
-    def _calculate_analysis_score(self, analysis_text: str, technical_summary: dict) -> int:
-        """计算分析评分"""
+        Args:
+            analysis_text: 分析内容
+            technical_summary: 技术指标概要
+            tracker: 流式接收时已输入全部内容的跟踪器，为空时扫描分析内容
+            
+        Returns:
+            0-100的评分
+        """
         score = 50  # 基础分数
         
         # 根据技术指标调整分数
@@ -438,14 +1031,9 @@ class AIAnalyzer:
             score -= 15
             
         # 根据分析文本中的关键词调整分数
-        if "强烈买入" in analysis_text or "显著上涨" in analysis_text:
-            score += 20
-        elif "买入" in analysis_text or "看涨" in analysis_text:
-            score += 10
-        elif "强烈卖出" in analysis_text or "显著下跌" in analysis_text:
-            score -= 20
-        elif "卖出" in analysis_text or "看跌" in analysis_text:
-            score -= 10
+        if tracker is None:
+            tracker = RecommendationTracker.scan(analysis_text)
+        score += tracker.keyword_score
             
         # 确保分数在0-100范围内
         return max(0, min(100, score))
@@ -0,0 +1,151 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+class AnalysisDemuxer:
+    """
+    批量AI分析结果的流式拆分器
+
+    批量分析的回复中，每只股票的分析以单独一行的标记（如 "=== 600000 ==="）开头。
+    拆分器增量接收回复文本，识别标记行并把后续内容归属到对应的股票；
+    行首可能构成标记的文本会暂存到行结束再判断，其余文本立即输出，不等待整行
+    """
+
+    # 标记行中允许出现在代码前后的修饰字符（模型常会加上Markdown标题、加粗或括号）
+    DECORATION = ' \t#*=-_[]【】:：'
+
+    # 无法归属到任何股票的前言文本，最多保留的字符数（仅用于日志）
+    MAX_PREAMBLE = 200
+
+    def __init__(self, stock_codes: Sequence[str]):
+        """
+        初始化拆分器
+
+        Args:
+            stock_codes: 批量分析的股票代码列表
+        """
+        self.stock_codes = list(stock_codes)
+        self._codes = {code.upper(): code for code in self.stock_codes}
+        self._marker = re.compile(
+            r'^[{deco}]*({codes})[{deco}]*$'.format(
+                deco=re.escape(self.DECORATION),
+                codes='|'.join(re.escape(code) for code in sorted(self._codes, key=len, reverse=True))
+            ),
+            re.IGNORECASE
+        )
+
+        self.sections: Dict[str, List[str]] = {}
+        self.current: Optional[str] = None
+        self.preamble = ''
+        self._pending = ''
+        self._at_line_start = True
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """
+        输入一段回复文本
+
+        Args:
+            text: 回复文本片段
+
+        Returns:
+            [(股票代码, 文本)] 列表，按输入顺序排列，相邻的同一股票文本已合并
+        """
+        output: List[Tuple[str, str]] = []
+        while text:
+            if not self._at_line_start:
+                # 行中的文本直接输出到行尾
+                newline = text.find('\n')
+                if newline < 0:
+                    self._emit(output, text)
+                    break
+                self._emit(output, text[:newline + 1])
+                text = text[newline + 1:]
+                self._at_line_start = True
+                continue
+
+            line = self._pending + text
+            newline = line.find('\n')
+            if newline < 0:
+                if self._could_be_marker(line):
+                    # 可能是标记行，等待行结束
+                    self._pending = line
+                else:
+                    self._pending = ''
+                    self._at_line_start = False
+                    self._emit(output, line)
+                break
+
+            self._pending = ''
+            text = line[newline + 1:]
+            self._process_line(line[:newline + 1], output)
+        return output
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """
+        结束输入，输出暂存的文本
+
+        Returns:
+            [(股票代码, 文本)] 列表
+        """
+        output: List[Tuple[str, str]] = []
+        if self._pending:
+            self._process_line(self._pending, output)
+            self._pending = ''
+        if self.preamble.strip():
+            logger.debug(f"批量分析结果中无法归属的前言: {self.preamble[:self.MAX_PREAMBLE]!r}")
+        return output
+
+    def text(self, stock_code: str) -> Optional[str]:
+        """
+        获取股票已收到的完整分析内容
+
+        Args:
+            stock_code: 股票代码
+
+        Returns:
+            分析内容，回复中没有该股票的标记时返回None
+        """
+        if stock_code not in self.sections:
+            return None
+        return ''.join(self.sections[stock_code]).strip('\n') + '\n'
+
+    @property
+    def missing(self) -> List[str]:
+        """回复中没有出现标记的股票代码"""
+        return [code for code in self.stock_codes if code not in self.sections]
+
+    def _process_line(self, line: str, output: List[Tuple[str, str]]) -> None:
+        """处理以行首开始的完整行"""
+        match = self._marker.match(line.strip())
+        if match:
+            self.current = self._codes[match.group(1).upper()]
+            self.sections.setdefault(self.current, [])
+        else:
+            self._emit(output, line)
+
+    def _could_be_marker(self, partial: str) -> bool:
+        """判断不完整的行是否可能是标记行"""
+        body = partial.lstrip(self.DECORATION).upper()
+        if not body:
+            return True
+        for code in self._codes:
+            if code.startswith(body):
+                return True
+            if body.startswith(code) and not body[len(code):].strip(self.DECORATION):
+                return True
+        return False
+
+    def _emit(self, output: List[Tuple[str, str]], text: str) -> None:
+        if self.current is None:
+            if len(self.preamble) < self.MAX_PREAMBLE:
+                self.preamble += text
+            return
+
+        self.sections[self.current].append(text)
+        if output and output[-1][0] == self.current:
+            output[-1] = (self.current, output[-1][1] + text)
+        else:
+            output.append((self.current, text))
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+from utils.logger import get_logger
+from utils.trading_calendar import is_session_open, next_session_open
+
+# 获取日志器
+logger = get_logger()
+
+class AnalysisResultCache:
+    """
+    基本分析结果缓存
+
+    基本分析结果（评分、均线趋势、MACD信号、成交量状态、价格）完全由股票代码和最新一根K线决定，
+    按(股票代码, 市场, 参数)缓存结果和指标数据，并记录最新K线日期：
+    收盘后的结果一直有效到下一次开盘（新K线出现）为止；交易时段内最新K线仍在变化，只短暂缓存
+    """
+
+    def __init__(self, max_entries: int = 1024, intraday_ttl: float = 60):
+        """
+        初始化基本分析结果缓存
+
+        Args:
+            max_entries: 最大缓存条目数，超出后淘汰最久未使用的条目
+            intraday_ttl: 交易时段内的缓存时间（秒）
+        """
+        self.max_entries = max_entries
+        self.intraday_ttl = intraday_ttl
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        logger.debug(f"初始化AnalysisResultCache，最大条目数: {max_entries}，盘中缓存时间: {intraday_ttl}秒")
+
+    @staticmethod
+    def params_key(*params: Any) -> str:
+        """
+        根据影响分析结果的参数（指标参数、评分规则等）生成参数键
+
+        Args:
+            params: 任意可JSON序列化的参数
+
+        Returns:
+            参数键
+        """
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+    def get(self, stock_code: str, market_type: str, params_key: str = '') -> Optional[Dict[str, Any]]:
+        """
+        获取缓存的分析结果
+
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+            params_key: 参数键
+
+        Returns:
+            缓存条目（包含basic_result、df、last_bar_date），未命中或已过期时返回None
+        """
+        key = (stock_code, market_type, params_key)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if time.time() >= entry['expires_at']:
+            # 新K线已出现（或盘中缓存到期），结果失效
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, stock_code: str, market_type: str, params_key: str, basic_result: Dict[str, Any],
+            df: Any = None, now: Optional[datetime] = None) -> None:
+        """
+        缓存分析结果
+
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+            params_key: 参数键
+            basic_result: 基本分析结果
+            df: 包含技术指标的DataFrame，用于后续AI分析
+            now: 参考时间，默认为当前时间
+        """
+        if is_session_open(market_type, now):
+            expires_at = time.time() + self.intraday_ttl
+        else:
+            expires_at = next_session_open(market_type, now).timestamp()
+
+        last_bar_date = None
+        if df is not None and len(df) > 0 and hasattr(df.index[-1], 'strftime'):
+            last_bar_date = df.index[-1].strftime('%Y-%m-%d')
+
+        key = (stock_code, market_type, params_key)
+        self._entries[key] = {
+            "basic_result": basic_result,
+            "df": df,
+            "last_bar_date": last_bar_date,
+            "expires_at": expires_at,
+        }
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
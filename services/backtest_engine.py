@@ -0,0 +1,226 @@
+import argparse
+import json
+import math
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional
+from utils.logger import get_logger
+from services.history_store import HistoryStore
+from services.technical_indicator import TechnicalIndicator
+from services.stock_scorer import StockScorer
+
+# 获取日志器
+logger = get_logger()
+
+class BacktestEngine:
+    """
+    向量化评分回测引擎
+    基于本地行情历史，在所有股票、所有交易日上一次性计算评分面板，
+    并按评分区间统计未来收益、胜率和回撤
+    """
+
+    def __init__(self, history_store: Optional[HistoryStore] = None,
+                 indicator: Optional[TechnicalIndicator] = None,
+                 scorer: Optional[StockScorer] = None):
+        """
+        初始化回测引擎
+
+        Args:
+            history_store: 行情历史存储
+            indicator: 技术指标计算服务
+            scorer: 股票评分服务
+        """
+        self.history_store = history_store or HistoryStore()
+        self.indicator = indicator or TechnicalIndicator()
+        self.scorer = scorer or StockScorer()
+
+        logger.debug("初始化BacktestEngine")
+
+    def compute_score_panel(self, panels: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        计算评分面板
+
+        Args:
+            panels: 行情面板，见HistoryStore.load_panels
+
+        Returns:
+            字典，包含各评分组件面板、'score'总分面板和'valid'（指标已完整计算）掩码面板
+        """
+        indicators = self.indicator.calculate_indicator_panels(panels)
+        engine = self.scorer.engine
+
+        breakdown = engine.evaluate(indicators)
+        template = panels['Close']
+        result = {name: pd.DataFrame(values, index=template.index, columns=template.columns) for name, values in breakdown.items()}
+
+        # 只有评分所需的指标全部有值时，该交易日的评分才与实时评分一致
+        valid = np.ones(template.shape, dtype=bool)
+        for column in engine.required_columns:
+            valid &= indicators[column].notna().to_numpy()
+        result['valid'] = pd.DataFrame(valid, index=template.index, columns=template.columns)
+
+        return result
+
+    def run(self, market_type: str = 'A', stock_codes: Optional[Iterable[str]] = None,
+            horizons: Iterable[int] = (1, 5, 20), min_score: Optional[float] = None,
+            start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行回测
+
+        Args:
+            market_type: 市场类型
+            stock_codes: 股票代码列表，为空时使用该市场的全部本地缓存
+            horizons: 持有期（交易日）列表
+            min_score: 评分阈值，提供时额外统计评分不低于该值的样本
+            start_date: 信号开始日期
+            end_date: 信号结束日期
+
+        Returns:
+            回测结果字典
+        """
+        started = time.perf_counter()
+        horizons = sorted({int(h) for h in horizons if int(h) > 0})
+        if not horizons:
+            raise ValueError("至少需要一个正整数持有期")
+
+        panels = self.history_store.load_panels(market_type, stock_codes)
+        if not panels:
+            raise ValueError(f"没有可用的{market_type}本地行情数据，请先分析或扫描相关股票")
+
+        scores = self.compute_score_panel(panels)
+        close = panels['Close']
+        low = panels['Low']
+        dates = panels['Date']
+
+        # 信号样本掩码：指标完整且在日期范围内
+        mask = scores['valid'].to_numpy() & dates.notna().to_numpy()
+        if start_date:
+            mask &= (dates >= pd.to_datetime(start_date)).to_numpy()
+        if end_date:
+            mask &= (dates <= pd.to_datetime(end_date)).to_numpy()
+
+        score_values = scores['score'].to_numpy()
+        edges = [0.0] + self.scorer.engine.thresholds
+        bucket_index = np.digitize(score_values, edges[1:])
+
+        result = {
+            "market_type": market_type,
+            "rules": self.scorer.engine.name,
+            "symbols": int(close.shape[1]),
+            "observations": int(mask.sum()),
+            "start_date": self._format_date(dates.where(mask).min().min()),
+            "end_date": self._format_date(dates.where(mask).max().max()),
+            "horizons": horizons,
+            "buckets": {},
+            "threshold": None,
+        }
+
+        threshold_stats = {}
+        for horizon in horizons:
+            forward_return = (close.shift(-horizon) / close - 1).to_numpy()
+            # 持有期内的最大不利波动：未来horizon个交易日最低价相对信号日收盘价的跌幅
+            future_low = low.iloc[::-1].rolling(window=horizon).min().iloc[::-1].shift(-1).to_numpy()
+            drawdown = future_low / close.to_numpy() - 1
+
+            sample = mask & ~np.isnan(forward_return) & ~np.isnan(drawdown)
+            frame = pd.DataFrame({
+                'bucket': bucket_index[sample],
+                'score': score_values[sample],
+                'return': forward_return[sample],
+                'drawdown': drawdown[sample],
+            })
+
+            result['buckets'][str(horizon)] = self._bucket_stats(frame, edges)
+            if min_score is not None:
+                threshold_stats[str(horizon)] = {
+                    "selected": self._stats(frame[frame['score'] >= min_score]),
+                    "baseline": self._stats(frame),
+                }
+
+        if min_score is not None:
+            result['threshold'] = {"min_score": min_score, **threshold_stats}
+
+        result['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"{market_type}回测完成，股票数: {result['symbols']}，样本数: {result['observations']}，耗时: {result['elapsed_seconds']}秒")
+        return result
+
+    def _bucket_stats(self, frame: pd.DataFrame, edges: List[float]) -> List[Dict[str, Any]]:
+        """按评分区间汇总统计"""
+        grouped = frame.groupby('bucket')
+        summary = grouped.agg(
+            count=('return', 'size'),
+            mean_return=('return', 'mean'),
+            median_return=('return', 'median'),
+            mean_drawdown=('drawdown', 'mean'),
+            worst_drawdown=('drawdown', 'min'),
+        )
+        hit_rate = (frame['return'] > 0).groupby(frame['bucket']).mean()
+
+        buckets = []
+        for i, lower in enumerate(edges):
+            upper = edges[i + 1] if i + 1 < len(edges) else None
+            row = summary.loc[i] if i in summary.index else None
+            buckets.append({
+                "min_score": lower,
+                "max_score": upper,
+                "recommendation": self.scorer.get_recommendation(lower),
+                "count": int(row['count']) if row is not None else 0,
+                "mean_return": self._round(row['mean_return']) if row is not None else None,
+                "median_return": self._round(row['median_return']) if row is not None else None,
+                "hit_rate": self._round(hit_rate.loc[i]) if row is not None else None,
+                "mean_drawdown": self._round(row['mean_drawdown']) if row is not None else None,
+                "worst_drawdown": self._round(row['worst_drawdown']) if row is not None else None,
+            })
+        return buckets
+
+    def _stats(self, frame: pd.DataFrame) -> Dict[str, Any]:
+        """汇总一组样本的统计指标"""
+        if frame.empty:
+            return {"count": 0, "mean_return": None, "median_return": None, "hit_rate": None,
+                    "mean_drawdown": None, "worst_drawdown": None}
+        return {
+            "count": int(len(frame)),
+            "mean_return": self._round(frame['return'].mean()),
+            "median_return": self._round(frame['return'].median()),
+            "hit_rate": self._round((frame['return'] > 0).mean()),
+            "mean_drawdown": self._round(frame['drawdown'].mean()),
+            "worst_drawdown": self._round(frame['drawdown'].min()),
+        }
+
+    @staticmethod
+    def _round(value: Any, digits: int = 4) -> Optional[float]:
+        """保留小数位，NaN转换为None以便JSON序列化"""
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        return round(float(value), digits)
+
+    @staticmethod
+    def _format_date(value: Any) -> Optional[str]:
+        return None if pd.isna(value) else pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口: python -m services.backtest_engine --market A --horizons 1 5 20 --min-score 80"""
+    parser = argparse.ArgumentParser(description="基于本地行情历史的评分回测")
+    parser.add_argument('--market', default='A', help="市场类型(A/US/HK/ETF/LOF)")
+    parser.add_argument('--codes', nargs='*', help="股票代码，为空时使用全部本地缓存")
+    parser.add_argument('--horizons', nargs='+', type=int, default=[1, 5, 20], help="持有期（交易日）")
+    parser.add_argument('--min-score', type=float, default=None, help="评分阈值")
+    parser.add_argument('--start-date', default=None, help="信号开始日期，如2023-01-01")
+    parser.add_argument('--end-date', default=None, help="信号结束日期")
+    args = parser.parse_args(argv)
+
+    result = BacktestEngine().run(
+        market_type=args.market,
+        stock_codes=args.codes or None,
+        horizons=args.horizons,
+        min_score=args.min_score,
+        start_date=args.start_date,
+        end_date=args.end_date
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,26 +2,77 @@ import asyncio
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from utils.logger import get_logger
-from datetime import datetime, timedelta
+from utils.refresh_cache import RefreshingCache
+from utils.search_index import SearchIndex
+from utils.spot_table import SpotTable
 
 # 获取日志器
 logger = get_logger()
 
+class FundSpotTable(SpotTable):
+    """
+    ETF或LOF行情表及其搜索索引
+
+    折价率和涨跌幅转换为小数；搜索结果中同等匹配程度的基金按上游返回的顺序排列
+    """
+
+    NUMERIC_COLUMNS = ('price', 'price_change', 'volume', 'market_value', 'total_value')
+    PERCENT_COLUMNS = ('price_change_percent', 'discount_rate')
+    DETAIL_COLUMNS = ('name', 'symbol', 'price', 'price_change', 'price_change_percent', 'volume', 'market_value',
+                      'total_value', 'discount_rate')
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        构建行情表
+
+        Args:
+            df: 转换列名后的基金行情DataFrame
+        """
+        super().__init__(df.reset_index(drop=True))
+
+        # 搜索结果只需要这几个字段
+        self.search_records: List[Dict[str, Any]] = [
+            {key: record[key] for key in ('name', 'symbol', 'price', 'volume', 'market_value', 'total_value')}
+            for record in self.records
+        ]
+
+        self.index = SearchIndex([(symbol, name) for symbol, name in zip(self.df['symbol'], self.df['name'])])
+
+
 class FundServiceAsync:
     """
     异步基金服务
     提供基金数据的异步搜索和获取功能
     """
     
+    # 行情缓存有效期（秒），距离过期不足提前刷新时间时在后台刷新；
+    # 过期后在最长陈旧时间内先使用旧数据并在后台刷新
+    CACHE_TTL = 30 * 60
+    CACHE_REFRESH_AHEAD = 5 * 60
+    CACHE_MAX_STALE = 2 * 60 * 60
+    
     def __init__(self):
         """初始化异步基金服务"""
         logger.debug("初始化FundServiceAsync")
         
-        # 添加缓存
-        self._etf_cache = None
-        self._lof_cache = None
-        self._cache_timestamp = None
-        self._cache_duration = timedelta(minutes=30)  # 缓存30分钟
+        # ETF和LOF各自缓存，加载时间相互独立；并发的未命中只请求一次上游
+        # 行情表在加载时完成类型转换并按代码建立索引
+        self._caches: Dict[str, RefreshingCache[FundSpotTable]] = {
+            'ETF': RefreshingCache(lambda: asyncio.to_thread(lambda: FundSpotTable(self._get_etf_data())), ttl=self.CACHE_TTL,
+                                   max_stale=self.CACHE_MAX_STALE, refresh_ahead=self.CACHE_REFRESH_AHEAD, name='ETF行情'),
+            'LOF': RefreshingCache(lambda: asyncio.to_thread(lambda: FundSpotTable(self._get_lof_data())), ttl=self.CACHE_TTL,
+                                   max_stale=self.CACHE_MAX_STALE, refresh_ahead=self.CACHE_REFRESH_AHEAD, name='LOF行情'),
+        }
+    
+    def warm_up(self) -> None:
+        """在后台预先加载ETF和LOF行情，首次搜索无需等待上游"""
+        for cache in self._caches.values():
+            cache.refresh_in_background()
+    
+    async def aclose(self) -> None:
+        """取消进行中的后台刷新"""
+        for cache in self._caches.values():
+            await cache.aclose()
     
     async def search_funds(self, keyword: str, market_type: str = 'ETF') -> List[Dict[str, Any]]:
         """
@@ -37,28 +88,9 @@ class FundServiceAsync:
         try:
             logger.info(f"异步搜索基金: {keyword}, 类型: {market_type}")
             
-            # 获取基金数据
-            df = await self._get_funds_data(market_type)
-            
-            # 模糊匹配搜索（同时匹配代码和名称）
-            mask = (df['name'].str.contains(keyword, case=False, na=False) | 
-                   df['symbol'].str.contains(keyword, case=False, na=False))
-            results = df[mask]
-            
-            # 格式化返回结果并处理 NaN 值
-            formatted_results = []
-            for _, row in results.iterrows():
-                formatted_results.append({
-                    'name': row['name'] if pd.notna(row['name']) else '',
-                    'symbol': str(row['symbol']) if pd.notna(row['symbol']) else '',
-                    'price': float(row['price']) if pd.notna(row['price']) else 0.0,
-                    'volume': float(row['volume']) if pd.notna(row['volume']) else 0.0,
-                    'market_value': float(row['market_value']) if pd.notna(row['market_value']) else 0.0,
-                    'total_value': float(row['total_value']) if pd.notna(row['total_value']) else 0.0,
-                })
-                # 限制只返回前10个结果
-                if len(formatted_results) >= 10:
-                    break
+            # 使用缓存的行情表，按名称和代码的倒排索引匹配，只返回前10个结果
+            table = await self._get_fund_table(market_type)
+            formatted_results = [dict(table.search_records[position]) for position in table.index.search(keyword, 10)]
             
             logger.info(f"基金搜索完成，找到 {len(formatted_results)} 个匹配项（限制显示前10个）")
             return formatted_results
@@ -77,39 +109,26 @@ class FundServiceAsync:
             market_type: 市场类型，'ETF'或'LOF'
             
         Returns:
-            包含基金数据的DataFrame
+            包含基金数据的DataFrame（已完成类型转换）
         """
-        # 检查缓存是否有效
-        now = datetime.now()
-        cache_valid = (
-            self._cache_timestamp is not None and 
-            (now - self._cache_timestamp) < self._cache_duration
-        )
-        
-        if market_type == 'ETF' and cache_valid and self._etf_cache is not None:
-            logger.debug("使用ETF缓存数据")
-            return self._etf_cache
-        elif market_type == 'LOF' and cache_valid and self._lof_cache is not None:
-            logger.debug("使用LOF缓存数据")
-            return self._lof_cache
+        return (await self._get_fund_table(market_type)).df
+    
+    async def _get_fund_table(self, market_type: str = 'ETF') -> FundSpotTable:
+        """
+        异步获取基金行情表，支持缓存
         
-        # 缓存无效，重新获取数据
-        try:
-            logger.debug(f"从API获取{market_type}数据")
-            
-            # 使用线程池执行同步的akshare调用
-            if market_type == 'ETF':
-                df = await asyncio.to_thread(self._get_etf_data)
-                self._etf_cache = df
-            else:
-                df = await asyncio.to_thread(self._get_lof_data)
-                self._lof_cache = df
-                
-            self._cache_timestamp = now
-            return df
+        Args:
+            market_type: 市场类型，'ETF'或'LOF'
             
+        Returns:
+            基金行情表
+        """
+        # 非ETF的市场类型沿用LOF数据
+        key = 'ETF' if market_type == 'ETF' else 'LOF'
+        try:
+            return await self._caches[key].get()
         except Exception as e:
-            logger.error(f"获取{market_type}数据失败: {str(e)}")
+            logger.error(f"获取{key}数据失败: {str(e)}")
             logger.exception(e)
             raise
     
@@ -193,31 +212,12 @@ class FundServiceAsync:
         try:
             logger.info(f"获取{market_type}基金详情: {symbol}")
             
-            # 获取基金数据
-            df = await self._get_funds_data(market_type)
-            
-            # 精确匹配基金代码
-            result = df[df['symbol'] == symbol]
+            # 获取基金行情表，按代码索引直接定位
+            fund_detail = (await self._get_fund_table(market_type)).get(symbol)
             
-            if len(result) == 0:
+            if fund_detail is None:
                 raise Exception(f"未找到基金代码: {symbol}")
             
-            # 获取第一行数据
-            row = result.iloc[0]
-            
-            # 格式化为字典
-            fund_detail = {
-                'name': row['name'] if pd.notna(row['name']) else '',
-                'symbol': str(row['symbol']) if pd.notna(row['symbol']) else '',
-                'price': float(row['price']) if pd.notna(row['price']) else 0.0,
-                'price_change': float(row['price_change']) if pd.notna(row['price_change']) else 0.0,
-                'price_change_percent': float(row['price_change_percent'].strip('%'))/100 if pd.notna(row['price_change_percent']) else 0.0,
-                'volume': float(row['volume']) if pd.notna(row['volume']) else 0.0,
-                'market_value': float(row['market_value']) if pd.notna(row['market_value']) else 0.0,
-                'total_value': float(row['total_value']) if pd.notna(row['total_value']) else 0.0,
-                'discount_rate': float(row['discount_rate'].strip('%'))/100 if pd.notna(row['discount_rate']) else 0.0
-            }
-            
             logger.info(f"获取基金详情成功: {symbol}")
             return fund_detail
             
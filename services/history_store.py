@@ -0,0 +1,223 @@
+import os
+import re
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+class HistoryStore:
+    """
+    本地行情历史存储
+    按市场和代码将日线OHLCV数据缓存到磁盘，供回测、快照等离线计算使用
+    """
+
+    # 回测和面板计算使用的基础行情字段
+    PRICE_FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+    def __init__(self, base_dir: Optional[str] = None):
+        """
+        初始化行情历史存储
+
+        Args:
+            base_dir: 存储目录，默认为项目下的data/cache/history，可通过HISTORY_STORE_DIR环境变量配置
+        """
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'history')
+        self.base_dir = base_dir or os.getenv('HISTORY_STORE_DIR') or default_dir
+        os.makedirs(self.base_dir, exist_ok=True)
+
+        logger.debug(f"初始化HistoryStore，存储目录: {self.base_dir}")
+
+    # 市场类型和股票代码只允许字母、数字、点、下划线和短横线，防止请求参数构造出存储目录之外的路径
+    _NAME_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')
+
+    @classmethod
+    def _validate_name(cls, value: str, label: str) -> str:
+        """
+        校验用于构造文件路径的名称
+
+        Args:
+            value: 市场类型或股票代码
+            label: 名称说明，用于错误信息
+
+        Returns:
+            校验通过的名称
+
+        Raises:
+            ValueError: 名称包含不允许的字符或为“.”、“..”
+        """
+        if not isinstance(value, str) or not cls._NAME_PATTERN.match(value) or '..' in value or value == '.':
+            raise ValueError(f"无效的{label}: {value!r}")
+        return value
+
+    # 同一文件的读取-合并-替换按路径串行化（进程内所有实例共用，多个实例可能指向同一目录）
+    _path_locks: Dict[str, threading.Lock] = {}
+    _path_locks_guard = threading.Lock()
+
+    @classmethod
+    def _lock_for(cls, path: str) -> threading.Lock:
+        """获取文件路径对应的锁"""
+        key = os.path.abspath(path)
+        with cls._path_locks_guard:
+            lock = cls._path_locks.get(key)
+            if lock is None:
+                lock = cls._path_locks[key] = threading.Lock()
+            return lock
+
+    def _market_dir(self, market_type: str) -> str:
+        return os.path.join(self.base_dir, self._validate_name(market_type, '市场类型').upper())
+
+    def _path(self, stock_code: str, market_type: str) -> str:
+        return os.path.join(self._market_dir(market_type), f"{self._validate_name(stock_code, '股票代码')}.pkl")
+
+    def save(self, stock_code: str, market_type: str, df: pd.DataFrame) -> None:
+        """
+        保存行情数据，与已有数据按日期合并（新数据覆盖旧数据）
+
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+            df: 以日期为索引的行情DataFrame
+        """
+        if df is None or df.empty or not isinstance(df.index, pd.DatetimeIndex):
+            return
+
+        try:
+            path = self._path(stock_code, market_type)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # 并发保存同一代码时逐个合并，避免后写入的覆盖先写入的数据
+            with self._lock_for(path):
+                existing = self.load(stock_code, market_type)
+                if existing is not None and not existing.empty:
+                    merged = pd.concat([existing, df])
+                    merged = merged[~merged.index.duplicated(keep='last')]
+                else:
+                    merged = df
+                merged = merged.sort_index()
+
+                # 先写同目录下唯一命名的临时文件再替换，避免并发读取到不完整的数据
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        merged.to_pickle(f)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+
+            logger.debug(f"已保存{market_type}行情 {stock_code}，数据点数: {len(merged)}")
+
+        except Exception as e:
+            logger.error(f"保存{market_type}行情 {stock_code} 出错: {str(e)}")
+            logger.exception(e)
+
+    def load(self, stock_code: str, market_type: str) -> Optional[pd.DataFrame]:
+        """
+        读取行情数据
+
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+
+        Returns:
+            行情DataFrame，不存在时返回None
+        """
+        path = self._path(stock_code, market_type)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            logger.error(f"读取{market_type}行情 {stock_code} 出错: {str(e)}")
+            return None
+
+    def list_symbols(self, market_type: str) -> List[str]:
+        """
+        列出已缓存的股票代码
+
+        Args:
+            market_type: 市场类型
+
+        Returns:
+            股票代码列表
+        """
+        market_dir = self._market_dir(market_type)
+        if not os.path.isdir(market_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(market_dir) if name.endswith('.pkl'))
+
+    def list_modified(self, market_type: str, since: Optional[float] = None) -> List[str]:
+        """
+        列出指定时间之后有更新的股票代码
+
+        Args:
+            market_type: 市场类型
+            since: 时间戳，为空时返回全部
+
+        Returns:
+            股票代码列表
+        """
+        market_dir = self._market_dir(market_type)
+        if not os.path.isdir(market_dir):
+            return []
+        return sorted(
+            entry.name[:-4] for entry in os.scandir(market_dir)
+            if entry.name.endswith('.pkl') and (since is None or entry.stat().st_mtime >= since)
+        )
+
+    def load_panels(self, market_type: str, stock_codes: Optional[Iterable[str]] = None,
+                    fields: Iterable[str] = PRICE_FIELDS, min_rows: int = 1) -> Dict[str, pd.DataFrame]:
+        """
+        读取多只股票的行情并组装为面板
+
+        面板的每一列是一只股票，行是该股票自身的交易日序列，按最新日期对齐到底部，
+        较短的历史在顶部用NaN补齐。这样滚动窗口、EMA和前移等按列运算与逐只计算完全等价，
+        不会因停牌造成的日期缺口而产生偏差
+
+        Args:
+            market_type: 市场类型
+            stock_codes: 股票代码列表，为空时读取该市场的全部缓存
+            fields: 需要的行情字段
+            min_rows: 最少数据点数，不足的股票将被跳过
+
+        Returns:
+            字典，键为字段名（额外包含'Date'），值为行为交易日序号、列为股票代码的DataFrame
+        """
+        fields = list(fields)
+        codes = list(stock_codes) if stock_codes is not None else self.list_symbols(market_type)
+
+        frames = {}
+        for code in codes:
+            df = self.load(code, market_type)
+            if df is None or len(df) < min_rows or not set(fields).issubset(df.columns):
+                continue
+            frames[code] = df
+
+        if not frames:
+            return {}
+
+        length = max(len(df) for df in frames.values())
+        columns = list(frames.keys())
+
+        arrays = {field: np.full((length, len(columns)), np.nan) for field in fields}
+        dates = np.full((length, len(columns)), np.datetime64('NaT'), dtype='datetime64[ns]')
+
+        for j, code in enumerate(columns):
+            df = frames[code]
+            offset = length - len(df)
+            for field in fields:
+                arrays[field][offset:, j] = pd.to_numeric(df[field], errors='coerce').to_numpy(dtype=float)
+            dates[offset:, j] = df.index.to_numpy(dtype='datetime64[ns]')
+
+        panels = {field: pd.DataFrame(values, columns=columns) for field, values in arrays.items()}
+        panels['Date'] = pd.DataFrame(dates, columns=columns)
+
+        logger.debug(f"组装{market_type}行情面板完成，股票数: {len(columns)}，最长数据点数: {length}")
+        return panels
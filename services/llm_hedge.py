@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from utils.logger import get_logger
+from services.llm_metrics import LLMMetrics, llm_metrics
+
+# 获取日志器
+logger = get_logger()
+
+# 请求正常结束的标记
+_DONE = object()
+
+
+class LLMHedge:
+    """
+    跨服务商的对冲AI请求
+
+    按顺序向服务商发起请求：当前请求在对冲等待时间内没有产出内容时，额外向下一个服务商发起同样的请求，
+    最先产出内容（流式片段或完整结果）的请求胜出，其余请求立即取消。请求在产出内容前失败时直接改用下一个服务商。
+    有多个服务商参与时记录各服务商的胜负次数
+    """
+
+    def __init__(self, attempts: List[Tuple[str, str, Callable[[], AsyncIterator[str]]]], delays: List[float],
+                 metrics: Optional[LLMMetrics] = None):
+        """
+        初始化对冲请求
+
+        Args:
+            attempts: 按优先级排列的 [(模型名称, API地址, 创建请求输出的工厂函数)]，输出为分析结果JSON消息
+            delays: 每个请求的对冲等待时间（秒），超过后向下一个服务商发起请求
+            metrics: AI请求指标，默认使用进程内共享的实例
+        """
+        self.attempts = attempts
+        self.delays = delays
+        self.metrics = metrics if metrics is not None else llm_metrics
+        self.winner: Optional[int] = None
+
+    async def run(self) -> AsyncGenerator[str, None]:
+        """
+        运行对冲请求
+
+        胜出前各请求的排队和重试状态消息直接转发，错误消息暂存；胜出后只转发胜出请求的输出。
+        所有请求都在产出内容前失败时，输出最后一个请求的错误
+
+        Returns:
+            异步生成器，逐条生成分析结果JSON消息
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[int, asyncio.Task] = {}
+        errors: Dict[int, List[str]] = {}
+        finished = set()
+
+        def launch() -> float:
+            index = len(tasks)
+            if index:
+                model, api_url, _ = self.attempts[index]
+                logger.info(f"AI请求对冲: 向第 {index + 1} 个服务商发起请求, 模型: {model}, 地址: {api_url}")
+            errors[index] = []
+            tasks[index] = asyncio.create_task(self._pump(index, queue))
+            return loop.time() + self.delays[index]
+
+        try:
+            deadline = launch()
+            while True:
+                timeout = None
+                if self.winner is None and len(tasks) < len(self.attempts):
+                    timeout = max(0.0, deadline - loop.time())
+                try:
+                    index, item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    deadline = launch()
+                    continue
+
+                if self.winner is not None and index != self.winner:
+                    continue
+
+                if item is _DONE or isinstance(item, Exception):
+                    finished.add(index)
+                    if index == self.winner:
+                        if item is not _DONE:
+                            raise item
+                        return
+                    # 产出内容前失败：不再等待对冲时间，直接改用下一个服务商
+                    if len(tasks) < len(self.attempts):
+                        deadline = launch()
+                    elif len(finished) == len(tasks):
+                        for message in errors[index]:
+                            yield message
+                        if item is not _DONE and not errors[index]:
+                            raise item
+                        return
+                    continue
+
+                if self.winner is None:
+                    data = json.loads(item)
+                    if data.get('status') == 'error':
+                        errors[index].append(item)
+                        continue
+                    if 'ai_analysis_chunk' in data or data.get('status') == 'completed':
+                        self._settle(index, tasks)
+                        for message in errors[index]:
+                            yield message
+                yield item
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def _pump(self, index: int, queue: asyncio.Queue) -> None:
+        """把单个请求的输出写入队列"""
+        try:
+            async for message in self.attempts[index][2]():
+                await queue.put((index, message))
+            await queue.put((index, _DONE))
+        except Exception as e:
+            await queue.put((index, e))
+
+    def _settle(self, winner: int, tasks: Dict[int, asyncio.Task]) -> None:
+        """确定胜出的请求，取消其余请求并记录胜负"""
+        self.winner = winner
+        for index, task in tasks.items():
+            if index != winner:
+                task.cancel()
+        if len(tasks) > 1:
+            for index in tasks:
+                model, api_url, _ = self.attempts[index]
+                self.metrics.record_hedge(model, api_url, index == winner)
+            logger.info(f"AI请求对冲: 第 {winner + 1} 个服务商胜出, 共 {len(tasks)} 个服务商参与")
@@ -0,0 +1,225 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlparse
+import httpx
+from utils.logger import get_logger
+from utils.metrics import MetricsRegistry, metrics_registry
+from services.prompt_encoder import estimate_tokens
+
+# 获取日志器
+logger = get_logger()
+
+
+class LLMCall:
+    """
+    单次AI请求的计时器
+
+    记录首个内容片段的到达时间、片段间隔和响应大小，请求结束时由LLMMetrics汇总
+    """
+
+    def __init__(self, labels: Dict[str, str], prompt: str):
+        self.labels = labels
+        self.prompt_tokens = estimate_tokens(prompt)
+        self.started = time.perf_counter()
+        self.first_chunk_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.intervals: List[float] = []
+        self.chunks = 0
+        self.response_parts: List[str] = []
+        self.status = 'ok'
+
+    def begin(self) -> None:
+        """请求实际发出时重新开始计时，排队和限流等待的时间不计入延迟"""
+        self.started = time.perf_counter()
+
+    def on_chunk(self, content: str) -> None:
+        """
+        记录收到的内容片段
+
+        Args:
+            content: 内容片段
+        """
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        else:
+            self.intervals.append(now - self.last_chunk_at)
+        self.last_chunk_at = now
+        self.chunks += 1
+        self.response_parts.append(content)
+
+    def fail(self, status: str = 'error') -> None:
+        """
+        标记请求失败
+
+        Args:
+            status: 失败类型，error或timeout
+        """
+        self.status = status
+
+
+class LLMMetrics:
+    """
+    AI请求延迟与吞吐指标
+
+    按模型和API主机统计首个内容片段延迟（TTFT）、片段间隔、总耗时、每秒片段数、
+    提示词与响应大小（估算token）以及错误和超时次数
+    """
+
+    # 耗时类直方图的桶上界（秒）
+    LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+
+    # 片段间隔的桶上界（秒）
+    INTERVAL_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+
+    # 每秒片段数的桶上界
+    RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+    # token数的桶上界
+    TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+    def __init__(self, registry: MetricsRegistry = metrics_registry):
+        """
+        初始化AI请求指标
+
+        Args:
+            registry: 指标注册表
+        """
+        self.registry = registry
+        registry.register_histogram('llm_ttft_seconds', self.LATENCY_BUCKETS, '请求发出到首个内容片段的时间')
+        registry.register_histogram('llm_inter_token_seconds', self.INTERVAL_BUCKETS, '相邻内容片段的时间间隔')
+        registry.register_histogram('llm_duration_seconds', self.LATENCY_BUCKETS, 'AI请求总耗时')
+        registry.register_histogram('llm_chunks_per_second', self.RATE_BUCKETS, '首个片段之后每秒收到的内容片段数')
+        registry.register_histogram('llm_prompt_tokens', self.TOKEN_BUCKETS, '提示词估算token数')
+        registry.register_histogram('llm_response_tokens', self.TOKEN_BUCKETS, '响应内容估算token数')
+        registry.register_counter('llm_requests_total', '按结果统计的AI请求数（ok/error/timeout/cancelled）')
+        registry.register_counter('llm_hedge_total', '对冲请求中各服务商的胜负次数（won/lost）')
+
+    @staticmethod
+    def labels(model: str, api_url: str) -> Dict[str, str]:
+        """生成指标标签"""
+        return {"model": model or '', "host": urlparse(api_url or '').netloc.lower()}
+
+    @asynccontextmanager
+    async def track(self, model: str, api_url: str, prompt: str) -> AsyncIterator[LLMCall]:
+        """
+        记录一次AI请求
+
+        退出时汇总指标：超时异常记为timeout，其他异常记为error，调用方中途放弃记为cancelled
+
+        Args:
+            model: 模型名称
+            api_url: API地址
+            prompt: 提示词
+
+        Returns:
+            本次请求的计时器
+        """
+        call = LLMCall(self.labels(model, api_url), prompt)
+        try:
+            yield call
+        except httpx.TimeoutException:
+            call.fail('timeout')
+            raise
+        except Exception:
+            call.fail('error')
+            raise
+        except BaseException:
+            call.status = 'cancelled'
+            raise
+        finally:
+            self._record(call)
+
+    def _record(self, call: LLMCall) -> None:
+        """汇总单次请求的指标"""
+        try:
+            labels = call.labels
+            duration = time.perf_counter() - call.started
+            observe = self.registry.observe
+
+            observe('llm_duration_seconds', duration, labels)
+            observe('llm_prompt_tokens', call.prompt_tokens, labels)
+            if call.first_chunk_at is not None:
+                observe('llm_ttft_seconds', call.first_chunk_at - call.started, labels)
+                observe('llm_response_tokens', estimate_tokens(''.join(call.response_parts)), labels)
+                for interval in call.intervals:
+                    observe('llm_inter_token_seconds', interval, labels)
+                streaming = call.last_chunk_at - call.first_chunk_at
+                if call.chunks > 1 and streaming > 0:
+                    observe('llm_chunks_per_second', (call.chunks - 1) / streaming, labels)
+            self.registry.inc('llm_requests_total', {**labels, "status": call.status})
+        except Exception as e:
+            # 指标统计不影响分析流程
+            logger.error(f"记录AI请求指标时出错: {str(e)}")
+
+    def ttft_quantile(self, model: str, api_url: str, q: float, min_count: int = 1) -> Optional[float]:
+        """
+        估算模型和主机的首个内容片段延迟分位数
+
+        Args:
+            model: 模型名称
+            api_url: API地址
+            q: 分位（0~1）
+            min_count: 最少样本数
+
+        Returns:
+            延迟估算值（秒），样本不足时返回None
+        """
+        return self.registry.quantile('llm_ttft_seconds', self.labels(model, api_url), q, min_count)
+
+    def record_hedge(self, model: str, api_url: str, won: bool) -> None:
+        """
+        记录一次对冲请求中服务商的胜负
+
+        Args:
+            model: 模型名称
+            api_url: API地址
+            won: 是否最先产出内容
+        """
+        self.registry.inc('llm_hedge_total', {**self.labels(model, api_url), "result": 'won' if won else 'lost'})
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        按模型和主机汇总指标，用于比较不同模型和服务商的延迟
+
+        Returns:
+            每个模型和主机组合的统计信息列表
+        """
+        names = {
+            'ttft_seconds': 'llm_ttft_seconds',
+            'inter_token_seconds': 'llm_inter_token_seconds',
+            'duration_seconds': 'llm_duration_seconds',
+            'chunks_per_second': 'llm_chunks_per_second',
+            'prompt_tokens': 'llm_prompt_tokens',
+            'response_tokens': 'llm_response_tokens',
+        }
+        groups: Dict[tuple, Dict[str, Any]] = {}
+
+        def group(key):
+            labels = dict(key)
+            group_key = (labels.get('model', ''), labels.get('host', ''))
+            return groups.setdefault(group_key, {"model": group_key[0], "host": group_key[1], "requests": {}})
+
+        for field, name in names.items():
+            for key, stats in self.registry.histograms(name).items():
+                group(key)[field] = stats
+        for key, value in self.registry.counters('llm_requests_total').items():
+            labels = dict(key)
+            status = labels.pop('status', 'ok')
+            group(tuple(sorted(labels.items())))["requests"][status] = int(value)
+        for key, value in self.registry.counters('llm_hedge_total').items():
+            labels = dict(key)
+            result = labels.pop('result', 'won')
+            hedge = group(tuple(sorted(labels.items()))).setdefault("hedge", {"won": 0, "lost": 0})
+            hedge[result] = int(value)
+        for item in groups.values():
+            hedge = item.get("hedge")
+            if hedge:
+                hedge["win_rate"] = round(hedge["won"] / max(1, hedge["won"] + hedge["lost"]), 4)
+
+        return sorted(groups.values(), key=lambda item: (item["model"], item["host"]))
+
+
+# 进程内共享的AI请求指标
+llm_metrics = LLMMetrics()
@@ -0,0 +1,343 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+
+def _host_setting(name: str, host: str, default: int) -> int:
+    """读取按主机名配置的整数（格式: host1=4,host2=2），未匹配时使用默认值"""
+    for item in os.getenv(f'{name}_MAP', '').split(','):
+        if '=' not in item:
+            continue
+        key, value = item.split('=', 1)
+        if key.strip().lower() == host:
+            try:
+                return int(value)
+            except ValueError:
+                logger.warning(f"{name}_MAP配置无效: {item}")
+    return int(os.getenv(name, default))
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    解析Retry-After响应头
+
+    Args:
+        value: 响应头的值，秒数或HTTP日期
+        now: 当前时间戳，默认为当前时间
+
+    Returns:
+        需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class LLMTicket:
+    """
+    一次AI请求在调度器中的排队凭证
+
+    以异步上下文管理器使用，退出时释放占用的并发名额
+    """
+
+    def __init__(self, provider: '_Provider', user: str, tokens: int):
+        self.provider = provider
+        self.user = user
+        self.tokens = tokens
+        self.attempts = 0
+        self.granted = False
+        self._event = asyncio.Event()
+
+    async def __aenter__(self) -> 'LLMTicket':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    async def wait(self) -> AsyncGenerator[int, None]:
+        """
+        排队等待并发名额和token预算
+
+        Returns:
+            异步生成器，排队期间位置变化时生成当前位置（从1开始），获得名额后结束
+        """
+        if self.granted:
+            return
+        self.provider.enqueue(self)
+        try:
+            last_position = None
+            while not self.granted:
+                # 先清除事件再读取位置，生成位置期间的变化不会丢失
+                self._event.clear()
+                position = self.provider.position(self)
+                if position != last_position:
+                    last_position = position
+                    yield position
+                if self.granted:
+                    break
+                await self._event.wait()
+        except BaseException:
+            # 取消排队时让出位置
+            self.provider.discard(self)
+            raise
+
+    def release(self) -> None:
+        """释放并发名额"""
+        if self.granted:
+            self.granted = False
+            self.provider.release()
+
+    async def backoff(self, retry_after: Optional[float]) -> float:
+        """
+        上游限流时释放名额并暂停该服务商，之后重新排队
+
+        Args:
+            retry_after: 上游要求等待的秒数，为空时按重试次数指数退避
+
+        Returns:
+            实际等待的秒数
+        """
+        self.attempts += 1
+        delay = retry_after if retry_after is not None else min(
+            self.provider.scheduler.max_backoff,
+            self.provider.scheduler.base_backoff * 2 ** (self.attempts - 1) * (1 + random.random() * 0.25)
+        )
+        self.release()
+        self.provider.pause(delay)
+        return delay
+
+    def notify(self) -> None:
+        self._event.set()
+
+
+class _Provider:
+    """单个服务商（API主机）的并发名额、token预算和按用户划分的等待队列"""
+
+    def __init__(self, scheduler: 'LLMScheduler', host: str, max_concurrency: int, tpm_limit: int):
+        self.scheduler = scheduler
+        self.host = host
+        self.max_concurrency = max(1, max_concurrency)
+        self.tpm_limit = max(0, tpm_limit)
+        self.running = 0
+        self.paused_until = 0.0
+        self.queues: 'OrderedDict[str, Deque[LLMTicket]]' = OrderedDict()
+        self.usage: Deque[Tuple[float, int]] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def enqueue(self, ticket: LLMTicket) -> None:
+        queue = self.queues.setdefault(ticket.user, deque())
+        # 限流重试的请求排在该用户队列的最前面
+        if ticket.attempts:
+            queue.appendleft(ticket)
+        else:
+            queue.append(ticket)
+        self.dispatch()
+
+    def discard(self, ticket: LLMTicket) -> None:
+        queue = self.queues.get(ticket.user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[ticket.user]
+            self._notify_all()
+
+    def release(self) -> None:
+        self.running = max(0, self.running - 1)
+        self.dispatch()
+
+    def pause(self, delay: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        logger.warning(f"AI服务商 {self.host} 限流，暂停 {delay:.1f} 秒")
+
+    def position(self, ticket: LLMTicket) -> int:
+        """估算按用户轮转出队时该请求的排队位置"""
+        queue = self.queues.get(ticket.user)
+        if not queue or ticket not in queue:
+            return 0
+        index = queue.index(ticket)
+        ahead = index
+        for user, other in self.queues.items():
+            if user == ticket.user:
+                continue
+            # 轮转到该用户前，其他用户每人最多先出队index+1个请求
+            ahead += min(len(other), index + 1)
+        return ahead + 1
+
+    def dispatch(self) -> None:
+        """按用户轮转，在并发名额和token预算允许时放行等待中的请求"""
+        now = time.monotonic()
+        granted_any = False
+
+        while self.queues and self.running < self.max_concurrency:
+            if now < self.paused_until:
+                self._schedule(self.paused_until - now)
+                break
+
+            user, queue = next(iter(self.queues.items()))
+            ticket = queue[0]
+            wait = self._budget_wait(ticket.tokens, now)
+            if wait > 0:
+                self._schedule(wait)
+                break
+
+            queue.popleft()
+            # 该用户移到队尾，下一次放行其他用户的请求
+            del self.queues[user]
+            if queue:
+                self.queues[user] = queue
+
+            self.running += 1
+            ticket.granted = True
+            if self.tpm_limit:
+                self.usage.append((now, ticket.tokens))
+            ticket.notify()
+            granted_any = True
+
+        if granted_any:
+            # 排队位置发生变化
+            self._notify_all()
+
+    def _budget_wait(self, tokens: int, now: float) -> float:
+        """返回满足每分钟token预算需要等待的秒数"""
+        if not self.tpm_limit:
+            return 0.0
+        while self.usage and now - self.usage[0][0] >= 60:
+            self.usage.popleft()
+        used = sum(entry[1] for entry in self.usage)
+        # 单个请求超过预算时，只要窗口为空就放行，避免永远等待
+        if not self.usage or used + tokens <= self.tpm_limit:
+            return 0.0
+        return 60 - (now - self.usage[0][0])
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None and not self._timer.cancelled():
+            return
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            self._timer = None
+            self.dispatch()
+
+        self._timer = loop.call_later(max(delay, 0.01), fire)
+
+    def _notify_all(self) -> None:
+        for queue in self.queues.values():
+            for ticket in queue:
+                ticket.notify()
+
+
+class LLMScheduler:
+    """
+    AI请求调度器
+
+    按服务商（API主机）限制并发数和每分钟token数，等待中的请求按用户轮转放行，
+    避免单个用户的突发请求占满名额；上游返回429/503时按Retry-After暂停该服务商并重新排队
+    """
+
+    # 触发退避重试的HTTP状态码
+    RETRY_STATUS = (429, 503)
+
+    # 估算token预算时为响应预留的token数
+    RESPONSE_TOKENS = 800
+
+    def __init__(self, max_retries: Optional[int] = None, base_backoff: float = 1.0, max_backoff: float = 30.0):
+        """
+        初始化AI请求调度器
+
+        各服务商的并发数读取AI_MAX_CONCURRENCY（默认3）及AI_MAX_CONCURRENCY_MAP，
+        每分钟token数读取AI_TPM_LIMIT（默认0，不限制）及AI_TPM_LIMIT_MAP，格式均为 host1=4,host2=2
+
+        Args:
+            max_retries: 限流时的最大重试次数，默认读取AI_MAX_RETRIES（3）
+            base_backoff: 没有Retry-After时的初始退避时间（秒）
+            max_backoff: 没有Retry-After时的最长退避时间（秒）
+        """
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('AI_MAX_RETRIES', 3))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._providers: Dict[Tuple[str, int], _Provider] = {}
+
+    @staticmethod
+    def host(api_url: str) -> str:
+        """获取API主机名，作为服务商的标识"""
+        return (urlparse(api_url or '').hostname or '').lower()
+
+    @classmethod
+    def concurrency_limit(cls, api_url: str) -> int:
+        """
+        获取服务商允许的并发请求数
+
+        优先使用AI_MAX_CONCURRENCY_MAP中与API主机名匹配的配置，否则使用AI_MAX_CONCURRENCY（默认3）
+
+        Args:
+            api_url: API地址
+
+        Returns:
+            最大并发数，至少为1
+        """
+        return max(1, _host_setting('AI_MAX_CONCURRENCY', cls.host(api_url), 3))
+
+    def provider(self, api_url: str) -> _Provider:
+        """获取服务商的调度状态（每个事件循环独立）"""
+        host = self.host(api_url)
+        key = (host, id(asyncio.get_running_loop()))
+        provider = self._providers.get(key)
+        if provider is None:
+            provider = _Provider(self, host, self.concurrency_limit(api_url), _host_setting('AI_TPM_LIMIT', host, 0))
+            self._providers[key] = provider
+        return provider
+
+    def ticket(self, api_url: str, user: str = '', prompt_tokens: int = 0) -> LLMTicket:
+        """
+        创建排队凭证
+
+        Args:
+            api_url: API地址
+            user: 用户标识，用于在用户之间公平分配
+            prompt_tokens: 提示词的估算token数
+
+        Returns:
+            排队凭证
+        """
+        return LLMTicket(self.provider(api_url), user or '', prompt_tokens + self.RESPONSE_TOKENS)
+
+    def should_retry(self, ticket: LLMTicket, status_code: int) -> bool:
+        """判断上游响应是否应该退避后重试"""
+        return status_code in self.RETRY_STATUS and ticket.attempts < self.max_retries
+
+    def get_stats(self) -> List[Dict[str, object]]:
+        """获取各服务商的运行和排队情况"""
+        now = time.monotonic()
+        return [
+            {
+                "host": provider.host,
+                "running": provider.running,
+                "max_concurrency": provider.max_concurrency,
+                "queued": sum(len(queue) for queue in provider.queues.values()),
+                "users": len(provider.queues),
+                "tpm_limit": provider.tpm_limit,
+                "paused_for": round(max(0.0, provider.paused_until - now), 1),
+            }
+            for provider in self._providers.values()
+        ]
+
+
+# 进程内共享的AI请求调度器
+llm_scheduler = LLMScheduler()
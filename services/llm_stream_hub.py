@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Set
+from utils.logger import get_logger
+from utils.broadcast import BroadcastStream
+
+# 获取日志器
+logger = get_logger()
+
+class LLMStreamHub:
+    """
+    进行中AI请求的共享中心
+
+    相同的提示词、模型、API地址和API密钥同时只向上游发起一次请求：第一个请求在后台运行并把输出写入广播流，
+    之后相同的请求先重放已收到的输出再跟随实时输出，N个请求只消耗一次上游调用。
+    请求结束后即移除，之后的相同请求由AI分析缓存处理
+    """
+
+    def __init__(self):
+        self._streams: Dict[str, BroadcastStream[str]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics = {"started": 0, "joined": 0}
+
+        logger.debug("初始化LLMStreamHub")
+
+    @staticmethod
+    def make_key(prompt: str, model: str, api_url: str, stream: bool, api_key_hash: str = '') -> str:
+        """
+        生成请求键
+
+        Args:
+            prompt: 提示词
+            model: 模型名称
+            api_url: API地址
+            stream: 是否使用流式响应（输出的消息格式不同）
+            api_key_hash: API密钥的哈希，不同密钥的请求不共享上游调用
+
+        Returns:
+            请求键
+        """
+        payload = "\x1f".join([prompt, model or '', api_url or '', '1' if stream else '0', api_key_hash or ''])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    async def subscribe(self, key: str, request_factory: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """
+        订阅请求的输出，相同请求键的请求只运行一次
+
+        上游请求在后台运行，与订阅者的连接无关：第一个订阅者断开不会中止请求，其他订阅者仍能收到完整输出
+
+        Args:
+            key: 请求键
+            request_factory: 创建上游请求输出的工厂函数，只在没有进行中的相同请求时调用
+
+        Returns:
+            异步生成器，逐条生成输出消息
+        """
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = BroadcastStream()
+            self._streams[key] = stream
+            task = asyncio.create_task(self._run(key, stream, request_factory))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self.metrics["started"] += 1
+        else:
+            self.metrics["joined"] += 1
+            logger.info(f"复用进行中的AI请求: {key[:12]}，已收到 {len(stream.items)} 条输出，订阅者: {stream.subscriber_count + 1}")
+
+        async for item in stream.subscribe():
+            yield item
+
+    async def _run(self, key: str, stream: BroadcastStream[str], request_factory: Callable[[], AsyncIterator[str]]) -> None:
+        """在后台运行上游请求，把输出写入广播流"""
+        try:
+            async for item in request_factory():
+                stream.publish(item)
+            stream.close()
+        except asyncio.CancelledError:
+            # 取消只发生在后台任务上，订阅者收到普通异常，避免被误认为自身被取消
+            stream.close(RuntimeError("AI请求已取消"))
+            raise
+        except Exception as e:
+            stream.close(e)
+        finally:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+
+
+# 进程内共享的AI请求共享中心
+llm_stream_hub = LLMStreamHub()
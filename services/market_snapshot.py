@@ -0,0 +1,352 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from utils.logger import get_logger
+from services.history_store import HistoryStore
+from services.technical_indicator import TechnicalIndicator
+from services.stock_scorer import StockScorer
+
+# 获取日志器
+logger = get_logger()
+
+class MarketSnapshot:
+    """
+    全市场最新指标快照
+
+    以列式表格保存各市场（A/HK/US/ETF/LOF）每只股票一行的最新价格、涨跌幅、技术指标、评分及各组件得分。
+    快照由单股分析、批量扫描的计算结果实时更新，并定期从本地行情历史增量刷新，
+    筛选、排名和详情查询可直接读取快照，无需重新获取数据和计算指标。
+    每列是预先分配的numpy数组，股票按 (市场, 代码) 固定在某一行，更新时按行号原地写入
+    """
+
+    # 快照覆盖的市场
+    MARKETS = ('A', 'HK', 'US', 'ETF', 'LOF')
+
+    # 标识和价格相关的列，其余为指标列和评分列
+    BASE_COLUMNS = ['stock_code', 'market_type', 'last_bar_date', 'price', 'price_change_value', 'change_percent']
+
+    # 列数组的初始容量，行数超出时按倍数扩容
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, history_store: Optional[HistoryStore] = None,
+                 indicator: Optional[TechnicalIndicator] = None,
+                 scorer: Optional[StockScorer] = None):
+        """
+        初始化市场快照
+
+        Args:
+            history_store: 行情历史存储，用于增量刷新
+            indicator: 技术指标计算服务
+            scorer: 股票评分服务
+        """
+        self.history_store = history_store or HistoryStore()
+        self.indicator = indicator or TechnicalIndicator()
+        self.scorer = scorer or StockScorer()
+
+        # 快照更新可能来自线程池中的计算任务
+        self._lock = threading.Lock()
+        self._positions: Dict[Tuple[str, str], int] = {}
+        self._market_positions: Dict[str, List[int]] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        # 列类型: float（整数列同样以float保存，读取时还原）、int、datetime、object
+        self._kinds: Dict[str, str] = {}
+        self._size = 0
+        self._capacity = 0
+        self._tables: Dict[Optional[str], Tuple[int, pd.DataFrame]] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        self.version = 0
+
+        logger.debug("初始化MarketSnapshot")
+
+    @property
+    def score_columns(self) -> List[str]:
+        """评分相关的列名"""
+        return ['score'] + [f"score_{component['name']}" for component in self.scorer.engine.components]
+
+    def update(self, stock_code: str, market_type: str, df_with_indicators: pd.DataFrame, score: int,
+               score_breakdown: Dict[str, int], recommendation: str) -> None:
+        """
+        使用单只股票的计算结果更新快照
+
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+            df_with_indicators: 包含技术指标的DataFrame
+            score: 评分
+            score_breakdown: 各组件得分明细
+            recommendation: 投资建议
+        """
+        if df_with_indicators is None or df_with_indicators.empty:
+            return
+
+        latest = df_with_indicators.iloc[-1]
+        previous = df_with_indicators.iloc[-2] if len(df_with_indicators) > 1 else latest
+        price_change_value = float(latest['Close'] - previous['Close'])
+
+        change_percent = latest.get('Change_pct')
+        if change_percent is None or pd.isna(change_percent):
+            change_percent = price_change_value / previous['Close'] * 100 if previous['Close'] else np.nan
+
+        row = {
+            'stock_code': stock_code,
+            'market_type': market_type,
+            'last_bar_date': pd.Timestamp(df_with_indicators.index[-1]) if isinstance(df_with_indicators.index, pd.DatetimeIndex) else pd.NaT,
+            'price': float(latest['Close']),
+            'price_change_value': price_change_value,
+            'change_percent': float(change_percent),
+        }
+        for column in self._indicator_columns(df_with_indicators.columns):
+            row[column] = pd.to_numeric(latest[column], errors='coerce')
+        row['score'] = score
+        for name, value in score_breakdown.items():
+            row[f"score_{name}"] = value
+        row['recommendation'] = recommendation
+        row['updated_at'] = time.time()
+
+        self._upsert([row])
+
+    def refresh_from_history(self, market_type: str, stock_codes: Optional[Iterable[str]] = None, full: bool = False) -> int:
+        """
+        从本地行情历史增量刷新快照
+
+        只重新计算上次刷新后行情文件有更新（或尚未进入快照）的股票；按最新日期底部对齐的面板
+        一次性计算全部指标，取最后一行作为各股票的最新值，再向量化评分
+
+        Args:
+            market_type: 市场类型
+            stock_codes: 限定的股票代码，为空时为该市场的全部缓存
+            full: 是否忽略更新时间全部重新计算
+
+        Returns:
+            更新的股票数量
+        """
+        started = time.time()
+        since = None if full else self._refreshed_at.get(market_type)
+        codes = self.history_store.list_modified(market_type, since)
+        if stock_codes is not None:
+            wanted = set(stock_codes)
+            codes = [code for code in codes if code in wanted]
+
+        if not codes:
+            self._refreshed_at[market_type] = started
+            return 0
+
+        panels = self.history_store.load_panels(market_type, codes)
+        if not panels:
+            self._refreshed_at[market_type] = started
+            return 0
+
+        indicators = self.indicator.calculate_indicator_panels(panels)
+        close = panels['Close']
+        columns = list(close.columns)
+
+        # 面板底部对齐，最后一行即每只股票的最新K线
+        latest = {name: panel.iloc[-1].to_numpy() for name, panel in indicators.items() if name != 'Date'}
+        previous_close = close.iloc[-2].to_numpy() if len(close) > 1 else latest['Close']
+
+        engine = self.scorer.engine
+        breakdown = engine.evaluate(latest)
+        scores = breakdown.pop('score').astype(int)
+        recommendations = engine.recommend(scores)
+
+        price_change_value = latest['Close'] - previous_close
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_percent = np.where(previous_close != 0, price_change_value / previous_close * 100, np.nan)
+
+        now = time.time()
+        last_dates = panels['Date'].iloc[-1].to_numpy()
+        indicator_columns = self._indicator_columns(latest.keys())
+
+        rows = []
+        for j, code in enumerate(columns):
+            row = {
+                'stock_code': code,
+                'market_type': market_type,
+                'last_bar_date': pd.Timestamp(last_dates[j]),
+                'price': float(latest['Close'][j]),
+                'price_change_value': float(price_change_value[j]),
+                'change_percent': float(change_percent[j]),
+            }
+            for column in indicator_columns:
+                row[column] = float(latest[column][j])
+            row['score'] = int(scores[j])
+            for name, values in breakdown.items():
+                row[f"score_{name}"] = int(values[j])
+            row['recommendation'] = str(recommendations[j])
+            row['updated_at'] = now
+            rows.append(row)
+
+        self._upsert(rows)
+        self._refreshed_at[market_type] = started
+
+        logger.info(f"{market_type}市场快照增量刷新完成，更新 {len(rows)} 只股票，耗时 {time.time() - started:.2f}秒")
+        return len(rows)
+
+    def refresh_all(self, full: bool = False) -> int:
+        """
+        增量刷新全部市场
+
+        Args:
+            full: 是否全部重新计算
+
+        Returns:
+            更新的股票数量
+        """
+        updated = 0
+        for market_type in self.MARKETS:
+            try:
+                updated += self.refresh_from_history(market_type, full=full)
+            except Exception as e:
+                logger.error(f"刷新{market_type}市场快照时出错: {str(e)}")
+                logger.exception(e)
+        return updated
+
+    async def run_refresh_loop(self, interval: float = 300) -> None:
+        """
+        后台定期增量刷新快照（在线程池中计算），直到任务被取消
+
+        Args:
+            interval: 刷新间隔（秒）
+        """
+        while True:
+            await asyncio.to_thread(self.refresh_all)
+            await asyncio.sleep(interval)
+
+    def get(self, stock_code: str, market_type: str) -> Optional[Dict[str, Any]]:
+        """
+        获取单只股票的快照
+
+        Args:
+            stock_code: 股票代码
+            market_type: 市场类型
+
+        Returns:
+            快照行字典，不存在时返回None
+        """
+        with self._lock:
+            position = self._positions.get((market_type, stock_code))
+            if position is None:
+                return None
+            row = {}
+            for column, values in self._columns.items():
+                value = values[position]
+                kind = self._kinds[column]
+                if kind == 'int':
+                    value = int(value) if not np.isnan(value) else np.nan
+                elif kind == 'float':
+                    value = float(value)
+                elif kind == 'datetime':
+                    value = pd.Timestamp(value)
+                row[column] = value
+            return row
+
+    def get_table(self, market_type: Optional[str] = None) -> pd.DataFrame:
+        """
+        获取快照表格
+
+        表格按列数组的切片组装（向量化复制，不逐行构造），有更新后首次读取时重新组装，
+        之后的读取直接复用；返回的表格应视为只读
+
+        Args:
+            market_type: 市场类型，为空时返回全部市场
+
+        Returns:
+            每只股票一行的DataFrame
+        """
+        with self._lock:
+            cached = self._tables.get(market_type)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+
+            if not self._size:
+                table = pd.DataFrame(columns=self.BASE_COLUMNS + self.score_columns + ['recommendation', 'updated_at'])
+            else:
+                if market_type is None:
+                    index = slice(0, self._size)
+                else:
+                    index = np.asarray(self._market_positions.get(market_type, []), dtype=np.intp)
+                table = pd.DataFrame({column: self._read_column(column, values[index])
+                                      for column, values in self._columns.items()})
+            self._tables[market_type] = (self.version, table)
+            return table
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _read_column(self, column: str, values: np.ndarray) -> np.ndarray:
+        """复制列数据，整数列在没有缺失值时还原为整数"""
+        if self._kinds[column] == 'int' and not np.isnan(values).any():
+            return values.astype(np.int64)
+        return values.copy()
+
+    def _upsert(self, rows: List[Dict[str, Any]]) -> None:
+        """按行号原地写入快照行，已有的行仅在K线日期不早于原有数据时覆盖"""
+        with self._lock:
+            for row in rows:
+                key = (row['market_type'], row['stock_code'])
+                position = self._positions.get(key)
+                if position is None:
+                    position = self._append(key)
+                elif 'last_bar_date' in self._columns:
+                    existing_date = self._columns['last_bar_date'][position]
+                    if not np.isnat(existing_date) and pd.notna(row['last_bar_date']) \
+                            and pd.Timestamp(row['last_bar_date']) < pd.Timestamp(existing_date):
+                        continue
+
+                for column, values in self._columns.items():
+                    if column not in row:
+                        values[position] = self._missing(column)
+                for column, value in row.items():
+                    values = self._columns.get(column)
+                    if values is None:
+                        values = self._add_column(column, value)
+                    values[position] = self._missing(column) if value is None else value
+            self.version += 1
+
+    def _append(self, key: Tuple[str, str]) -> int:
+        """为新股票分配行号，容量不足时扩容所有列"""
+        if self._size >= self._capacity:
+            capacity = max(self.INITIAL_CAPACITY, self._capacity * 2)
+            for column, values in self._columns.items():
+                grown = np.full(capacity, self._missing(column), dtype=values.dtype)
+                grown[:self._size] = values[:self._size]
+                self._columns[column] = grown
+            self._capacity = capacity
+        position = self._size
+        self._size += 1
+        self._positions[key] = position
+        self._market_positions.setdefault(key[0], []).append(position)
+        return position
+
+    def _add_column(self, column: str, value: Any) -> np.ndarray:
+        """按首次写入的值确定列类型并分配数组"""
+        if isinstance(value, (pd.Timestamp, np.datetime64)) or value is pd.NaT:
+            kind, dtype = 'datetime', 'datetime64[ns]'
+        elif isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, np.number)):
+            kind, dtype = 'object', object
+        elif isinstance(value, (int, np.integer)):
+            kind, dtype = 'int', float
+        else:
+            kind, dtype = 'float', float
+        self._kinds[column] = kind
+        values = np.empty(self._capacity, dtype=dtype)
+        values[:] = self._missing(column)
+        self._columns[column] = values
+        return values
+
+    def _missing(self, column: str) -> Any:
+        """列的缺失值"""
+        kind = self._kinds[column]
+        if kind == 'datetime':
+            return np.datetime64('NaT')
+        if kind == 'object':
+            return None
+        return np.nan
+
+    def _indicator_columns(self, columns: Iterable[str]) -> List[str]:
+        """需要写入快照的行情和指标列"""
+        excluded = {'Open', 'High', 'Low', 'Close', 'Date', 'Change_pct'}
+        return [column for column in columns if column not in excluded and not str(column).startswith('score')]
@@ -0,0 +1,160 @@
+import math
+import os
+import re
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+# 中日韩字符，按每个字符约一个token估算
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数量
+
+    不依赖具体模型的分词器：中文按每个字符一个token，其他字符按每4个字符一个token估算，
+    用于控制提示词长度，结果为近似值
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数量
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class PromptEncoder:
+    """
+    AI分析提示词的紧凑编码器
+
+    将近期行情编码为列式的CSV表格：只保留提示词需要的字段，数值按字段精度取整，日期只保留年月日；
+    在token预算内尽可能多地保留最近的交易日，并记录提示词大小指标
+    """
+
+    # 默认编码的字段（不存在的字段自动跳过）
+    DEFAULT_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Change_pct', 'MA5', 'MA20', 'MA60',
+                       'RSI', 'MACD', 'Signal', 'Volume_Ratio']
+
+    # 各字段保留的小数位数，未列出的字段保留2位
+    DECIMALS = {'Volume': 0, 'RSI': 1, 'Change_pct': 2, 'Volume_Ratio': 2, 'MACD': 3, 'Signal': 3}
+
+    # 预算不足时最少保留的交易日数
+    MIN_ROWS = 3
+
+    def __init__(self, columns: Optional[Sequence[str]] = None, max_rows: Optional[int] = None,
+                 token_budget: Optional[int] = None):
+        """
+        初始化提示词编码器
+
+        Args:
+            columns: 编码的字段，默认读取AI_PROMPT_COLUMNS（逗号分隔），否则使用DEFAULT_COLUMNS
+            max_rows: 最多编码的交易日数，默认读取AI_PROMPT_ROWS（14）
+            token_budget: 整个提示词的token预算，默认读取AI_PROMPT_TOKEN_BUDGET（1500）
+        """
+        env_columns = [c.strip() for c in os.getenv('AI_PROMPT_COLUMNS', '').split(',') if c.strip()]
+        self.columns = list(columns or env_columns or self.DEFAULT_COLUMNS)
+        self.max_rows = max_rows or int(os.getenv('AI_PROMPT_ROWS', 14))
+        self.token_budget = token_budget or int(os.getenv('AI_PROMPT_TOKEN_BUDGET', 1500))
+
+        # 提示词大小指标
+        self.metrics = {"prompts": 0, "total_tokens": 0, "max_tokens": 0, "truncated": 0}
+
+    def encode_table(self, df: pd.DataFrame, max_tokens: Optional[int] = None) -> Tuple[str, int]:
+        """
+        将最近的行情编码为CSV表格
+
+        Args:
+            df: 包含技术指标的DataFrame
+            max_tokens: 表格可用的token数，超出时从最早的交易日开始删减
+
+        Returns:
+            (表格文本, 编码的交易日数)
+        """
+        columns = [column for column in self.columns if column in df.columns]
+        recent = df.tail(self.max_rows)
+
+        lines = [self._format_row(index, row) for index, row in zip(recent.index, self._format_columns(recent, columns))]
+        header = ','.join(['Date'] + columns)
+
+        # 按token预算从最早的交易日开始删减
+        if max_tokens is not None:
+            budget = max_tokens - estimate_tokens(header)
+            costs = [estimate_tokens(line) + 1 for line in lines]
+            while len(lines) > self.MIN_ROWS and sum(costs) > budget:
+                lines.pop(0)
+                costs.pop(0)
+
+        return '\n'.join([header] + lines), len(lines)
+
+    def record(self, prompt: str, rows: int) -> Dict[str, Any]:
+        """
+        记录提示词大小指标
+
+        Args:
+            prompt: 完整提示词
+            rows: 编码的交易日数
+
+        Returns:
+            本次提示词的大小信息
+        """
+        tokens = estimate_tokens(prompt)
+        self.metrics["prompts"] += 1
+        self.metrics["total_tokens"] += tokens
+        self.metrics["max_tokens"] = max(self.metrics["max_tokens"], tokens)
+        if rows < self.max_rows:
+            self.metrics["truncated"] += 1
+
+        stats = {"chars": len(prompt), "estimated_tokens": tokens, "rows": rows, "budget": self.token_budget}
+        logger.debug(f"提示词大小: {stats}")
+        return stats
+
+    def _format_columns(self, df: pd.DataFrame, columns: List[str]) -> List[List[str]]:
+        """按字段精度格式化数值，返回按行排列的文本"""
+        formatted = []
+        for column in columns:
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+            decimals = self.DECIMALS.get(column, 2)
+            formatted.append([self._format_number(value, decimals) for value in values])
+        return [list(row) for row in zip(*formatted)] if formatted else [[] for _ in range(len(df))]
+
+    @staticmethod
+    def _format_number(value: float, decimals: int) -> str:
+        if not np.isfinite(value):
+            return ''
+        if decimals == 0:
+            return str(int(round(value)))
+        # 去掉末尾无意义的0，进一步缩短文本
+        text = f"{value:.{decimals}f}".rstrip('0').rstrip('.')
+        return '0' if text in ('', '-0') else text
+
+    @staticmethod
+    def _format_row(index: Any, values: List[str]) -> str:
+        date = index.strftime('%Y-%m-%d') if hasattr(index, 'strftime') else str(index)
+        return ','.join([date] + values)
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """
+    将技术指标概要格式化为紧凑的 key=value 文本
+
+    Args:
+        summary: 技术指标概要
+
+    Returns:
+        概要文本
+    """
+    parts = []
+    for key, value in summary.items():
+        if isinstance(value, (float, np.floating)):
+            value = PromptEncoder._format_number(float(value), 2)
+        parts.append(f"{key}={value}")
+    return ', '.join(parts)
@@ -0,0 +1,209 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配器（Aho-Corasick自动机）
+
+    一次扫描同时匹配所有关键词，状态在多次输入之间保留，跨分块的关键词也能匹配到
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        """
+        构建自动机
+
+        Args:
+            keywords: 关键词列表
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+
+        for keyword in keywords:
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (keyword,)
+
+        # 按层次构建失败指针，并合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+        self.state = 0
+
+    def step(self, ch: str) -> Tuple[str, ...]:
+        """
+        输入一个字符
+
+        Args:
+            ch: 字符
+
+        Returns:
+            以该字符结尾的关键词
+        """
+        state = self.state
+        while state and ch not in self._goto[state]:
+            state = self._fail[state]
+        state = self._goto[state].get(ch, 0)
+        self.state = state
+        return self._output[state]
+
+
+class RecommendationTracker:
+    """
+    流式分析内容的投资建议与关键词跟踪器
+
+    逐个分块输入AI回复，识别“## 投资建议”小节（到下一个“\\n##”为止），在小节内的关键词
+    确定投资建议后立即给出临时结果；同时统计全文的评分关键词。
+    结果与对完整文本做正则匹配和子串查找一致，但不需要在输出结束后重新扫描全文
+    """
+
+    # 投资建议的判断顺序：先出现在前面的类别优先
+    RECOMMENDATION_KEYWORDS = (
+        ("买入", ("买入", "增持")),
+        ("卖出", ("卖出", "减持")),
+        ("持有", ("持有",)),
+    )
+
+    # 默认建议
+    DEFAULT_RECOMMENDATION = "观望"
+
+    # 评分关键词及分值，按顺序取第一个出现的类别
+    SCORE_KEYWORDS = (
+        (20, ("强烈买入", "显著上涨")),
+        (10, ("买入", "看涨")),
+        (-20, ("强烈卖出", "显著下跌")),
+        (-10, ("卖出", "看跌")),
+    )
+
+    SECTION_TITLE = "投资建议"
+    SECTION_END = "\n##"
+
+    # 判断小节标题前是否为“##”时保留的字符数
+    _TAIL_SIZE = 64
+
+    def __init__(self):
+        keywords = {word for _, words in self.RECOMMENDATION_KEYWORDS for word in words}
+        keywords |= {word for _, words in self.SCORE_KEYWORDS for word in words}
+        self._matcher = KeywordMatcher(sorted(keywords) + [self.SECTION_TITLE, self.SECTION_END])
+
+        self.found: Set[str] = set()
+        self.section_found: Set[str] = set()
+        # before: 尚未找到小节标题; header: 标题之后等待换行; in: 小节内; after: 小节已结束
+        self.section_state = 'before'
+        self._index = -1
+        self._tail = ''
+        self._header_newline: Optional[int] = None
+        self._content_start = 0
+        self._announced: Optional[Tuple[str, bool]] = None
+
+    def feed(self, text: str) -> bool:
+        """
+        输入一段回复内容
+
+        Args:
+            text: 回复内容片段
+
+        Returns:
+            投资建议（或其是否已确定）是否发生变化，变化时应推送临时结果
+        """
+        for ch in text:
+            self._index += 1
+            self._advance_section(ch)
+
+            for keyword in self._matcher.step(ch):
+                start = self._index - len(keyword) + 1
+                if keyword == self.SECTION_TITLE:
+                    # 当前字符尚未加入_tail，去掉关键词的其余字符后即为标题前的内容
+                    if self.section_state == 'before' and self._tail[:start - self._index].rstrip().endswith('##'):
+                        self.section_state = 'header'
+                        self._header_newline = None
+                elif keyword == self.SECTION_END:
+                    if self.section_state == 'in' and start >= self._content_start:
+                        self.section_state = 'after'
+                else:
+                    self.found.add(keyword)
+                    if self.section_state == 'in' and start >= self._content_start:
+                        self.section_found.add(keyword)
+
+            self._tail = (self._tail + ch)[-self._TAIL_SIZE:]
+
+        return self._changed()
+
+    def _advance_section(self, ch: str) -> None:
+        """标题之后的空白中必须包含换行，小节内容从最后一个换行之后开始"""
+        if self.section_state != 'header':
+            return
+        if ch == '\n':
+            self._header_newline = self._index
+        elif not ch.isspace():
+            if self._header_newline is None:
+                # 标题与内容在同一行，不是有效的小节标题
+                self.section_state = 'before'
+            else:
+                self.section_state = 'in'
+                self._content_start = self._header_newline + 1
+
+    def _changed(self) -> bool:
+        if self.section_state in ('before', 'header') or (self.section_state == 'in' and not self.section_found):
+            return False
+        current = (self.recommendation, self.final)
+        if current == self._announced:
+            return False
+        self._announced = current
+        return True
+
+    @property
+    def recommendation(self) -> str:
+        """当前的投资建议"""
+        for recommendation, words in self.RECOMMENDATION_KEYWORDS:
+            if any(word in self.section_found for word in words):
+                return recommendation
+        return self.DEFAULT_RECOMMENDATION
+
+    @property
+    def final(self) -> bool:
+        """投资建议是否已经确定（最高优先级的建议已出现，或小节已结束）"""
+        if self.section_state == 'after':
+            return True
+        top_words = self.RECOMMENDATION_KEYWORDS[0][1]
+        return self.section_state == 'in' and any(word in self.section_found for word in top_words)
+
+    @property
+    def keyword_score(self) -> int:
+        """全文关键词带来的评分调整"""
+        for score, words in self.SCORE_KEYWORDS:
+            if any(word in self.found for word in words):
+                return score
+        return 0
+
+    @classmethod
+    def scan(cls, text: str) -> 'RecommendationTracker':
+        """
+        对完整文本进行匹配
+
+        Args:
+            text: 完整的分析内容
+
+        Returns:
+            跟踪器
+        """
+        tracker = cls()
+        tracker.feed(text)
+        return tracker
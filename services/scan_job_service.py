@@ -0,0 +1,403 @@
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from utils.logger import get_logger
+from services.scan_pipeline import ScanPipeline
+from services.top_k_collector import TopKCollector
+
+# 获取日志器
+logger = get_logger()
+
+class ScanJobService:
+    """
+    全市场扫描任务服务
+    将股票池切分为若干分片依次扫描，每个分片完成后将结果写入磁盘作为检查点，
+    服务重启或崩溃后可从未完成的分片继续，扫描不再依赖单个HTTP连接。
+    每个任务在内存中只有一份记录，状态和进度的修改都在该任务的锁内进行并落盘，
+    运行中的任务与取消、恢复操作不会互相覆盖
+    """
+
+    # 任务状态
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, scan_pipeline: ScanPipeline, a_stock_list_service=None, jobs_dir: Optional[str] = None,
+                 shard_size: int = 200, max_running_jobs: int = 1, shard_retries: int = 2):
+        """
+        初始化扫描任务服务
+
+        Args:
+            scan_pipeline: 扫描流水线
+            a_stock_list_service: A股股票列表服务，用于解析全市场或按条件筛选的股票池
+            jobs_dir: 任务数据目录，默认为项目下的data/jobs，可通过SCAN_JOBS_DIR环境变量配置
+            shard_size: 默认分片大小
+            max_running_jobs: 同时运行的任务数
+            shard_retries: 分片失败后的重试次数
+        """
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'jobs')
+        self.jobs_dir = jobs_dir or os.getenv('SCAN_JOBS_DIR') or default_dir
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+        self.scan_pipeline = scan_pipeline
+        self.a_stock_list_service = a_stock_list_service
+        self.shard_size = shard_size
+        self.shard_retries = shard_retries
+
+        self._run_semaphore = asyncio.Semaphore(max_running_jobs)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        logger.debug(f"初始化ScanJobService，任务目录: {self.jobs_dir}")
+
+    async def create_job(self, universe: Dict[str, Any], market_type: str = 'A', min_score: int = 0,
+                         shard_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        创建并启动扫描任务
+
+        Args:
+            universe: 股票池定义
+                {"type": "codes", "codes": [...]} 指定代码
+                {"type": "all"} 全部A股
+                {"type": "filter", "industry": [...], "area": [...], "market": [...]} 按条件筛选A股
+            market_type: 市场类型
+            min_score: 最低评分阈值
+            shard_size: 分片大小
+
+        Returns:
+            任务状态字典
+        """
+        codes = await self._resolve_universe(universe, market_type)
+        if not codes:
+            raise ValueError("股票池为空，请检查筛选条件")
+
+        shard_size = max(1, int(shard_size or self.shard_size))
+        now = self._now()
+        job = {
+            "job_id": uuid.uuid4().hex[:12],
+            "status": self.PENDING,
+            "market_type": market_type,
+            "min_score": min_score,
+            "universe": universe,
+            "codes": codes,
+            "shard_size": shard_size,
+            "shard_count": (len(codes) + shard_size - 1) // shard_size,
+            "completed_shards": [],
+            "processed": 0,
+            "errors": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+        os.makedirs(self._shard_dir(job['job_id']), exist_ok=True)
+        self._jobs[job['job_id']] = job
+        self._save_job(job)
+        logger.info(f"创建扫描任务 {job['job_id']}: {len(codes)} 只股票，{job['shard_count']} 个分片")
+
+        self._start(job['job_id'])
+        return self._public_view(job)
+
+    def resume_jobs(self) -> List[str]:
+        """
+        恢复未完成的任务（服务启动时调用）
+
+        Returns:
+            已恢复的任务ID列表
+        """
+        resumed = []
+        for job in self._iter_jobs():
+            if job['status'] in (self.PENDING, self.RUNNING):
+                self._start(job['job_id'])
+                resumed.append(job['job_id'])
+
+        if resumed:
+            logger.info(f"恢复未完成的扫描任务: {resumed}")
+        return resumed
+
+    async def resume_job(self, job_id: str) -> Dict[str, Any]:
+        """
+        手动恢复失败或已取消的任务，已完成的分片不会重复扫描
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            任务状态字典
+        """
+        job = await self._set_status(job_id, self.PENDING, expected=(self.FAILED, self.CANCELLED), error=None)
+        if job['status'] == self.PENDING:
+            self._start(job_id)
+        return self._public_view(job)
+
+    async def cancel_job(self, job_id: str) -> Dict[str, Any]:
+        """
+        取消任务，已完成分片的检查点会保留
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            任务状态字典
+        """
+        # 先在任务锁内记录取消状态（运行中的任务只会在分片检查点之间被取消），再停止后台任务
+        job = await self._set_status(job_id, self.CANCELLED, expected=(self.PENDING, self.RUNNING))
+        task = self._tasks.pop(job_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        return self._public_view(job)
+
+    async def shutdown(self) -> None:
+        """停止所有运行中的任务，任务状态保持不变以便下次启动时恢复"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """
+        获取任务进度
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            任务状态字典
+        """
+        return self._public_view(self._job(job_id))
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """
+        列出所有任务
+
+        Returns:
+            按创建时间倒序排列的任务状态列表
+        """
+        jobs = [self._public_view(self._jobs.get(job['job_id'], job)) for job in self._iter_jobs()]
+        return sorted(jobs, key=lambda job: job['created_at'], reverse=True)
+
+    def get_results(self, job_id: str, top: int = 100, min_score: Optional[int] = None) -> Dict[str, Any]:
+        """
+        汇总任务已完成分片的结果
+
+        Args:
+            job_id: 任务ID
+            top: 返回评分最高的股票数量
+            min_score: 最低评分阈值，默认使用任务创建时的阈值
+
+        Returns:
+            包含任务状态、排行榜和错误列表的字典
+        """
+        job = self._job(job_id)
+        min_score = job['min_score'] if min_score is None else min_score
+        collector = TopKCollector(max(1, top), min_score=min_score)
+        errors = []
+
+        for shard_index in sorted(job['completed_shards']):
+            shard = self._read_json(self._shard_path(job_id, shard_index))
+            for item in shard.get('results', []):
+                collector.push(item['stock_code'], item['score'], item)
+            errors.extend(shard.get('errors', []))
+
+        return {
+            **self._public_view(job),
+            "total_scanned": collector.total_seen,
+            "total_matched": collector.total_matched,
+            "items": [item for _, _, item in collector.snapshot()],
+            "failed_codes": errors,
+        }
+
+    def _start(self, job_id: str) -> None:
+        """在后台启动任务"""
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[job_id] = asyncio.create_task(self._run_job(job_id))
+
+    async def _run_job(self, job_id: str) -> None:
+        """逐个扫描未完成的分片并写入检查点"""
+        async with self._run_semaphore:
+            job = await self._set_status(job_id, self.RUNNING, expected=(self.PENDING, self.RUNNING))
+            if job['status'] != self.RUNNING:
+                # 排队期间已被取消
+                return
+            logger.info(f"开始执行扫描任务 {job_id}，已完成分片: {len(job['completed_shards'])}/{job['shard_count']}")
+
+            try:
+                for shard_index in range(job['shard_count']):
+                    if shard_index in job['completed_shards']:
+                        continue
+
+                    start = shard_index * job['shard_size']
+                    shard_codes = job['codes'][start:start + job['shard_size']]
+                    shard = await self._scan_shard(job, shard_index, shard_codes)
+
+                    # 检查点：分片结果在线程池中落盘后再更新任务进度
+                    async with self._lock(job_id):
+                        await asyncio.to_thread(self._write_json, self._shard_path(job_id, shard_index), shard)
+                        job['completed_shards'].append(shard_index)
+                        job['processed'] += len(shard_codes)
+                        job['errors'] += len(shard['errors'])
+                        self._save_job(job)
+
+                    logger.info(f"扫描任务 {job_id} 完成分片 {shard_index + 1}/{job['shard_count']}")
+
+                await self._set_status(job_id, self.COMPLETED, expected=(self.RUNNING,))
+                logger.info(f"扫描任务 {job_id} 完成，共扫描 {job['processed']} 只股票")
+
+            except asyncio.CancelledError:
+                logger.info(f"扫描任务 {job_id} 已停止，已完成分片: {len(job['completed_shards'])}/{job['shard_count']}")
+                raise
+            except Exception as e:
+                logger.error(f"扫描任务 {job_id} 失败: {str(e)}")
+                logger.exception(e)
+                await self._set_status(job_id, self.FAILED, expected=(self.RUNNING,), error=str(e))
+
+    async def _scan_shard(self, job: Dict[str, Any], shard_index: int, codes: List[str]) -> Dict[str, Any]:
+        """扫描单个分片，整体失败时重试"""
+        for attempt in range(self.shard_retries + 1):
+            try:
+                results, errors = [], []
+                async for result in self.scan_pipeline.run(codes, job['market_type']):
+                    if 'error' in result:
+                        errors.append({"stock_code": result['stock_code'], "error": result['error']})
+                    else:
+                        results.append(result['summary'])
+                return {"shard": shard_index, "codes": codes, "results": results, "errors": errors, "completed_at": self._now()}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= self.shard_retries:
+                    raise
+                logger.warning(f"扫描任务 {job['job_id']} 分片 {shard_index} 第{attempt + 1}次失败: {str(e)}，准备重试")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _resolve_universe(self, universe: Dict[str, Any], market_type: str) -> List[str]:
+        """将股票池定义解析为去重后的代码列表"""
+        universe_type = universe.get('type', 'codes')
+
+        if universe_type == 'codes':
+            codes = [str(code).strip() for code in universe.get('codes') or [] if str(code).strip()]
+            return list(dict.fromkeys(codes))
+
+        if market_type != 'A' or self.a_stock_list_service is None:
+            raise ValueError("全市场和条件筛选股票池仅支持A股")
+
+        stock_list = await self.a_stock_list_service.get_stock_list()
+        if universe_type == 'filter':
+            for field in ('industry', 'area', 'market'):
+                values = universe.get(field)
+                if values:
+                    stock_list = stock_list[stock_list[field].isin(values if isinstance(values, list) else [values])]
+        elif universe_type != 'all':
+            raise ValueError(f"不支持的股票池类型: {universe_type}")
+
+        return list(dict.fromkeys(stock_list['symbol'].astype(str)))
+
+    def _public_view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """任务状态的对外视图（不包含完整代码列表）"""
+        total = len(job['codes'])
+        view = {key: value for key, value in job.items() if key not in ('codes', 'completed_shards')}
+        view.update({
+            "total": total,
+            "completed_shard_count": len(job['completed_shards']),
+            "progress": round(job['processed'] / total * 100, 2) if total else 100.0,
+        })
+        return view
+
+    def _iter_jobs(self):
+        for job_id in os.listdir(self.jobs_dir):
+            path = self._job_path(job_id)
+            if os.path.exists(path):
+                try:
+                    yield self._read_json(path)
+                except Exception as e:
+                    logger.error(f"读取扫描任务 {job_id} 出错: {str(e)}")
+
+    def _lock(self, job_id: str) -> asyncio.Lock:
+        """获取任务的锁"""
+        lock = self._locks.get(job_id)
+        if lock is None:
+            lock = self._locks[job_id] = asyncio.Lock()
+        return lock
+
+    def _job(self, job_id: str) -> Dict[str, Any]:
+        """获取任务在内存中的唯一记录，首次访问时从磁盘加载"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._jobs[job_id] = self._load_job(job_id)
+        return job
+
+    async def _set_status(self, job_id: str, status: str, expected: tuple, **fields: Any) -> Dict[str, Any]:
+        """
+        在任务锁内修改任务状态并落盘
+
+        Args:
+            job_id: 任务ID
+            status: 新状态
+            expected: 允许转换的当前状态，当前状态不在其中时不做修改
+            fields: 同时更新的其他字段
+
+        Returns:
+            任务记录
+        """
+        async with self._lock(job_id):
+            job = self._job(job_id)
+            if job['status'] in expected:
+                job['status'] = status
+                job.update(fields)
+                self._save_job(job)
+            return job
+
+    def _load_job(self, job_id: str) -> Dict[str, Any]:
+        path = self._job_path(job_id)
+        if not os.path.exists(path):
+            raise KeyError(f"扫描任务不存在: {job_id}")
+        return self._read_json(path)
+
+    def _save_job(self, job: Dict[str, Any]) -> None:
+        job['updated_at'] = self._now()
+        self._write_json(self._job_path(job['job_id']), job)
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, os.path.basename(job_id), 'job.json')
+
+    def _shard_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, os.path.basename(job_id), 'shards')
+
+    def _shard_path(self, job_id: str, shard_index: int) -> str:
+        return os.path.join(self._shard_dir(job_id), f"{shard_index:05d}.json")
+
+    @staticmethod
+    def _read_json(path: str) -> Dict[str, Any]:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]) -> None:
+        """先写唯一命名的临时文件再替换，保证检查点文件要么完整要么不存在"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,198 @@
+import asyncio
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from utils.logger import get_logger
+from services.stock_data_provider import StockDataProvider
+from services.technical_indicator import TechnicalIndicator
+from services.stock_scorer import StockScorer
+
+# 获取日志器
+logger = get_logger()
+
+# 队列结束标记
+_DONE = object()
+
+class ScanPipeline:
+    """
+    批量扫描流水线
+    每只股票独立经过 获取数据 → 计算指标 → 评分 三个阶段，阶段之间使用有界队列连接，
+    任何一只股票完成即可产出结果；下游消费变慢时通过队列反压限制内存占用
+    """
+
+    def __init__(self, data_provider: StockDataProvider, indicator: TechnicalIndicator, scorer: StockScorer,
+                 fetch_concurrency: int = 5, compute_concurrency: int = 2, queue_size: int = 16,
+                 snapshot=None):
+        """
+        初始化扫描流水线
+
+        Args:
+            data_provider: 数据提供服务
+            indicator: 技术指标计算服务
+            scorer: 股票评分服务
+            fetch_concurrency: 数据获取阶段的并发数
+            compute_concurrency: 指标计算和评分阶段的并发数（在线程池中执行）
+            queue_size: 阶段间队列的容量
+            snapshot: 市场快照（MarketSnapshot），设置后每只股票的计算结果都会写入快照
+        """
+        self.data_provider = data_provider
+        self.indicator = indicator
+        self.scorer = scorer
+        self.fetch_concurrency = fetch_concurrency
+        self.compute_concurrency = compute_concurrency
+        self.queue_size = queue_size
+        self.snapshot = snapshot
+
+    async def run(self, stock_codes: List[str], market_type: str = 'A',
+                  start_date: Optional[str] = None, end_date: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        运行流水线
+
+        Args:
+            stock_codes: 股票代码列表
+            market_type: 市场类型
+            start_date: 开始日期
+            end_date: 结束日期
+
+        Returns:
+            异步生成器，按完成顺序产出每只股票的结果字典，包含stock_code，
+            成功时包含df、score、score_breakdown、recommendation，失败时包含error
+        """
+        codes = iter(stock_codes)
+        fetched_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        result_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def fetch_worker():
+            # 多个获取协程共享同一个代码迭代器
+            for code in codes:
+                try:
+                    df = await self.data_provider.get_stock_data(code, market_type, start_date, end_date)
+                except Exception as e:
+                    logger.error(f"获取股票 {code} 数据时出错: {str(e)}")
+                    df = None
+                await fetched_queue.put((code, df))
+
+        async def compute_worker():
+            while True:
+                item = await fetched_queue.get()
+                if item is _DONE:
+                    return
+                code, df = item
+                result = await asyncio.to_thread(self._process, code, df, market_type)
+                await result_queue.put(result)
+
+        async def coordinator():
+            fetchers = [asyncio.create_task(fetch_worker()) for _ in range(max(1, self.fetch_concurrency))]
+            computers = [asyncio.create_task(compute_worker()) for _ in range(max(1, self.compute_concurrency))]
+            try:
+                await asyncio.gather(*fetchers)
+                for _ in computers:
+                    await fetched_queue.put(_DONE)
+                await asyncio.gather(*computers)
+            except BaseException:
+                for task in fetchers + computers:
+                    task.cancel()
+                # 异常或取消时丢弃未消费的结果，确保消费方能收到结束标记
+                while not result_queue.empty():
+                    result_queue.get_nowait()
+                result_queue.put_nowait(_DONE)
+                raise
+            await result_queue.put(_DONE)
+
+        coordinator_task = asyncio.create_task(coordinator())
+        try:
+            while True:
+                result = await result_queue.get()
+                if result is _DONE:
+                    break
+                yield result
+            # 传递流水线内部的异常
+            await coordinator_task
+        finally:
+            coordinator_task.cancel()
+
+    def _process(self, code: str, df, market_type: str = 'A') -> Dict[str, Any]:
+        """
+        计算单只股票的技术指标和评分（在线程池中执行）
+
+        Args:
+            code: 股票代码
+            df: 原始行情数据
+            market_type: 市场类型
+
+        Returns:
+            结果字典
+        """
+        if df is None:
+            return {"stock_code": code, "error": f"获取股票 {code} 数据失败"}
+        if hasattr(df, 'error'):
+            return {"stock_code": code, "error": df.error}
+        if df.empty:
+            return {"stock_code": code, "error": f"获取到的股票 {code} 数据为空"}
+
+        try:
+            df_with_indicators = self.indicator.calculate_indicators(df)
+        except Exception as e:
+            logger.error(f"计算 {code} 技术指标时出错: {str(e)}")
+            return {"stock_code": code, "error": f"计算技术指标时出错: {str(e)}"}
+
+        try:
+            score_breakdown = self.scorer.calculate_score_breakdown(df_with_indicators)
+        except Exception as e:
+            logger.error(f"评分股票 {code} 时出错: {str(e)}")
+            return {"stock_code": code, "error": f"评分时出错: {str(e)}"}
+
+        score = score_breakdown.pop('score')
+        recommendation = self.scorer.get_recommendation(score)
+
+        if self.snapshot is not None:
+            self.snapshot.update(code, market_type, df_with_indicators, score, score_breakdown, recommendation)
+
+        return {
+            "stock_code": code,
+            "df": df_with_indicators,
+            "score": score,
+            "score_breakdown": score_breakdown,
+            "recommendation": recommendation,
+            "summary": summarize_scan_result(code, df_with_indicators, score, recommendation, score_breakdown)
+        }
+
+
+def summarize_scan_result(code: str, df, score: int, recommendation: str, score_breakdown: Dict[str, int]) -> Dict[str, Any]:
+    """
+    构建批量扫描中单只股票的基本结果（可直接JSON序列化）
+
+    Args:
+        code: 股票代码
+        df: 包含技术指标的DataFrame
+        score: 评分
+        recommendation: 投资建议
+        score_breakdown: 各组件得分明细
+
+    Returns:
+        单只股票的扫描结果字典
+    """
+    # 获取最新数据
+    latest_data = df.iloc[-1]
+    previous_data = df.iloc[-2] if len(df) > 1 else latest_data
+
+    # 价格变动绝对值
+    price_change_value = latest_data['Close'] - previous_data['Close']
+
+    # 获取涨跌幅
+    change_percent = latest_data.get('Change_pct')
+    if change_percent is not None:
+        change_percent = float(change_percent)
+
+    return {
+        "stock_code": code,
+        "score": score,
+        "score_breakdown": score_breakdown,
+        "recommendation": recommendation,
+        "price": float(latest_data.get('Close', 0)),
+        "price_change_value": float(price_change_value),  # 价格变动绝对值
+        "price_change": change_percent,  # 兼容旧版前端，传递涨跌幅
+        "change_percent": change_percent,  # 涨跌幅百分比，新字段
+        "rsi": float(latest_data.get('RSI', 0)) if 'RSI' in latest_data else None,
+        "ma_trend": "UP" if latest_data.get('MA5', 0) > latest_data.get('MA20', 0) else "DOWN",
+        "macd_signal": "BUY" if latest_data.get('MACD', 0) > latest_data.get('Signal', 0) else "SELL",
+        "volume_status": "HIGH" if latest_data.get('Volume_Ratio', 1) > 1.5 else ("LOW" if latest_data.get('Volume_Ratio', 1) < 0.5 else "NORMAL")
+    }
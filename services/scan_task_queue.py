@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+from utils.logger import get_logger
+from utils.broadcast import BroadcastStream
+
+# 获取日志器
+logger = get_logger()
+
+class _ScanTask:
+    """单个后台扫描任务"""
+
+    def __init__(self, key: str, summary: str):
+        self.key = key
+        self.summary = summary
+        self.stream: BroadcastStream[str] = BroadcastStream()
+        self.task: Optional[asyncio.Task] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.failed = False
+
+
+class ScanTaskQueue:
+    """
+    批量扫描任务队列
+
+    扫描请求按 (排序后的股票代码, 市场, 最低评分, 输出参数, AI配置) 归一化后去重：
+    相同的扫描只在后台运行一次，后来的请求订阅正在运行任务的输出流（先重放已有输出，再跟随实时输出），
+    或直接获取已完成任务缓存的结果，避免重复的数据获取和AI调用
+    """
+
+    def __init__(self, max_running: int = 2, result_ttl: float = 300, max_finished: int = 32):
+        """
+        初始化扫描任务队列
+
+        Args:
+            max_running: 同时运行的扫描任务数，超出的任务排队等待
+            result_ttl: 已完成任务的结果缓存时间（秒）
+            max_finished: 最多保留的已完成任务数
+        """
+        self.max_running = max_running
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self._tasks: Dict[str, _ScanTask] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        logger.debug(f"初始化ScanTaskQueue，最大并行任务数: {max_running}，结果缓存时间: {result_ttl}秒")
+
+    @staticmethod
+    def make_key(stock_codes: List[str], market_type: str, min_score: int = 0, **options: Any) -> str:
+        """
+        生成归一化的扫描任务键
+
+        Args:
+            stock_codes: 股票代码列表（顺序无关）
+            market_type: 市场类型
+            min_score: 最低评分阈值
+            options: 其他影响输出的参数，如top_k、stream、AI接口地址和模型
+
+        Returns:
+            任务键
+        """
+        payload = json.dumps({
+            "stock_codes": sorted({code.strip() for code in stock_codes}),
+            "market_type": market_type,
+            "min_score": min_score,
+            "options": options,
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    async def subscribe(self, key: str, scan_factory: Callable[[], AsyncIterator[str]],
+                        summary: str = '') -> AsyncGenerator[str, None]:
+        """
+        订阅扫描任务的输出，相同任务键的扫描只运行一次
+
+        任务在后台运行，与订阅者的连接无关：订阅者断开不会中止任务，其他订阅者仍能收到完整输出
+
+        Args:
+            key: 任务键，通过make_key生成
+            scan_factory: 创建扫描输出生成器的函数，仅在需要启动新任务时调用
+            summary: 任务描述，用于日志
+
+        Returns:
+            异步生成器，生成扫描输出
+        """
+        self._purge()
+
+        scan_task = self._tasks.get(key)
+        if scan_task is None:
+            scan_task = _ScanTask(key, summary)
+            scan_task.task = asyncio.create_task(self._run(scan_task, scan_factory))
+            self._tasks[key] = scan_task
+            logger.info(f"启动扫描任务 {key[:12]}: {summary}")
+        elif scan_task.finished_at is None:
+            logger.info(f"订阅运行中的扫描任务 {key[:12]}，已输出 {len(scan_task.stream.items)} 条消息")
+        else:
+            logger.info(f"复用已完成扫描任务 {key[:12]} 的结果")
+
+        async for item in scan_task.stream.subscribe():
+            yield item
+
+    async def _run(self, scan_task: _ScanTask, scan_factory: Callable[[], AsyncIterator[str]]) -> None:
+        """在后台运行扫描任务，并将输出发布到广播流"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_running)
+
+        try:
+            async with self._semaphore:
+                async for chunk in scan_factory():
+                    # 扫描内部捕获异常后以错误消息结束，输出照常转发，但任务按失败处理
+                    if not scan_task.failed and self._is_error(chunk):
+                        scan_task.failed = True
+                    scan_task.stream.publish(chunk)
+            scan_task.stream.close()
+        except asyncio.CancelledError:
+            scan_task.failed = True
+            scan_task.stream.close(RuntimeError("扫描任务已取消"))
+            raise
+        except Exception as e:
+            logger.error(f"扫描任务 {scan_task.key[:12]} 出错: {str(e)}")
+            logger.exception(e)
+            scan_task.failed = True
+            scan_task.stream.close(e)
+        finally:
+            scan_task.finished_at = time.time()
+            # 失败的任务不缓存结果，后续请求重新扫描
+            if scan_task.failed and self._tasks.get(scan_task.key) is scan_task:
+                del self._tasks[scan_task.key]
+
+    @staticmethod
+    def _is_error(chunk: str) -> bool:
+        """
+        判断输出是否为整个扫描的错误消息
+
+        单只股票的错误消息带有stock_code，属于扫描的正常结果，不使扫描失败
+        """
+        if '"error"' not in chunk:
+            return False
+        try:
+            data = json.loads(chunk)
+        except (TypeError, ValueError):
+            return False
+        return isinstance(data, dict) and 'error' in data and 'stock_code' not in data
+
+    def _purge(self) -> None:
+        """清理过期和超出数量的已完成任务"""
+        now = time.time()
+        finished = sorted(
+            (t for t in self._tasks.values() if t.finished_at is not None),
+            key=lambda t: t.finished_at
+        )
+        excess = len(finished) - self.max_finished
+        for index, scan_task in enumerate(finished):
+            if index < excess or now - scan_task.finished_at > self.result_ttl:
+                del self._tasks[scan_task.key]
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取任务队列状态
+
+        Returns:
+            运行中、已完成任务数及订阅者数
+        """
+        running = [t for t in self._tasks.values() if t.finished_at is None]
+        return {
+            "running": len(running),
+            "finished": len(self._tasks) - len(running),
+            "subscribers": sum(t.stream.subscriber_count for t in self._tasks.values()),
+        }
+
+    async def shutdown(self) -> None:
+        """取消所有运行中的扫描任务"""
+        tasks = [t.task for t in self._tasks.values() if t.task is not None and not t.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -0,0 +1,397 @@
+import ast
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Union
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+# 默认评分规则（与原硬编码的评分逻辑等价）
+# 每个组件内的规则按顺序匹配，命中第一条即得分；组件之间得分累加
+DEFAULT_SCORING_RULES: Dict[str, Any] = {
+    "name": "default",
+    "components": [
+        {
+            "name": "ma",
+            "label": "移动平均线",
+            "rules": [
+                "MA5 > MA20 > MA60 -> 25",  # 短期、中期和长期均线呈多头排列
+                "MA5 > MA20 -> 15",         # 短期均线在中期均线之上
+                "Close > MA20 -> 10",       # 股价在中期均线之上
+            ]
+        },
+        {
+            "name": "rsi",
+            "label": "RSI",
+            "rules": [
+                "45 <= RSI <= 55 -> 15",    # RSI在中间区域，可能即将爆发
+                "55 < RSI < 70 -> 25",      # RSI在强势区域但未超买
+                "30 < RSI < 45 -> 10",      # RSI在弱势区域但未超卖
+                "RSI >= 70 -> 5",           # RSI超买
+                "RSI <= 30 -> 15",          # RSI超卖
+            ]
+        },
+        {
+            "name": "macd",
+            "label": "MACD",
+            "rules": [
+                "MACD > Signal -> 20",
+            ]
+        },
+        {
+            "name": "volume",
+            "label": "成交量",
+            "rules": [
+                "Volume_Ratio > 1.5 -> 30",
+                "Volume_Ratio > 1 -> 15",
+            ]
+        }
+    ],
+    # 投资建议阈值，按min_score从高到低匹配
+    "recommendations": [
+        {"min_score": 80, "label": "强烈推荐"},
+        {"min_score": 70, "label": "推荐"},
+        {"min_score": 60, "label": "谨慎推荐"},
+        {"min_score": 40, "label": "观望"},
+        {"min_score": 20, "label": "不推荐"},
+    ],
+    "default_recommendation": "强烈不推荐"
+}
+
+# 规则表达式中允许使用的函数
+_ALLOWED_FUNCTIONS: Dict[str, Callable] = {
+    'abs': np.abs,
+    'min': np.minimum,
+    'max': np.maximum,
+}
+
+_COMPARE_OPS: Dict[type, Callable] = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.In: lambda left, right: np.isin(left, right),
+    ast.NotIn: lambda left, right: ~np.isin(left, right),
+}
+
+_BINARY_OPS: Dict[type, Callable] = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+
+
+class RuleExpression:
+    """
+    编译后的规则表达式
+
+    表达式使用Python语法的安全子集（比较、and/or/not、四则运算、常量），
+    编译后可对整列数据（一维或二维数组）一次性求值，返回布尔掩码或数值数组
+    """
+
+    def __init__(self, source: str):
+        """
+        编译规则表达式
+
+        Args:
+            source: 表达式文本，如 "MA5 > MA20 > MA60"
+        """
+        self.source = source
+        self.columns: Set[str] = set()
+
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"规则表达式语法错误: {source} ({e.msg})")
+
+        self._evaluator = self._compile(tree.body)
+
+    def __call__(self, namespace: Mapping[str, Any]) -> Any:
+        """
+        在给定的数据上对表达式求值
+
+        Args:
+            namespace: 列名到数组的映射
+
+        Returns:
+            求值结果（numpy数组或标量）
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._evaluator(namespace)
+
+    def __repr__(self) -> str:
+        return f"RuleExpression({self.source!r})"
+
+    def _compile(self, node: ast.AST) -> Callable[[Mapping[str, Any]], Any]:
+        """将AST节点编译为求值函数"""
+        if isinstance(node, ast.BoolOp):
+            operands = [self._compile(value) for value in node.values]
+            reducer = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+
+            def eval_bool(ns):
+                result = operands[0](ns)
+                for operand in operands[1:]:
+                    result = reducer(result, operand(ns))
+                return result
+            return eval_bool
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, ast.Not):
+                return lambda ns: np.logical_not(operand(ns))
+            if isinstance(node.op, ast.USub):
+                return lambda ns: np.negative(operand(ns))
+            if isinstance(node.op, ast.UAdd):
+                return operand
+
+        if isinstance(node, ast.Compare):
+            # 支持链式比较，如 a > b > c 等价于 a > b and b > c
+            operands = [self._compile(node.left)] + [self._compile(c) for c in node.comparators]
+            ops = []
+            for op in node.ops:
+                if type(op) not in _COMPARE_OPS:
+                    raise ValueError(f"规则表达式不支持的比较运算: {self.source}")
+                ops.append(_COMPARE_OPS[type(op)])
+
+            def eval_compare(ns):
+                values = [operand(ns) for operand in operands]
+                result = ops[0](values[0], values[1])
+                for i in range(1, len(ops)):
+                    result = np.logical_and(result, ops[i](values[i], values[i + 1]))
+                return result
+            return eval_compare
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            func = _BINARY_OPS[type(node.op)]
+            return lambda ns: func(left(ns), right(ns))
+
+        if isinstance(node, ast.Name):
+            name = node.id
+            self.columns.add(name)
+
+            def eval_name(ns):
+                try:
+                    return ns[name]
+                except KeyError:
+                    raise KeyError(f"规则表达式引用了不存在的字段: {name}")
+            return eval_name
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            value = node.value
+            return lambda ns: value
+
+        if isinstance(node, (ast.List, ast.Tuple)):
+            items = []
+            for elt in node.elts:
+                if not isinstance(elt, ast.Constant):
+                    raise ValueError(f"规则表达式的列表中只能包含常量: {self.source}")
+                items.append(elt.value)
+            return lambda ns: items
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _ALLOWED_FUNCTIONS and not node.keywords:
+            func = _ALLOWED_FUNCTIONS[node.func.id]
+            args = [self._compile(arg) for arg in node.args]
+            return lambda ns: func(*[arg(ns) for arg in args])
+
+        raise ValueError(f"规则表达式包含不支持的语法: {self.source}")
+
+
+def compile_expression(source: str) -> RuleExpression:
+    """
+    编译规则表达式
+
+    Args:
+        source: 表达式文本
+
+    Returns:
+        编译后的RuleExpression
+    """
+    return RuleExpression(source)
+
+
+def to_namespace(data: Union[pd.DataFrame, Mapping[str, Any]], columns: Set[str]) -> Dict[str, Any]:
+    """
+    将DataFrame或列映射转换为规则求值所需的命名空间
+
+    Args:
+        data: DataFrame（每行一个样本），或字段名到数组/DataFrame面板的映射
+        columns: 需要的字段名
+
+    Returns:
+        字段名到numpy数组的字典
+    """
+    namespace = {}
+    for column in columns:
+        if column not in data:
+            raise KeyError(f"缺少评分所需的字段: {column}")
+        value = data[column]
+        namespace[column] = value.to_numpy() if isinstance(value, (pd.Series, pd.DataFrame)) else np.asarray(value)
+    return namespace
+
+
+class ScoringRuleEngine:
+    """
+    声明式评分规则引擎
+
+    将评分规则配置编译为向量化表达式，对整个股票池（或整段历史）一次性求值，
+    并返回各评分组件的得分明细
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Any]] = None):
+        """
+        初始化评分规则引擎
+
+        Args:
+            rules: 评分规则配置，为空时使用默认规则
+        """
+        self.rules = rules or DEFAULT_SCORING_RULES
+        self.name = self.rules.get('name', 'custom')
+        self.components = [self._compile_component(c) for c in self.rules.get('components', [])]
+
+        if not self.components:
+            raise ValueError("评分规则中没有定义任何评分组件")
+
+        # 投资建议阈值按从高到低排序
+        self.recommendations = sorted(
+            ((float(r['min_score']), r['label']) for r in self.rules.get('recommendations', [])),
+            key=lambda x: x[0],
+            reverse=True
+        )
+        self.default_recommendation = self.rules.get('default_recommendation', '')
+
+        # 汇总所有规则引用的字段
+        self.required_columns: Set[str] = set()
+        for component in self.components:
+            for expression, _ in component['rules']:
+                self.required_columns |= expression.columns
+
+        logger.debug(f"评分规则 {self.name} 编译完成，组件: {[c['name'] for c in self.components]}")
+
+    @staticmethod
+    def _compile_component(component: Dict[str, Any]) -> Dict[str, Any]:
+        """编译单个评分组件"""
+        compiled_rules = []
+        for rule in component.get('rules', []):
+            if isinstance(rule, str):
+                # 紧凑写法: "条件 -> 分值"
+                separator = '->' if '->' in rule else '→'
+                if separator not in rule:
+                    raise ValueError(f"评分规则缺少分值: {rule}")
+                condition, score = rule.rsplit(separator, 1)
+                score = float(score.strip().lstrip('+'))
+            else:
+                condition, score = rule['when'], float(rule['score'])
+            compiled_rules.append((compile_expression(condition), score))
+
+        return {
+            'name': component['name'],
+            'label': component.get('label', component['name']),
+            'rules': compiled_rules
+        }
+
+    def evaluate(self, data: Union[pd.DataFrame, Mapping[str, Any]]) -> Dict[str, np.ndarray]:
+        """
+        对数据进行向量化评分
+
+        Args:
+            data: DataFrame（每行一个样本），或字段名到等形状数组/面板的映射
+
+        Returns:
+            字典，键为组件名称和'score'（总分），值为对应形状的得分数组
+        """
+        namespace = to_namespace(data, self.required_columns)
+        shape = np.broadcast_shapes(*(np.shape(v) for v in namespace.values()))
+
+        breakdown = {}
+        total = np.zeros(shape, dtype=float)
+        for component in self.components:
+            conditions = [np.broadcast_to(np.asarray(expr(namespace), dtype=bool), shape) for expr, _ in component['rules']]
+            scores = [score for _, score in component['rules']]
+            # 按顺序匹配，命中第一条规则即得分
+            component_score = np.select(conditions, scores, default=0.0)
+            breakdown[component['name']] = component_score
+            total = total + component_score
+
+        breakdown['score'] = total
+        return breakdown
+
+    def score_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        对DataFrame的每一行评分
+
+        Args:
+            df: 包含技术指标的DataFrame
+
+        Returns:
+            与df索引一致的DataFrame，包含各组件得分列和score总分列
+        """
+        breakdown = self.evaluate(df)
+        return pd.DataFrame(breakdown, index=df.index).astype(int)
+
+    def recommend(self, scores: Any) -> np.ndarray:
+        """
+        向量化地根据评分获取投资建议
+
+        Args:
+            scores: 评分数组
+
+        Returns:
+            投资建议数组
+        """
+        scores = np.asarray(scores, dtype=float)
+        conditions = [scores >= threshold for threshold, _ in self.recommendations]
+        labels = [label for _, label in self.recommendations]
+        return np.select(conditions, labels, default=self.default_recommendation) if conditions else np.full(scores.shape, self.default_recommendation)
+
+    def get_recommendation(self, score: float) -> str:
+        """
+        根据单个评分获取投资建议
+
+        Args:
+            score: 评分
+
+        Returns:
+            投资建议文本
+        """
+        for threshold, label in self.recommendations:
+            if score >= threshold:
+                return label
+        return self.default_recommendation
+
+    @property
+    def thresholds(self) -> List[float]:
+        """投资建议的评分阈值（从低到高）"""
+        return sorted(threshold for threshold, _ in self.recommendations)
+
+
+def load_scoring_rules(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    加载评分规则配置
+
+    Args:
+        path: 规则JSON文件路径，为空时读取SCORING_RULES_FILE环境变量
+
+    Returns:
+        评分规则配置，未配置或加载失败时返回默认规则
+    """
+    path = path or os.getenv('SCORING_RULES_FILE')
+    if not path:
+        return DEFAULT_SCORING_RULES
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        logger.info(f"从 {path} 加载评分规则: {rules.get('name', 'custom')}")
+        return rules
+    except Exception as e:
+        logger.error(f"加载评分规则文件 {path} 出错: {str(e)}，使用默认规则")
+        logger.exception(e)
+        return DEFAULT_SCORING_RULES
@@ -1,11 +1,19 @@
+import copy
 import json
 from datetime import datetime
-from typing import List, AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 from utils.logger import get_logger
 from services.stock_data_provider import StockDataProvider
+from services.history_store import HistoryStore
 from services.technical_indicator import TechnicalIndicator
 from services.stock_scorer import StockScorer
 from services.ai_analyzer import AIAnalyzer
+from services.ai_analysis_cache import AIAnalysisCache
+from services.top_k_collector import TopKCollector
+from services.scan_pipeline import ScanPipeline
+from services.analysis_result_cache import AnalysisResultCache
+from services.market_snapshot import MarketSnapshot
+from utils.async_utils import merge_async_generators
 
 # 获取日志器
 logger = get_logger()
@@ -16,7 +24,12 @@ class StockAnalyzerService:
     作为门面类协调数据提供、指标计算、评分和AI分析等组件
     """
     
-    def __init__(self, custom_api_url=None, custom_api_key=None, custom_api_model=None, custom_api_timeout=None):
+    # 批量扫描时进行AI分析的股票数量
+    AI_ANALYSIS_TOP_N = 5
+    
+    def __init__(self, custom_api_url=None, custom_api_key=None, custom_api_model=None, custom_api_timeout=None,
+                 result_cache: Optional[AnalysisResultCache] = None, market_snapshot: Optional[MarketSnapshot] = None,
+                 analysis_cache: Optional[AIAnalysisCache] = None):
         """
         初始化股票分析服务
         
@@ -25,20 +38,52 @@ class StockAnalyzerService:
             custom_api_key: 自定义API密钥
             custom_api_model: 自定义API模型
             custom_api_timeout: 自定义API超时时间
+            result_cache: 基本分析结果缓存，为空时不缓存
+            market_snapshot: 市场快照，设置后分析和扫描的计算结果都会写入快照
+            analysis_cache: AI分析结果缓存，为空时不缓存
         """
         # 初始化各个组件
-        self.data_provider = StockDataProvider()
+        self.data_provider = StockDataProvider(history_store=HistoryStore())
         self.indicator = TechnicalIndicator()
         self.scorer = StockScorer()
+        self.market_snapshot = market_snapshot
+        self.scan_pipeline = ScanPipeline(self.data_provider, self.indicator, self.scorer, snapshot=market_snapshot)
+        self.result_cache = result_cache
         self.ai_analyzer = AIAnalyzer(
             custom_api_url=custom_api_url,
             custom_api_key=custom_api_key,
             custom_api_model=custom_api_model,
-            custom_api_timeout=custom_api_timeout
+            custom_api_timeout=custom_api_timeout,
+            analysis_cache=analysis_cache
         )
         
         logger.info("初始化StockAnalyzerService完成")
     
+    def with_api_config(self, custom_api_url=None, custom_api_key=None, custom_api_model=None,
+                        custom_api_timeout=None, user=None) -> 'StockAnalyzerService':
+        """
+        获取使用请求级API配置的分析服务
+        
+        数据提供、指标计算、评分等组件及其缓存在各请求之间共享，只替换AI分析服务的API配置
+        
+        Args:
+            custom_api_url: 自定义API URL
+            custom_api_key: 自定义API密钥
+            custom_api_model: 自定义API模型
+            custom_api_timeout: 自定义API超时时间
+            user: 发起请求的用户标识，用于AI请求调度的公平分配
+            
+        Returns:
+            股票分析服务实例，没有自定义配置时返回当前实例
+        """
+        ai_analyzer = self.ai_analyzer.with_config(custom_api_url, custom_api_key, custom_api_model, custom_api_timeout, user)
+        if ai_analyzer is self.ai_analyzer:
+            return self
+        
+        service = copy.copy(self)
+        service.ai_analyzer = ai_analyzer
+        return service
+    
     async def analyze_stock(self, stock_code: str, market_type: str = 'A', stream: bool = False) -> AsyncGenerator[str, None]:
         """
         分析单只股票
@@ -54,108 +99,54 @@ class StockAnalyzerService:
         try:
             logger.info(f"开始分析股票: {stock_code}, 市场: {market_type}")
             
-            # 获取股票数据
-            df = await self.data_provider.get_stock_data(stock_code, market_type)
+            # 同一交易日内（新K线出现前）复用已计算的基本分析结果
+            params_key = self._result_params_key()
+            cached = self.result_cache.get(stock_code, market_type, params_key) if self.result_cache is not None else None
             
-            # 检查是否有错误
-            if hasattr(df, 'error'):
-                error_msg = df.error
-                logger.error(f"获取股票数据时出错: {error_msg}")
-                yield json.dumps({
-                    "stock_code": stock_code,
-                    "market_type": market_type,
-                    "error": error_msg,
-                    "status": "error"
-                })
-                return
-            
-            # 检查数据是否为空
-            if df.empty:
-                error_msg = f"获取到的股票 {stock_code} 数据为空"
-                logger.error(error_msg)
-                yield json.dumps({
-                    "stock_code": stock_code,
-                    "market_type": market_type,
-                    "error": error_msg,
-                    "status": "error"
-                })
-                return
-            
-            # 计算技术指标
-            df_with_indicators = self.indicator.calculate_indicators(df)
-            
-            # 计算评分
-            score = self.scorer.calculate_score(df_with_indicators)
-            recommendation = self.scorer.get_recommendation(score)
-            
-            # 获取最新数据
-            latest_data = df_with_indicators.iloc[-1]
-            previous_data = df_with_indicators.iloc[-2] if len(df_with_indicators) > 1 else latest_data
-            
-            # 价格变动绝对值
-            price_change_value = latest_data['Close'] - previous_data['Close']
-            
-            # 优先使用原始数据中的涨跌幅(Change_pct)
-            change_percent = latest_data.get('Change_pct')
-            
-            # 如果原始数据中没有涨跌幅，才进行计算
-            if change_percent is None and previous_data['Close'] != 0:
-                change_percent = (price_change_value / previous_data['Close']) * 100
-            
-            # 确定MA趋势
-            ma_short = latest_data.get('MA5', 0)
-            ma_medium = latest_data.get('MA20', 0)
-            ma_long = latest_data.get('MA60', 0)
-            
-            if ma_short > ma_medium > ma_long:
-                ma_trend = "UP"
-            elif ma_short < ma_medium < ma_long:
-                ma_trend = "DOWN"
+            if cached is not None:
+                logger.info(f"命中基本分析结果缓存: {stock_code}, 最新K线: {cached['last_bar_date']}")
+                df_with_indicators = cached['df']
+                basic_result = {**cached['basic_result'], "analysis_date": datetime.now().strftime('%Y-%m-%d')}
             else:
-                ma_trend = "FLAT"
+                # 获取股票数据
+                df = await self.data_provider.get_stock_data(stock_code, market_type)
                 
-            # 确定MACD信号
-            macd = latest_data.get('MACD', 0)
-            signal = latest_data.get('Signal', 0)
-            
-            if macd > signal:
-                macd_signal = "BUY"
-            elif macd < signal:
-                macd_signal = "SELL"
-            else:
-                macd_signal = "HOLD"
+                # 检查是否有错误
+                if hasattr(df, 'error'):
+                    error_msg = df.error
+                    logger.error(f"获取股票数据时出错: {error_msg}")
+                    yield json.dumps({
+                        "stock_code": stock_code,
+                        "market_type": market_type,
+                        "error": error_msg,
+                        "status": "error"
+                    })
+                    return
                 
-            # 确定成交量状态
-            volume = latest_data.get('Volume', 0)
-            volume_ma = latest_data.get('Volume_MA', 0)
-            
-            if volume > volume_ma * 1.5:
-                volume_status = "HIGH"
-            elif volume < volume_ma * 0.5:
-                volume_status = "LOW"
-            else:
-                volume_status = "NORMAL"
+                # 检查数据是否为空
+                if df.empty:
+                    error_msg = f"获取到的股票 {stock_code} 数据为空"
+                    logger.error(error_msg)
+                    yield json.dumps({
+                        "stock_code": stock_code,
+                        "market_type": market_type,
+                        "error": error_msg,
+                        "status": "error"
+                    })
+                    return
                 
-            # 当前分析日期
-            analysis_date = datetime.now().strftime('%Y-%m-%d')
-            
-            # 生成基本分析结果
-            basic_result = {
-                "stock_code": stock_code,
-                "market_type": market_type,
-                "analysis_date": analysis_date,
-                "score": score,
-                "price": latest_data['Close'],
-                "price_change_value": price_change_value,  # 价格变动绝对值
-                "price_change": change_percent,  # 兼容旧版前端，传递涨跌幅
-                "change_percent": change_percent,  # 涨跌幅百分比，新字段
-                "ma_trend": ma_trend,
-                "rsi": latest_data.get('RSI', 0),
-                "macd_signal": macd_signal,
-                "volume_status": volume_status,
-                "recommendation": recommendation,
-                "ai_analysis": ""
-            }
+                # 计算技术指标
+                df_with_indicators = self.indicator.calculate_indicators(df)
+                basic_result = self._build_basic_result(df_with_indicators, stock_code, market_type)
+                
+                if self.market_snapshot is not None:
+                    self.market_snapshot.update(
+                        stock_code, market_type, df_with_indicators, basic_result['score'],
+                        basic_result['score_breakdown'], basic_result['recommendation']
+                    )
+                
+                if self.result_cache is not None:
+                    self.result_cache.put(stock_code, market_type, params_key, basic_result, df_with_indicators)
             
             # 输出基本分析结果
             logger.info(f"基本分析结果: {json.dumps(basic_result)}")
@@ -173,15 +164,112 @@ class StockAnalyzerService:
             logger.exception(e)
             yield json.dumps({"error": error_msg})
     
-    async def scan_stocks(self, stock_codes: List[str], market_type: str = 'A', min_score: int = 0, stream: bool = False) -> AsyncGenerator[str, None]:
+    def _result_params_key(self) -> str:
+        """影响基本分析结果的参数（指标参数和评分规则）对应的缓存键"""
+        return AnalysisResultCache.params_key(self.indicator.params, self.scorer.engine.rules)
+    
+    def _build_basic_result(self, df_with_indicators, stock_code: str, market_type: str) -> Dict[str, Any]:
+        """
+        根据包含技术指标的数据生成基本分析结果
+        
+        Args:
+            df_with_indicators: 包含技术指标的DataFrame
+            stock_code: 股票代码
+            market_type: 市场类型
+            
+        Returns:
+            基本分析结果字典
+        """
+        # 计算评分及各组件得分明细
+        score_breakdown = self.scorer.calculate_score_breakdown(df_with_indicators)
+        score = score_breakdown.pop('score')
+        recommendation = self.scorer.get_recommendation(score)
+        
+        # 获取最新数据
+        latest_data = df_with_indicators.iloc[-1]
+        previous_data = df_with_indicators.iloc[-2] if len(df_with_indicators) > 1 else latest_data
+        
+        # 价格变动绝对值
+        price_change_value = latest_data['Close'] - previous_data['Close']
+        
+        # 优先使用原始数据中的涨跌幅(Change_pct)
+        change_percent = latest_data.get('Change_pct')
+        
+        # 如果原始数据中没有涨跌幅，才进行计算
+        if change_percent is None and previous_data['Close'] != 0:
+            change_percent = (price_change_value / previous_data['Close']) * 100
+        
+        # 确定MA趋势
+        ma_short = latest_data.get('MA5', 0)
+        ma_medium = latest_data.get('MA20', 0)
+        ma_long = latest_data.get('MA60', 0)
+        
+        if ma_short > ma_medium > ma_long:
+            ma_trend = "UP"
+        elif ma_short < ma_medium < ma_long:
+            ma_trend = "DOWN"
+        else:
+            ma_trend = "FLAT"
+            
+        # 确定MACD信号
+        macd = latest_data.get('MACD', 0)
+        signal = latest_data.get('Signal', 0)
+        
+        if macd > signal:
+            macd_signal = "BUY"
+        elif macd < signal:
+            macd_signal = "SELL"
+        else:
+            macd_signal = "HOLD"
+            
+        # 确定成交量状态
+        volume = latest_data.get('Volume', 0)
+        volume_ma = latest_data.get('Volume_MA', 0)
+        
+        if volume > volume_ma * 1.5:
+            volume_status = "HIGH"
+        elif volume < volume_ma * 0.5:
+            volume_status = "LOW"
+        else:
+            volume_status = "NORMAL"
+            
+        # 当前分析日期
+        analysis_date = datetime.now().strftime('%Y-%m-%d')
+        
+        # 生成基本分析结果
+        return {
+            "stock_code": stock_code,
+            "market_type": market_type,
+            "analysis_date": analysis_date,
+            "score": score,
+            "score_breakdown": score_breakdown,
+            "price": latest_data['Close'],
+            "price_change_value": price_change_value,  # 价格变动绝对值
+            "price_change": change_percent,  # 兼容旧版前端，传递涨跌幅
+            "change_percent": change_percent,  # 涨跌幅百分比，新字段
+            "ma_trend": ma_trend,
+            "rsi": latest_data.get('RSI', 0),
+            "macd_signal": macd_signal,
+            "volume_status": volume_status,
+            "recommendation": recommendation,
+            "ai_analysis": ""
+        }
+    
+    async def scan_stocks(self, stock_codes: List[str], market_type: str = 'A', min_score: int = 0, stream: bool = False,
+                          top_k: Optional[int] = None, leaderboard_interval: int = 50) -> AsyncGenerator[str, None]:
         """
         批量扫描股票
         
+        每只股票独立经过 获取数据 → 计算指标 → 评分 的流水线，完成即输出结果；
+        由有界的Top-K收集器维护排行榜，并据此对评分最高的股票进行AI分析
+        
         Args:
             stock_codes: 股票代码列表
             market_type: 市场类型
             min_score: 最低评分阈值
             stream: 是否使用流式响应
+            top_k: 排行榜保留的股票数量，默认为AI分析的股票数量
+            leaderboard_interval: 每处理多少只股票发送一次临时排行榜
             
         Returns:
             异步生成器，生成扫描结果的JSON字符串
@@ -197,88 +285,145 @@ class StockAnalyzerService:
                 "min_score": min_score
             })
             
-            # 批量获取股票数据
-            stock_data_dict = await self.data_provider.get_multiple_stocks_data(stock_codes, market_type)
+            # 排行榜至少要覆盖需要AI分析的股票
+            collector = TopKCollector(max(top_k or 0, self.AI_ANALYSIS_TOP_N), min_score=min_score)
+            processed = 0
             
-            # 计算技术指标
-            stock_with_indicators = {}
-            for code, df in stock_data_dict.items():
-                try:
-                    stock_with_indicators[code] = self.indicator.calculate_indicators(df)
-                except Exception as e:
-                    logger.error(f"计算 {code} 技术指标时出错: {str(e)}")
+            # 每只股票独立流经 获取 → 指标 → 评分 流水线，完成一只即输出一只
+            async for result in self.scan_pipeline.run(stock_codes, market_type):
+                code = result['stock_code']
+                processed += 1
+                
+                if 'error' in result:
                     # 发送错误状态
                     yield json.dumps({
                         "stock_code": code,
-                        "error": f"计算技术指标时出错: {str(e)}",
+                        "error": result['error'],
                         "status": "error"
                     })
+                    continue
+                
+                score = result['score']
+                
+                # 仅入榜的股票保留指标数据，用于后续AI分析
+                collector.push(code, score, (result['recommendation'], result['df']))
+                
+                # 发送股票基本信息和评分
+                yield json.dumps({
+                    **result['summary'],
+                    "status": "completed" if score < min_score else "waiting"
+                })
+                
+                # 定期发送临时排行榜
+                if leaderboard_interval and processed % leaderboard_interval == 0 and collector.changed:
+                    yield json.dumps(self._build_leaderboard(collector, top_k, provisional=True))
             
-            # 评分股票
-            results = self.scorer.batch_score_stocks(stock_with_indicators)
-            
-            # 过滤低于最低评分的股票
-            filtered_results = [r for r in results if r[1] >= min_score]
-            
-            # 为每只股票发送基本评分和推荐信息
-            for code, score, rec in results:
-                df = stock_with_indicators.get(code)
-                if df is not None and len(df) > 0:
-                    # 获取最新数据
-                    latest_data = df.iloc[-1]
-                    previous_data = df.iloc[-2] if len(df) > 1 else latest_data
-                    
-                    # 价格变动绝对值
-                    price_change_value = latest_data['Close'] - previous_data['Close']
-                    
-                    # 获取涨跌幅
-                    change_percent = latest_data.get('Change_pct')
-                    
-                    # 发送股票基本信息和评分
-                    yield json.dumps({
-                        "stock_code": code,
-                        "score": score,
-                        "recommendation": rec,
-                        "price": float(latest_data.get('Close', 0)),
-                        "price_change_value": float(price_change_value),  # 价格变动绝对值
-                        "price_change": change_percent,  # 兼容旧版前端，传递涨跌幅
-                        "change_percent": change_percent,  # 涨跌幅百分比，新字段
-                        "rsi": float(latest_data.get('RSI', 0)) if 'RSI' in latest_data else None,
-                        "ma_trend": "UP" if latest_data.get('MA5', 0) > latest_data.get('MA20', 0) else "DOWN",
-                        "macd_signal": "BUY" if latest_data.get('MACD', 0) > latest_data.get('MACD_Signal', 0) else "SELL",
-                        "volume_status": "HIGH" if latest_data.get('Volume_Ratio', 1) > 1.5 else ("LOW" if latest_data.get('Volume_Ratio', 1) < 0.5 else "NORMAL"),
-                        "status": "completed" if score < min_score else "waiting"
-                    })
+            leaderboard = collector.snapshot()
+            if top_k:
+                yield json.dumps(self._build_leaderboard(collector, top_k, provisional=False, entries=leaderboard))
             
             # 如果需要进一步分析，对评分较高的股票进行AI分析
-            if stream and filtered_results:
-                # 只分析前5只评分最高的股票，避免分析过多导致前端卡顿
-                top_stocks = filtered_results[:5]
-                
-                for stock_code, score, _ in top_stocks:
-                    df = stock_with_indicators.get(stock_code)
-                    if df is not None:
-                        # 输出正在分析的股票信息
-                        yield json.dumps({
-                            "stock_code": stock_code,
-                            "status": "analyzing"
-                        })
-                        
-                        # AI分析
-                        async for analysis_chunk in self.ai_analyzer.get_ai_analysis(df, stock_code, market_type, stream):
-                            yield analysis_chunk
+            if stream and leaderboard:
+                # 只分析评分最高的几只股票，避免分析过多导致前端卡顿
+                # 多只股票并发分析，各自带有stock_code的消息交错输出到同一个响应流
+                top_stocks = [(stock_code, df) for stock_code, _, (_, df) in leaderboard[:self.AI_ANALYSIS_TOP_N]]
+                batch_size = self.ai_analyzer.batch_size
+                if batch_size > 1 and len(top_stocks) > 1:
+                    # 每批股票合并为一次AI请求，回复按stock_code拆分输出
+                    analyses = [
+                        self._analyze_top_stocks(top_stocks[i:i + batch_size], market_type, stream)
+                        for i in range(0, len(top_stocks), batch_size)
+                    ]
+                else:
+                    analyses = [
+                        self._analyze_top_stock(df, stock_code, market_type, stream)
+                        for stock_code, df in top_stocks
+                    ]
+                async for analysis_chunk in merge_async_generators(analyses, self.ai_analyzer.max_concurrency):
+                    yield analysis_chunk
             
             # 输出扫描完成信息
             yield json.dumps({
                 "scan_completed": True,
-                "total_scanned": len(results),
-                "total_matched": len(filtered_results)
+                "total_scanned": collector.total_seen,
+                "total_matched": collector.total_matched
             })
             
-            logger.info(f"完成批量扫描 {len(stock_codes)} 只股票, 符合条件: {len(filtered_results)}")
+            logger.info(f"完成批量扫描 {len(stock_codes)} 只股票, 符合条件: {collector.total_matched}")
             
         except Exception as e:
             error_msg = f"批量扫描股票时出错: {str(e)}"
             logger.error(error_msg)
             logger.exception(e)
             yield json.dumps({"error": error_msg})
+    
+    async def _analyze_top_stock(self, df, stock_code: str, market_type: str, stream: bool) -> AsyncGenerator[str, None]:
+        """
+        对批量扫描中入选的单只股票进行AI分析
+        
+        Args:
+            df: 包含技术指标的DataFrame
+            stock_code: 股票代码
+            market_type: 市场类型
+            stream: 是否使用流式响应
+            
+        Returns:
+            异步生成器，生成分析结果的JSON字符串
+        """
+        # 输出正在分析的股票信息
+        yield json.dumps({
+            "stock_code": stock_code,
+            "status": "analyzing"
+        })
+        
+        # AI分析
+        async for analysis_chunk in self.ai_analyzer.get_ai_analysis(df, stock_code, market_type, stream):
+            yield analysis_chunk
+    
+    async def _analyze_top_stocks(self, stocks: List[Tuple[str, Any]], market_type: str, stream: bool) -> AsyncGenerator[str, None]:
+        """
+        在一次AI请求中分析批量扫描中入选的多只股票
+        
+        Args:
+            stocks: [(股票代码, 包含技术指标的DataFrame)] 列表
+            market_type: 市场类型
+            stream: 是否使用流式响应
+            
+        Returns:
+            异步生成器，生成分析结果的JSON字符串
+        """
+        # 输出正在分析的股票信息
+        for stock_code, _ in stocks:
+            yield json.dumps({
+                "stock_code": stock_code,
+                "status": "analyzing"
+            })
+        
+        # 批量AI分析
+        async for analysis_chunk in self.ai_analyzer.get_batch_ai_analysis(stocks, market_type, stream):
+            yield analysis_chunk
+    
+    def _build_leaderboard(self, collector: TopKCollector, top_k: Optional[int], provisional: bool, entries=None) -> Dict[str, Any]:
+        """
+        构建排行榜消息
+        
+        Args:
+            collector: Top-K收集器
+            top_k: 排行榜展示的股票数量
+            provisional: 是否为临时排行榜
+            entries: 已获取的榜单快照，为空时从收集器获取
+            
+        Returns:
+            排行榜消息字典
+        """
+        entries = entries if entries is not None else collector.snapshot()
+        return {
+            "stream_type": "leaderboard",
+            "provisional": provisional,
+            "total_scanned": collector.total_seen,
+            "total_matched": collector.total_matched,
+            "items": [
+                {"stock_code": code, "score": score, "recommendation": rec}
+                for code, score, (rec, _) in entries[:top_k or collector.k]
+            ]
+        }
@@ -1,8 +1,9 @@
 import pandas as pd
 from datetime import datetime, timedelta
 import asyncio
-from typing import Dict, List, Optional, Tuple, Any
+from typing import AsyncGenerator, Dict, List, Optional, Tuple, Any
 from utils.logger import get_logger
+from services.history_store import HistoryStore
 
 # 获取日志器
 logger = get_logger()
@@ -13,8 +14,14 @@ class StockDataProvider:
     负责获取股票、基金等金融产品的历史数据
     """
     
-    def __init__(self):
-        """初始化数据提供者服务"""
+    def __init__(self, history_store: Optional[HistoryStore] = None):
+        """
+        初始化数据提供者服务
+        
+        Args:
+            history_store: 行情历史存储，提供时获取成功的数据会同步写入本地缓存
+        """
+        self.history_store = history_store
         logger.debug("初始化StockDataProvider")
     
     async def get_stock_data(self, stock_code: str, market_type: str = 'A', 
@@ -33,13 +40,19 @@ class StockDataProvider:
             包含历史数据的DataFrame
         """
         # 使用线程池执行同步的akshare调用
-        return await asyncio.to_thread(
+        df = await asyncio.to_thread(
             self._get_stock_data_sync, 
             stock_code, 
             market_type, 
             start_date, 
             end_date
         )
+        
+        # 将获取成功的数据写入本地行情存储
+        if self.history_store is not None and not hasattr(df, 'error') and not df.empty:
+            await asyncio.to_thread(self.history_store.save, stock_code, market_type, df)
+        
+        return df
     
     def _get_stock_data_sync(self, stock_code: str, market_type: str = 'A', 
                            start_date: Optional[str] = None, 
@@ -278,6 +291,31 @@ class StockDataProvider:
         Returns:
             字典，键为股票代码，值为对应的DataFrame
         """
+        # 构建结果字典，过滤掉失败的请求
+        return {
+            code: df
+            async for code, df in self.iter_multiple_stocks_data(stock_codes, market_type, start_date, end_date, max_concurrency)
+            if df is not None
+        }
+    
+    async def iter_multiple_stocks_data(self, stock_codes: List[str], 
+                                      market_type: str = 'A',
+                                      start_date: Optional[str] = None, 
+                                      end_date: Optional[str] = None,
+                                      max_concurrency: int = 5) -> AsyncGenerator[Tuple[str, Optional[pd.DataFrame]], None]:
+        """
+        异步批量获取多只股票数据，按完成顺序逐个产出
+        
+        Args:
+            stock_codes: 股票代码列表
+            market_type: 市场类型，默认为'A'股
+            start_date: 开始日期，格式YYYYMMDD
+            end_date: 结束日期，格式YYYYMMDD
+            max_concurrency: 最大并发数，默认为5
+            
+        Returns:
+            异步生成器，生成(股票代码, DataFrame)元组，获取失败时DataFrame为None
+        """
         # 使用信号量控制并发数
         semaphore = asyncio.Semaphore(max_concurrency)
         
@@ -290,10 +328,13 @@ class StockDataProvider:
                     return code, None
         
         # 创建异步任务
-        tasks = [get_with_semaphore(code) for code in stock_codes]
-        
-        # 等待所有任务完成
-        results = await asyncio.gather(*tasks)
+        tasks = [asyncio.create_task(get_with_semaphore(code)) for code in stock_codes]
         
-        # 构建结果字典，过滤掉失败的请求
-        return {code: df for code, df in results if df is not None}
\ No newline at end of file
+        try:
+            # 谁先完成先产出谁
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # 消费方提前退出时取消尚未完成的任务
+            for task in tasks:
+                task.cancel()
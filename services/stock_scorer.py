@@ -1,6 +1,7 @@
 import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from utils.logger import get_logger
+from services.scoring_rules import ScoringRuleEngine, load_scoring_rules
 
 # 获取日志器
 logger = get_logger()
@@ -8,12 +9,18 @@ logger = get_logger()
 class StockScorer:
     """
     股票评分服务
-    负责根据技术指标计算股票的综合评分
+    负责根据技术指标计算股票的综合评分，评分规则由ScoringRuleEngine声明式配置
     """
     
-    def __init__(self):
-        """初始化股票评分服务"""
-        logger.debug("初始化StockScorer股票评分服务")
+    def __init__(self, rules: Optional[Dict[str, Any]] = None):
+        """
+        初始化股票评分服务
+        
+        Args:
+            rules: 评分规则配置，为空时从SCORING_RULES_FILE加载或使用默认规则
+        """
+        self.engine = ScoringRuleEngine(rules or load_scoring_rules())
+        logger.debug(f"初始化StockScorer股票评分服务，评分规则: {self.engine.name}")
     
     def calculate_score(self, df: pd.DataFrame) -> int:
         """
@@ -27,56 +34,37 @@ class StockScorer:
         """
         try:
             # 使用最新的数据点进行评分
-            latest = df.iloc[-1]
-            
-            # 初始得分为0
-            score = 0
-            
-            # 移动平均线评分（25分）
-            if latest['MA5'] > latest['MA20'] > latest['MA60']:
-                # 短期、中期和长期均线呈多头排列
-                score += 25
-            elif latest['MA5'] > latest['MA20']:
-                # 短期均线在中期均线之上
-                score += 15
-            elif latest['Close'] > latest['MA20']:
-                # 股价在中期均线之上
-                score += 10
-                
-            # RSI评分（25分）
-            rsi = latest['RSI']
-            if 45 <= rsi <= 55:
-                # RSI在中间区域，可能即将爆发
-                score += 15
-            elif 55 < rsi < 70:
-                # RSI在强势区域但未超买
-                score += 25
-            elif 30 < rsi < 45:
-                # RSI在弱势区域但未超卖
-                score += 10
-            elif rsi >= 70:
-                # RSI超买
-                score += 5
-            elif rsi <= 30:
-                # RSI超卖
-                score += 15
-                
-            # MACD得分（20分）
-            if latest['MACD'] > latest['Signal']:
-                score += 20
-                
-            # 成交量得分（30分）
-            if latest['Volume_Ratio'] > 1.5:
-                score += 30
-            elif latest['Volume_Ratio'] > 1:
-                score += 15
-                
-            return score
+            return int(self.engine.evaluate(df.iloc[[-1]])['score'][0])
             
         except Exception as e:
             logger.error(f"计算评分时出错: {str(e)}")
             logger.exception(e)
             raise
+    
+    def calculate_score_breakdown(self, df: pd.DataFrame) -> Dict[str, int]:
+        """
+        计算最新数据点的各组件得分明细
+        
+        Args:
+            df: 包含技术指标的DataFrame
+            
+        Returns:
+            字典，键为组件名称和'score'（总分），值为得分
+        """
+        breakdown = self.engine.evaluate(df.iloc[[-1]])
+        return {name: int(values[0]) for name, values in breakdown.items()}
+    
+    def score_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        向量化地对DataFrame中的每一行评分
+        
+        Args:
+            df: 包含技术指标的DataFrame（可以是单只股票的历史，也可以是多只股票的最新数据）
+            
+        Returns:
+            与df索引一致的DataFrame，包含各组件得分列和score总分列
+        """
+        return self.engine.score_frame(df)
             
     def get_recommendation(self, score: int) -> str:
         """
@@ -88,40 +76,53 @@ class StockScorer:
         Returns:
             投资建议文本
         """
-        if score >= 80:
-            return "强烈推荐"
-        elif score >= 70:
-            return "推荐"
-        elif score >= 60:
-            return "谨慎推荐"
-        elif score >= 40:
-            return "观望"
-        elif score >= 20:
-            return "不推荐"
-        else:
-            return "强烈不推荐"
+        return self.engine.get_recommendation(score)
             
     def batch_score_stocks(self, stock_dfs: Dict[str, pd.DataFrame]) -> List[Tuple[str, int, str]]:
         """
         批量评分多只股票
         
+        将所有股票的最新数据点合并为一张表，一次性向量化评分
+        
         Args:
             stock_dfs: 字典，键为股票代码，值为DataFrame
             
         Returns:
             评分结果列表，每项为(股票代码, 评分, 推荐)的三元组
         """
-        results = []
+        columns = sorted(self.engine.required_columns)
+        codes = []
+        latest_rows = []
         
         for stock_code, df in stock_dfs.items():
             try:
-                score = self.calculate_score(df)
-                recommendation = self.get_recommendation(score)
-                results.append((stock_code, score, recommendation))
+                latest_rows.append(df.iloc[-1][columns])
+                codes.append(stock_code)
             except Exception as e:
                 logger.error(f"评分股票 {stock_code} 时出错: {str(e)}")
+        
+        if not latest_rows:
+            return []
+        
+        # 逐列转换为数值，只跳过含有非数值字段的股票，不影响同批次的其他股票
+        raw = pd.DataFrame(latest_rows, index=codes, columns=columns)
+        latest = raw.apply(pd.to_numeric, errors='coerce').astype(float)
+        invalid = latest.isna() & raw.notna()
+        if invalid.values.any():
+            for stock_code, row in invalid[invalid.any(axis=1)].iterrows():
+                fields = ', '.join(column for column in columns if row[column])
+                logger.error(f"评分股票 {stock_code} 时出错: 字段不是数值: {fields}")
+            latest = latest[~invalid.any(axis=1)]
+            codes = list(latest.index)
+            if not codes:
+                return []
+        
+        scores = self.engine.evaluate(latest)['score'].astype(int)
+        recommendations = self.engine.recommend(scores)
+        
+        results = [(code, int(score), str(rec)) for code, score, rec in zip(codes, scores, recommendations)]
                 
         # 按评分降序排序
         results.sort(key=lambda x: x[1], reverse=True)
         
-        return results 
\ No newline at end of file
+        return results
@@ -0,0 +1,165 @@
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+from utils.logger import get_logger
+from utils.trading_calendar import current_trading_day
+from services.scoring_rules import compile_expression, to_namespace
+from services.market_snapshot import MarketSnapshot
+
+# 获取日志器
+logger = get_logger()
+
+class StockScreener:
+    """
+    条件选股服务
+
+    在市场快照（最新价格、指标和评分）与A股基础信息（名称、行业、地区、板块）关联后的表格上，
+    对筛选表达式进行向量化求值，并排序分页返回结果，全程不访问上游数据源
+    """
+
+    # A股基础信息中参与关联的字段
+    METADATA_COLUMNS = ['name', 'area', 'industry', 'market', 'list_date']
+
+    # 未指定返回字段时的默认字段
+    DEFAULT_COLUMNS = [
+        'stock_code', 'name', 'industry', 'price', 'change_percent', 'score', 'recommendation',
+        'RSI', 'MACD', 'Signal', 'Volume_Ratio', 'Volatility', 'last_bar_date'
+    ]
+
+    def __init__(self, snapshot: MarketSnapshot, a_stock_list_service=None):
+        """
+        初始化条件选股服务
+
+        Args:
+            snapshot: 市场快照
+            a_stock_list_service: A股股票列表服务，用于关联行业等基础信息
+        """
+        self.snapshot = snapshot
+        self.a_stock_list_service = a_stock_list_service
+        self._metadata: Optional[pd.DataFrame] = None
+        self._metadata_day = None
+        self._joined: Dict[str, Any] = {}
+
+        logger.debug("初始化StockScreener")
+
+    async def screen(self, expression: str = '', market_type: str = 'A', sort_by: str = 'score',
+                     ascending: bool = False, page: int = 1, page_size: int = 50,
+                     columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        按条件筛选股票
+
+        Args:
+            expression: 筛选表达式，如 "RSI < 30 and Volume_Ratio > 1.5 and industry == '银行'"，为空时返回全部
+            market_type: 市场类型
+            sort_by: 排序字段
+            ascending: 是否升序
+            page: 页码（从1开始）
+            page_size: 每页数量
+            columns: 返回的字段，为空时使用默认字段
+
+        Returns:
+            包含total、page、page_size、items和elapsed_ms的字典
+
+        Raises:
+            ValueError: 表达式语法错误、引用了不存在的字段、字段类型不匹配或排序字段不存在
+        """
+        started = time.perf_counter()
+        table = await self._get_table(market_type)
+
+        if expression and expression.strip():
+            compiled = compile_expression(expression)
+            missing = compiled.columns - set(table.columns)
+            if missing:
+                raise ValueError(f"筛选表达式引用了不存在的字段: {', '.join(sorted(missing))}")
+            try:
+                mask = np.broadcast_to(np.asarray(compiled(to_namespace(table, compiled.columns)), dtype=bool), (len(table),))
+            except TypeError as e:
+                # 字段类型与运算不匹配，如对文本字段做大小比较
+                raise ValueError(f"筛选表达式的字段类型不匹配: {str(e)}") from e
+            result = table[mask]
+        else:
+            result = table
+
+        if sort_by:
+            if sort_by not in result.columns:
+                raise ValueError(f"排序字段不存在: {sort_by}")
+            result = result.sort_values(sort_by, ascending=ascending, na_position='last', kind='stable')
+
+        page = max(1, page)
+        page_size = max(1, page_size)
+        page_rows = result.iloc[(page - 1) * page_size: page * page_size]
+
+        selected = [column for column in (columns or self.DEFAULT_COLUMNS) if column in page_rows.columns]
+        items = [self._to_item(row) for row in page_rows[selected].to_dict('records')]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"条件选股完成: {expression!r}, 市场: {market_type}, 命中 {len(result)}/{len(table)}，耗时 {elapsed_ms:.1f}ms")
+
+        return {
+            "market_type": market_type,
+            "expression": expression,
+            "total": int(len(result)),
+            "universe": int(len(table)),
+            "page": page,
+            "page_size": page_size,
+            "columns": selected,
+            "items": items,
+            "elapsed_ms": round(elapsed_ms, 2)
+        }
+
+    async def _get_table(self, market_type: str) -> pd.DataFrame:
+        """获取快照与基础信息关联后的表格，快照和基础信息未变化时复用上次结果"""
+        metadata = await self._get_metadata() if market_type == 'A' else None
+
+        cache_key = (market_type, self.snapshot.version, id(metadata))
+        cached = self._joined.get(market_type)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+
+        table = self.snapshot.get_table(market_type)
+        if metadata is not None and not metadata.empty:
+            table = table.merge(metadata, how='left', left_on='stock_code', right_index=True)
+
+        self._joined[market_type] = (cache_key, table)
+        return table
+
+    async def _get_metadata(self) -> Optional[pd.DataFrame]:
+        """获取A股基础信息（每个交易日只加载一次）"""
+        if self.a_stock_list_service is None:
+            return None
+
+        trading_day = current_trading_day('A')
+        if self._metadata_day == trading_day:
+            return self._metadata
+
+        try:
+            stock_list = await self.a_stock_list_service.get_stock_list()
+            columns = [column for column in self.METADATA_COLUMNS if column in stock_list.columns]
+            metadata = stock_list.assign(symbol=stock_list['symbol'].astype(str))
+            metadata = metadata.drop_duplicates('symbol').set_index('symbol')[columns]
+            self._metadata = metadata
+            self._metadata_day = trading_day
+        except Exception as e:
+            # 当天不再重试，避免每次筛选都访问上游
+            logger.error(f"加载A股基础信息时出错: {str(e)}")
+            logger.exception(e)
+            self._metadata_day = trading_day
+
+        return self._metadata
+
+    @staticmethod
+    def _to_item(row: Dict[str, Any]) -> Dict[str, Any]:
+        """将结果行转换为可JSON序列化的字典"""
+        item = {}
+        for key, value in row.items():
+            if isinstance(value, pd.Timestamp):
+                value = value.strftime('%Y-%m-%d')
+            elif isinstance(value, np.generic):
+                value = value.item()
+            if isinstance(value, float) and not np.isfinite(value):
+                value = None
+            elif value is pd.NaT or (not isinstance(value, (str, list, dict)) and pd.isna(value)):
+                value = None
+            item[key] = value
+        return item
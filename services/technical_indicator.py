@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from typing import Dict, Optional, Any
 from utils.logger import get_logger
@@ -55,8 +56,10 @@ class TechnicalIndicator:
             RSI序列
         """
         delta = series.diff()
-        gain = delta.where(delta > 0, 0)
-        loss = -delta.where(delta < 0, 0)
+        # 价格缺失的位置（如面板中的补齐部分）保持为NaN
+        valid = series.notna()
+        gain = delta.where(delta > 0, 0).where(valid)
+        loss = -delta.where(delta < 0, 0).where(valid)
         
         avg_gain = gain.rolling(window=period).mean()
         avg_loss = loss.rolling(window=period).mean()
@@ -110,7 +113,7 @@ class TechnicalIndicator:
         计算平均真实波幅(ATR)
         
         Args:
-            df: 包含High, Low, Close列的DataFrame
+            df: 包含High, Low, Close列的DataFrame（也可以是字段名到面板DataFrame的映射）
             period: 周期
             
         Returns:
@@ -124,7 +127,8 @@ class TechnicalIndicator:
         tr2 = abs(high - close.shift())
         tr3 = abs(low - close.shift())
         
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+        # fmax忽略NaN，与逐行取max(skipna)的结果一致，同时支持面板数据
+        tr = np.fmax(np.fmax(tr1, tr2), tr3)
         atr = tr.rolling(window=period).mean()
         
         return atr
@@ -143,44 +147,82 @@ class TechnicalIndicator:
             # 复制数据框
             result_df = df.copy()
             
-            # 移动平均线
-            for name, period in self.params['ma_periods'].items():
-                result_df[f'MA{period}'] = result_df['Close'].rolling(window=period).mean()
-            
-            # RSI
-            result_df['RSI'] = self.calculate_rsi(result_df['Close'], self.params['rsi_period'])
-            
-            # MACD
-            macd, signal, histogram = self.calculate_macd(result_df['Close'])
-            result_df['MACD'] = macd
-            result_df['Signal'] = signal
-            result_df['Histogram'] = histogram
-            
-            # 布林带
-            middle, upper, lower = self.calculate_bollinger_bands(
-                result_df['Close'], 
-                self.params['bollinger_period'], 
-                self.params['bollinger_std']
-            )
-            result_df['BB_Middle'] = middle
-            result_df['BB_Upper'] = upper
-            result_df['BB_Lower'] = lower
-            
-            # 成交量移动平均
-            result_df['Volume_MA'] = result_df['Volume'].rolling(window=self.params['volume_ma_period']).mean()
-            
-            # 成交量比率
-            result_df['Volume_Ratio'] = result_df['Volume'] / result_df['Volume_MA']
-            
-            # ATR
-            result_df['ATR'] = self.calculate_atr(result_df, self.params['atr_period'])
-            
-            # 波动率 (过去20天收盘价的标准差/均值)
-            result_df['Volatility'] = result_df['Close'].rolling(window=20).std() / result_df['Close'].rolling(window=20).mean() * 100
+            for name, values in self._compute_indicators(result_df).items():
+                result_df[name] = values
             
             return result_df
             
         except Exception as e:
             logger.error(f"计算技术指标时出错: {str(e)}")
             logger.exception(e)
-            raise 
\ No newline at end of file
+            raise
+    
+    def calculate_indicator_panels(self, panels: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        在行情面板上一次性计算所有股票、所有交易日的技术指标
+        
+        Args:
+            panels: 字段名到面板的映射，面板的每一列为一只股票，需包含High, Low, Close, Volume
+            
+        Returns:
+            字典，包含输入面板和各技术指标面板
+        """
+        try:
+            result = dict(panels)
+            result.update(self._compute_indicators(panels))
+            return result
+            
+        except Exception as e:
+            logger.error(f"计算技术指标面板时出错: {str(e)}")
+            logger.exception(e)
+            raise
+    
+    def _compute_indicators(self, data) -> Dict[str, Any]:
+        """
+        计算技术指标
+        
+        Args:
+            data: DataFrame（单只股票），或字段名到面板DataFrame的映射（多只股票）
+            
+        Returns:
+            按计算顺序排列的指标名称到指标序列（或面板）的字典
+        """
+        close = data['Close']
+        indicators = {}
+        
+        # 移动平均线
+        for name, period in self.params['ma_periods'].items():
+            indicators[f'MA{period}'] = close.rolling(window=period).mean()
+        
+        # RSI
+        indicators['RSI'] = self.calculate_rsi(close, self.params['rsi_period'])
+        
+        # MACD
+        macd, signal, histogram = self.calculate_macd(close)
+        indicators['MACD'] = macd
+        indicators['Signal'] = signal
+        indicators['Histogram'] = histogram
+        
+        # 布林带
+        middle, upper, lower = self.calculate_bollinger_bands(
+            close, 
+            self.params['bollinger_period'], 
+            self.params['bollinger_std']
+        )
+        indicators['BB_Middle'] = middle
+        indicators['BB_Upper'] = upper
+        indicators['BB_Lower'] = lower
+        
+        # 成交量移动平均
+        indicators['Volume_MA'] = data['Volume'].rolling(window=self.params['volume_ma_period']).mean()
+        
+        # 成交量比率
+        indicators['Volume_Ratio'] = data['Volume'] / indicators['Volume_MA']
+        
+        # ATR
+        indicators['ATR'] = self.calculate_atr(data, self.params['atr_period'])
+        
+        # 波动率 (过去20天收盘价的标准差/均值)
+        indicators['Volatility'] = close.rolling(window=20).std() / close.rolling(window=20).mean() * 100
+        
+        return indicators
@@ -0,0 +1,95 @@
+import heapq
+import itertools
+from typing import Any, List, Optional, Tuple
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+class TopKCollector:
+    """
+    流式Top-K收集器
+    基于有界小顶堆，在结果逐个到达时维护评分最高的K只股票，内存占用为O(K)
+    """
+
+    def __init__(self, k: int, min_score: float = 0):
+        """
+        初始化Top-K收集器
+
+        Args:
+            k: 保留的最高评分股票数量
+            min_score: 最低评分阈值，低于该分数的结果只计数不入榜
+        """
+        if k <= 0:
+            raise ValueError(f"k必须为正整数: {k}")
+
+        self.k = k
+        self.min_score = min_score
+
+        # 堆元素为(评分, -序号, 股票代码, 附加数据)，同分时先到达的优先保留
+        self._heap: List[Tuple[float, int, str, Any]] = []
+        self._counter = itertools.count()
+
+        # 统计信息
+        self.total_seen = 0
+        self.total_matched = 0
+        self._version = 0
+        self._snapshot_version = -1
+
+    def push(self, stock_code: str, score: float, payload: Any = None) -> bool:
+        """
+        加入一个评分结果
+
+        Args:
+            stock_code: 股票代码
+            score: 评分
+            payload: 附加数据（如推荐、指标DataFrame），仅在入榜时保留
+
+        Returns:
+            该结果当前是否在Top-K中
+        """
+        self.total_seen += 1
+        if score < self.min_score:
+            return False
+
+        self.total_matched += 1
+        entry = (score, -next(self._counter), stock_code, payload)
+
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            self._version += 1
+            return True
+
+        # 仅当新结果优于堆顶（当前第K名）时替换
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            self._version += 1
+            return True
+
+        return False
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def changed(self) -> bool:
+        """自上次调用snapshot以来榜单是否有变化"""
+        return self._version != self._snapshot_version
+
+    @property
+    def threshold(self) -> Optional[float]:
+        """进入榜单所需的最低评分，榜单未满时为None"""
+        if len(self._heap) < self.k:
+            return None
+        return self._heap[0][0]
+
+    def snapshot(self) -> List[Tuple[str, float, Any]]:
+        """
+        获取当前榜单
+
+        Returns:
+            按评分降序排列的(股票代码, 评分, 附加数据)列表
+        """
+        self._snapshot_version = self._version
+        ordered = sorted(self._heap, key=lambda entry: entry[:2], reverse=True)
+        return [(code, score, payload) for score, _, code, payload in ordered]
@@ -2,23 +2,72 @@ import asyncio
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from utils.logger import get_logger
+from utils.refresh_cache import RefreshingCache
+from utils.search_index import SearchIndex
+from utils.spot_table import SpotTable
 
 # 获取日志器
 logger = get_logger()
 
+class USStockTable(SpotTable):
+    """
+    美股行情表及其搜索索引
+
+    行按总市值从高到低排列，搜索结果中同等匹配程度的股票市值大的排在前面
+    """
+
+    NUMERIC_COLUMNS = ('price', 'price_change', 'open', 'high', 'low', 'pre_close', 'market_value', 'pe_ratio',
+                       'volume', 'turnover')
+    PERCENT_COLUMNS = ('price_change_percent',)
+    DETAIL_COLUMNS = ('name', 'symbol', 'price', 'price_change', 'price_change_percent', 'open', 'high', 'low',
+                      'pre_close', 'market_value', 'pe_ratio', 'volume', 'turnover')
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        构建行情表
+
+        Args:
+            df: 转换列名后的美股行情DataFrame
+        """
+        market_value = pd.to_numeric(df['market_value'], errors='coerce')
+        super().__init__(df.loc[market_value.sort_values(ascending=False, na_position='last', kind='stable').index]
+                         .reset_index(drop=True))
+
+        # 搜索结果只需要这几个字段
+        self.search_records: List[Dict[str, Any]] = [
+            {key: record[key] for key in ('name', 'symbol', 'price', 'market_value')} for record in self.records
+        ]
+
+        # 代码形如 105.AAPL，同时按去掉市场前缀的代码检索
+        self.index = SearchIndex([(symbol, symbol.split('.', 1)[-1], name)
+                                  for symbol, name in zip(self.df['symbol'], self.df['name'])])
+
+
 class USStockServiceAsync:
     """
     美股服务
     提供美股数据的搜索和获取功能
     """
     
+    # 行情表缓存有效期（秒），过期后在最长陈旧时间内先使用旧数据并在后台刷新
+    CACHE_TTL = 30 * 60
+    CACHE_MAX_STALE = 2 * 60 * 60
+    
     def __init__(self):
         """初始化美股服务"""
         logger.debug("初始化USStockServiceAsync")
         
-        # 可选：添加缓存以减少频繁请求
-        self._cache = None
-        self._cache_timestamp = None
+        # 美股行情表缓存，搜索和详情共用，避免每次输入都拉取全市场数据
+        self._cache: RefreshingCache[USStockTable] = RefreshingCache(
+            self._load_table, ttl=self.CACHE_TTL, max_stale=self.CACHE_MAX_STALE, name='美股行情')
+    
+    async def aclose(self) -> None:
+        """取消进行中的后台刷新"""
+        await self._cache.aclose()
+    
+    async def _load_table(self) -> USStockTable:
+        """在线程池中获取美股数据并构建搜索索引"""
+        return await asyncio.to_thread(lambda: USStockTable(self._get_us_stocks_data()))
     
     async def search_us_stocks(self, keyword: str) -> List[Dict[str, Any]]:
         """
@@ -33,25 +82,9 @@ class USStockServiceAsync:
         try:
             logger.info(f"异步搜索美股: {keyword}")
             
-            # 使用线程池执行同步的akshare调用
-            df = await asyncio.to_thread(self._get_us_stocks_data)
-            
-            # 模糊匹配搜索
-            mask = df['name'].str.contains(keyword, case=False, na=False)
-            results = df[mask]
-            
-            # 格式化返回结果并处理 NaN 值
-            formatted_results = []
-            for _, row in results.iterrows():
-                formatted_results.append({
-                    'name': row['name'] if pd.notna(row['name']) else '',
-                    'symbol': str(row['symbol']) if pd.notna(row['symbol']) else '',
-                    'price': float(row['price']) if pd.notna(row['price']) else 0.0,
-                    'market_value': float(row['market_value']) if pd.notna(row['market_value']) else 0.0
-                })
-                # 限制只返回前10个结果
-                if len(formatted_results) >= 10:
-                    break
+            # 使用缓存的行情表，按名称和代码的倒排索引匹配，只返回前10个结果
+            table = await self._cache.get()
+            formatted_results = [dict(table.search_records[position]) for position in table.index.search(keyword, 10)]
             
             logger.info(f"美股搜索完成，找到 {len(formatted_results)} 个匹配项（限制显示前10个）")
             return formatted_results
@@ -115,35 +148,12 @@ class USStockServiceAsync:
         try:
             logger.info(f"获取美股详情: {symbol}")
             
-            # 使用线程池执行同步的akshare调用
-            df = await asyncio.to_thread(self._get_us_stocks_data)
-            
-            # 精确匹配股票代码
-            result = df[df['symbol'] == symbol]
+            # 使用缓存的行情表，按代码索引直接定位
+            stock_detail = (await self._cache.get()).get(symbol)
             
-            if len(result) == 0:
+            if stock_detail is None:
                 raise Exception(f"未找到股票代码: {symbol}")
             
-            # 获取第一行数据
-            row = result.iloc[0]
-            
-            # 格式化为字典
-            stock_detail = {
-                'name': row['name'] if pd.notna(row['name']) else '',
-                'symbol': str(row['symbol']) if pd.notna(row['symbol']) else '',
-                'price': float(row['price']) if pd.notna(row['price']) else 0.0,
-                'price_change': float(row['price_change']) if pd.notna(row['price_change']) else 0.0,
-                'price_change_percent': float(row['price_change_percent'].strip('%'))/100 if pd.notna(row['price_change_percent']) else 0.0,
-                'open': float(row['open']) if pd.notna(row['open']) else 0.0,
-                'high': float(row['high']) if pd.notna(row['high']) else 0.0,
-                'low': float(row['low']) if pd.notna(row['low']) else 0.0,
-                'pre_close': float(row['pre_close']) if pd.notna(row['pre_close']) else 0.0,
-                'market_value': float(row['market_value']) if pd.notna(row['market_value']) else 0.0,
-                'pe_ratio': float(row['pe_ratio']) if pd.notna(row['pe_ratio']) else 0.0,
-                'volume': float(row['volume']) if pd.notna(row['volume']) else 0.0,
-                'turnover': float(row['turnover']) if pd.notna(row['turnover']) else 0.0
-            }
-            
             logger.info(f"获取美股详情成功: {symbol}")
             return stock_detail
             
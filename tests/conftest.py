@@ -0,0 +1,61 @@
+import asyncio
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.ai_analyzer import AIAnalyzer
+from services.llm_scheduler import LLMScheduler
+from services.llm_stream_hub import LLMStreamHub
+from services.technical_indicator import TechnicalIndicator
+from utils.http_client import HTTPClientPool
+
+
+def _ohlcv_frame(seed: int = 0, rows: int = 80) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.2, rows))
+    return pd.DataFrame({'Open': close, 'High': close + 0.1, 'Low': close - 0.1, 'Close': close,
+                         'Volume': rng.uniform(1e5, 2e5, rows)}, index=pd.bdate_range('2024-01-01', periods=rows))
+
+
+@pytest.fixture
+def ohlcv_frame():
+    """随机游走日线行情的工厂函数，参数为 (seed, rows)"""
+    return _ohlcv_frame
+
+
+@pytest.fixture
+def indicator_frame():
+    """已计算技术指标的随机游走日线行情的工厂函数，参数为 (seed, rows)"""
+    def build(seed: int = 0, rows: int = 80) -> pd.DataFrame:
+        return TechnicalIndicator().calculate_indicators(_ohlcv_frame(seed, rows))
+    return build
+
+
+@pytest.fixture
+def run_mock_llm(monkeypatch):
+    """
+    在模拟AI接口上运行测试的工厂函数
+
+    启动传入的模拟服务，以第一个服务的地址创建AIAnalyzer（独立的调度器、请求共享中心和连接池，不重试限流，
+    不使用备用服务商，其余参数可覆盖），传给consume并返回其结果
+    """
+    def run(consume, *servers, **options):
+        async def main():
+            pool = HTTPClientPool()
+            monkeypatch.setattr('services.ai_analyzer.http_client_pool', pool)
+            async with contextlib.AsyncExitStack() as stack:
+                for server in servers:
+                    await stack.enter_async_context(server)
+                settings = {'custom_api_key': 'mock', 'custom_api_model': 'mock-model', 'scheduler': LLMScheduler(max_retries=0),
+                            'stream_hub': LLMStreamHub(), 'fallback_providers': [], **options}
+                analyzer = AIAnalyzer(custom_api_url=servers[0].url, **settings)
+                try:
+                    return await consume(analyzer)
+                finally:
+                    await pool.aclose()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import httpx
+
+from services.ai_analysis_cache import AIAnalysisCache
+from services.ai_analyzer import AIAnalyzer
+
+
+def test_cache_expires_at_next_session(tmp_path, monkeypatch):
+    cache = AIAnalysisCache(db_path=str(tmp_path / 'ai.db'))
+    key = AIAnalysisCache.make_key('prompt', 'model', 'https://api.example.com')
+    assert key != AIAnalysisCache.make_key('prompt', 'other-model', 'https://api.example.com')
+    assert key != AIAnalysisCache.make_key('prompt', 'model', 'https://api.example.com', 'key-hash')
+
+    # 周五收盘后写入，下周一开盘前有效
+    friday_close = datetime(2024, 1, 5, 8, 0, tzinfo=timezone.utc)
+    monkeypatch.setattr('services.ai_analysis_cache.time.time', lambda: friday_close.timestamp())
+    cache.put(key, '分析内容', '600000', 'A', 'model', now=friday_close)
+    monkeypatch.setattr('services.ai_analysis_cache.time.time', lambda: datetime(2024, 1, 7, tzinfo=timezone.utc).timestamp())
+    assert cache.get(key) == '分析内容'
+    monkeypatch.setattr('services.ai_analysis_cache.time.time', lambda: datetime(2024, 1, 8, 2, tzinfo=timezone.utc).timestamp())
+    assert cache.get(key) is None
+
+
+def test_cached_analysis_is_replayed_as_stream(tmp_path, monkeypatch, indicator_frame):
+    requests = []
+    content = "## 投资建议\n建议买入，注意止损。"
+
+    def handler(request):
+        requests.append(request)
+        pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]}, ensure_ascii=False)}\n\n" for piece in pieces
+        ) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode('utf-8'))
+
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', custom_api_model='test-model',
+                          analysis_cache=AIAnalysisCache(db_path=str(tmp_path / 'ai.db')), fallback_providers=[])
+    df = indicator_frame()
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        results = []
+        for _ in range(2):
+            results.append([json.loads(m) async for m in analyzer.get_ai_analysis(df, '600000', 'A', stream=True)])
+        await client.aclose()
+        return results
+
+    live, replayed = asyncio.run(run())
+    assert len(requests) == 1
+
+    def text(messages):
+        return "".join(m.get('ai_analysis_chunk', '') for m in messages)
+
+    assert text(live) == text(replayed) == content + "\n"
+    assert live[-1] == replayed[-1]
+    assert replayed[-1]['recommendation'] == '买入'
+
+
+def test_cache_is_not_shared_between_api_keys(tmp_path, monkeypatch, indicator_frame):
+    requests = []
+
+    def handler(request):
+        requests.append(request.headers['Authorization'])
+        return httpx.Response(200, json={'choices': [{'message': {'content': "## 投资建议\n持有"}}]})
+
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', custom_api_model='test-model',
+                          analysis_cache=AIAnalysisCache(db_path=str(tmp_path / 'ai.db')), fallback_providers=[])
+    other = analyzer.with_config(custom_api_key='sk-other')
+    df = indicator_frame()
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        for service in (analyzer, other, analyzer, other):
+            async for _ in service.get_ai_analysis(df, '600000', 'A', stream=False):
+                pass
+        await client.aclose()
+
+    asyncio.run(run())
+
+    # 每个密钥各请求一次，之后命中各自的缓存
+    assert requests == ['Bearer sk-test', 'Bearer sk-other']
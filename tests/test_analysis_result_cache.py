@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from services.analysis_result_cache import AnalysisResultCache
+from utils.trading_calendar import current_trading_day, is_session_open, next_session_open
+
+
+def test_session_boundaries():
+    # 2024-01-05 为周五，北京时间 10:00 处于A股交易时段
+    friday_open = datetime(2024, 1, 5, 2, 0, tzinfo=timezone.utc)
+    assert is_session_open('A', friday_open)
+
+    # 周五收盘后，下一根K线出现在下周一开盘
+    friday_close = datetime(2024, 1, 5, 8, 0, tzinfo=timezone.utc)
+    assert not is_session_open('A', friday_close)
+    next_open = next_session_open('A', friday_close)
+    assert (next_open.year, next_open.month, next_open.day, next_open.hour, next_open.minute) == (2024, 1, 8, 9, 30)
+
+    # 周日对应的交易日为上周五
+    sunday = datetime(2024, 1, 7, 12, 0, tzinfo=timezone.utc)
+    assert current_trading_day('US', sunday).isoformat() == '2024-01-05'
+
+
+def test_cached_result_expires_when_next_bar_arrives(monkeypatch):
+    cache = AnalysisResultCache(max_entries=2)
+    df = pd.DataFrame({'Close': [1.0, 2.0]}, index=pd.to_datetime(['2024-01-04', '2024-01-05']))
+    after_close = datetime(2024, 1, 5, 8, 0, tzinfo=timezone.utc)
+
+    clock = {'now': after_close.timestamp()}
+    monkeypatch.setattr('services.analysis_result_cache.time.time', lambda: clock['now'])
+
+    key = AnalysisResultCache.params_key({'rsi_period': 14})
+    cache.put('600000', 'A', key, {'score': 80}, df, now=after_close)
+
+    entry = cache.get('600000', 'A', key)
+    assert entry['basic_result'] == {'score': 80}
+    assert entry['last_bar_date'] == '2024-01-05'
+    # 参数不同视为不同结果
+    assert cache.get('600000', 'A', AnalysisResultCache.params_key({'rsi_period': 6})) is None
+
+    # 周一开盘后新K线出现，缓存失效
+    clock['now'] = datetime(2024, 1, 8, 1, 31, tzinfo=timezone.utc).timestamp()
+    assert cache.get('600000', 'A', key) is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = AnalysisResultCache(max_entries=2)
+    for code in ('a', 'b', 'c'):
+        cache.put(code, 'US', '', {'stock_code': code})
+    assert cache.get('a', 'US') is None
+    assert cache.get('c', 'US')['basic_result'] == {'stock_code': 'c'}
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from utils.async_utils import merge_async_generators
+
+
+async def _ticker(name, count, delay, log):
+    log.append(("start", name))
+    try:
+        for i in range(count):
+            await asyncio.sleep(delay)
+            yield f"{name}{i}"
+    finally:
+        log.append(("close", name))
+
+
+def test_interleaves_with_bounded_concurrency():
+    log = []
+
+    async def scenario():
+        generators = [_ticker(name, 3, 0.01 * (n + 1), log) for n, name in enumerate("abcd")]
+        return [item async for item in merge_async_generators(generators, max_concurrency=2)]
+
+    items = asyncio.run(scenario())
+
+    assert sorted(items) == sorted(f"{name}{i}" for name in "abcd" for i in range(3))
+    # a和b交错输出，c在a结束后才启动
+    assert items.index("b0") < items.index("a2")
+    assert log.index(("start", "c")) > log.index(("close", "a"))
+    assert ("start", "c") not in log[:2]
+
+
+def test_early_exit_closes_running_generators():
+    log = []
+
+    async def scenario():
+        generators = [_ticker(name, 100, 0.01, log) for name in "ab"]
+        async for item in merge_async_generators(generators, max_concurrency=2):
+            if item == "a2":
+                break
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert ("close", "a") in log and ("close", "b") in log
+
+
+def test_errors_propagate_to_consumer():
+    async def broken():
+        yield 1
+        raise RuntimeError("upstream failed")
+
+    async def scenario():
+        return [item async for item in merge_async_generators([broken()], max_concurrency=2)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
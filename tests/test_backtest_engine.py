@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.backtest_engine import BacktestEngine
+from services.history_store import HistoryStore
+from services.stock_scorer import StockScorer
+from services.technical_indicator import TechnicalIndicator
+
+
+def _synthetic_history(seed: int, rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.005, rows)),
+        'High': close * (1 + rng.uniform(0, 0.02, rows)),
+        'Low': close * (1 - rng.uniform(0, 0.02, rows)),
+        'Close': close,
+        'Volume': rng.uniform(1e5, 3e5, rows),
+    }, index=pd.bdate_range('2022-01-03', periods=rows))
+
+
+def _store_with_history(tmp_path, lengths):
+    store = HistoryStore(base_dir=str(tmp_path))
+    for i, rows in enumerate(lengths):
+        store.save(f"{i:06d}", 'A', _synthetic_history(i, rows))
+    return store
+
+
+def test_history_store_merges_and_lists(tmp_path):
+    store = HistoryStore(base_dir=str(tmp_path))
+    df = _synthetic_history(1, 30)
+    store.save('600000', 'A', df.iloc[:20])
+    store.save('600000', 'A', df.iloc[10:])
+
+    loaded = store.load('600000', 'A')
+    assert store.list_symbols('A') == ['600000']
+    pd.testing.assert_frame_equal(loaded, df, check_freq=False)
+
+
+def test_history_store_rejects_path_traversal(tmp_path):
+    store = HistoryStore(base_dir=str(tmp_path / 'history'))
+    df = _synthetic_history(1, 5)
+
+    for stock_code, market_type in [('../../etc/passwd', 'A'), ('..', 'A'), ('600000', '../A'), ('60/00', 'A')]:
+        with pytest.raises(ValueError):
+            store.load(stock_code, market_type)
+    store.save('../escape', 'A', df)
+    assert not (tmp_path / 'escape.pkl').exists()
+    assert store.list_symbols('A') == []
+
+
+def test_history_store_concurrent_saves_keep_all_rows(tmp_path):
+    store = HistoryStore(base_dir=str(tmp_path))
+    df = _synthetic_history(0, 200)
+    chunks = [df.iloc[i:i + 10] for i in range(0, len(df), 10)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda chunk: store.save('600000', 'A', chunk), chunks))
+
+    pd.testing.assert_frame_equal(store.load('600000', 'A'), df, check_freq=False)
+    assert not [name for name in (tmp_path / 'A').iterdir() if name.suffix == '.tmp']
+
+
+def test_score_panel_matches_per_stock_scoring(tmp_path):
+    store = _store_with_history(tmp_path, [250, 180, 120])
+    engine = BacktestEngine(history_store=store)
+    indicator, scorer = TechnicalIndicator(), StockScorer()
+
+    panels = store.load_panels('A')
+    scores = engine.compute_score_panel(panels)['score']
+
+    for code in panels['Close'].columns:
+        df = store.load(code, 'A')
+        expected = scorer.score_frame(indicator.calculate_indicators(df))['score']
+        actual = scores[code].to_numpy()[-len(df):]
+        assert (actual == expected.to_numpy()).all()
+
+
+def test_run_reports_buckets_and_threshold(tmp_path):
+    store = _store_with_history(tmp_path, [300, 260, 200, 90])
+    result = BacktestEngine(history_store=store).run('A', horizons=[5, 1], min_score=60)
+
+    assert result['symbols'] == 4
+    assert result['horizons'] == [1, 5]
+    buckets = result['buckets']['5']
+    assert [b['min_score'] for b in buckets] == [0, 20, 40, 60, 70, 80]
+    assert sum(b['count'] for b in buckets) == result['threshold']['5']['baseline']['count']
+    assert result['threshold']['5']['selected']['count'] == sum(b['count'] for b in buckets if b['min_score'] >= 60)
+    for bucket in buckets:
+        if bucket['count']:
+            assert bucket['worst_drawdown'] <= bucket['mean_drawdown']
+            assert 0 <= bucket['hit_rate'] <= 1
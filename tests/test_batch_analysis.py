@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import httpx
+
+from services.ai_analyzer import AIAnalyzer
+from services.analysis_demuxer import AnalysisDemuxer
+
+
+REPLY = (
+    "好的，以下是分析。\n"
+    "=== 600000 ===\n趋势向上。\n## 投资建议\n建议买入。\n\n"
+    "### **000001**\n趋势向下，600000 的走势更强。\n## 投资建议\n建议卖出。\n"
+)
+
+
+def test_demuxer_splits_sections_across_fragments():
+    demuxer = AnalysisDemuxer(['600000', '000001'])
+    pieces = []
+    # 逐字符输入，标记行被任意截断
+    for ch in REPLY:
+        pieces.extend(demuxer.feed(ch))
+    pieces.extend(demuxer.flush())
+
+    assert {code for code, _ in pieces} == {'600000', '000001'}
+    assert "".join(text for code, text in pieces if code == '600000') == "趋势向上。\n## 投资建议\n建议买入。\n\n"
+    assert demuxer.text('000001') == "趋势向下，600000 的走势更强。\n## 投资建议\n建议卖出。\n"
+    assert demuxer.missing == []
+    assert demuxer.preamble == "好的，以下是分析。\n"
+
+
+def test_batch_analysis_demultiplexes_stream(monkeypatch, indicator_frame):
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        pieces = [REPLY[i:i + 5] for i in range(0, len(REPLY), 5)]
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]}, ensure_ascii=False)}\n\n" for piece in pieces
+        ) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode('utf-8'))
+
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', custom_api_model='test-model',
+                          fallback_providers=[])
+    stocks = [('600000', indicator_frame(0)), ('000001', indicator_frame(1))]
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        messages = [json.loads(m) async for m in analyzer.get_batch_ai_analysis(stocks, 'A', stream=True)]
+        await client.aclose()
+        return messages
+
+    messages = asyncio.run(run())
+
+    # 两只股票只发送一次请求，提示词中包含各自的分节
+    assert len(requests) == 1
+    prompt = requests[0]['messages'][0]['content']
+    assert "=== 600000 ===" in prompt and "=== 000001 ===" in prompt
+
+    completed = {m['stock_code']: m for m in messages if m.get('status') == 'completed'}
+    assert completed['600000']['recommendation'] == '买入'
+    assert completed['000001']['recommendation'] == '卖出'
+
+    # 第一只股票在第二只开始输出时即完成
+    order = [(m['stock_code'], m.get('status')) for m in messages if 'ai_analysis_chunk' in m or m.get('status') == 'completed']
+    assert order.index(('600000', 'completed')) < order.index(('000001', 'analyzing'))
+    text = "".join(m.get('ai_analysis_chunk', '') for m in messages if m['stock_code'] == '000001')
+    assert text == "趋势向下，600000 的走势更强。\n## 投资建议\n建议卖出。\n"
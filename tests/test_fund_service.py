@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pandas as pd
+
+from services.fund_service_async import FundServiceAsync
+
+
+def _fund_frame(prefix):
+    return pd.DataFrame({
+        'symbol': [f'{prefix}001', f'{prefix}002'],
+        'name': [f'{prefix}沪深300', f'{prefix}创业板'],
+        'price': [3.9, 2.1],
+        'volume': [1e6, 2e6],
+        'market_value': [1e9, 2e9],
+        'total_value': [1.1e9, 2.2e9],
+    })
+
+
+def _service(monkeypatch, delay=0.0):
+    service = FundServiceAsync()
+    calls = {'ETF': 0, 'LOF': 0}
+
+    def loader(market_type):
+        def load():
+            calls[market_type] += 1
+            time.sleep(delay)
+            return _fund_frame(market_type)
+        return load
+
+    monkeypatch.setattr(service, '_get_etf_data', loader('ETF'))
+    monkeypatch.setattr(service, '_get_lof_data', loader('LOF'))
+    return service, calls
+
+
+def test_markets_are_cached_independently(monkeypatch):
+    service, calls = _service(monkeypatch, delay=0.05)
+
+    async def run():
+        # 并发的未命中只请求一次上游
+        await asyncio.gather(*(service.search_funds('300', 'ETF') for _ in range(5)))
+        lof = await service.search_funds('创业板', 'LOF')
+        # LOF的加载不影响ETF缓存的时间
+        assert service._caches['ETF'].timestamp < service._caches['LOF'].timestamp
+        await service.search_funds('300', 'ETF')
+        return lof
+
+    lof = asyncio.run(run())
+
+    assert calls == {'ETF': 1, 'LOF': 1}
+    assert lof[0]['symbol'] == 'LOF002'
+
+
+def test_refreshes_in_background_before_expiry(monkeypatch):
+    service, calls = _service(monkeypatch)
+
+    async def run():
+        service.warm_up()
+        await asyncio.sleep(0.05)
+        assert calls == {'ETF': 1, 'LOF': 1}
+
+        # 临近过期时直接返回缓存，同时在后台刷新
+        cache = service._caches['ETF']
+        cache.timestamp -= service.CACHE_TTL - service.CACHE_REFRESH_AHEAD / 2
+        results = await service.search_funds('ETF001', 'ETF')
+        assert calls['ETF'] == 1
+        await asyncio.sleep(0.05)
+        await service.aclose()
+        return results
+
+    results = asyncio.run(run())
+
+    assert results[0]['symbol'] == 'ETF001'
+    assert calls == {'ETF': 2, 'LOF': 1}
+
+
+def test_fund_detail_lookup(monkeypatch):
+    service, calls = _service(monkeypatch)
+    frame = _fund_frame('ETF').assign(price_change=[0.01, None], price_change_percent=[0.26, -1.5],
+                                      discount_rate=['-0.12%', None])
+    monkeypatch.setattr(service, '_get_etf_data', lambda: frame)
+
+    async def run():
+        return await service.get_fund_detail('ETF002', 'ETF'), await service.get_fund_detail('ETF001', 'ETF')
+
+    second, first = asyncio.run(run())
+
+    assert second['price_change'] == 0.0
+    assert second['price_change_percent'] == -0.015
+    assert second['discount_rate'] == 0.0
+    assert first['discount_rate'] == -0.0012
+    assert first['name'] == 'ETF沪深300'
+
+
+def test_search_ranks_matches_and_fills_missing_values(monkeypatch):
+    service, _ = _service(monkeypatch)
+    frame = pd.DataFrame({
+        'symbol': ['159915', '510300', '159919', '563000'],
+        'name': ['创业板ETF', '沪深300ETF', '300ETF', None],
+        'price': [2.1, 3.9, None, 1.0],
+        'volume': [1e6, 2e6, 3e6, None],
+        'market_value': [1e9, 2e9, 3e9, 4e9],
+        'total_value': [1.1e9, 2.2e9, 3.3e9, 4.4e9],
+    })
+    monkeypatch.setattr(service, '_get_etf_data', lambda: frame)
+
+    results = asyncio.run(service.search_funds('300', 'ETF'))
+
+    # 名称前缀匹配排在子串匹配之前，同等匹配按上游顺序
+    assert [item['symbol'] for item in results] == ['159919', '510300', '563000']
+    assert results[0] == {'name': '300ETF', 'symbol': '159919', 'price': 0.0, 'volume': 3e6,
+                          'market_value': 3e9, 'total_value': 3.3e9}
+    assert results[2]['name'] == '' and results[2]['volume'] == 0.0
@@ -0,0 +1,36 @@
+import asyncio
+
+from utils.http_client import HTTPClientPool
+
+
+def test_clients_are_shared_per_origin():
+    async def scenario():
+        pool = HTTPClientPool(http2=False)
+        a = pool.get_client("https://api.example.com/v1/chat/completions")
+        b = pool.get_client("https://API.example.com/other")
+        c = pool.get_client("https://api.other.com/v1/chat/completions")
+        assert a is b
+        assert a is not c
+
+        async with pool.client("https://api.example.com/v1") as d:
+            assert d is a
+        assert not a.is_closed
+
+        await pool.aclose()
+        assert a.is_closed and c.is_closed
+        # 关闭后重新获取会创建新的客户端
+        assert pool.get_client("https://api.example.com/v1") is not a
+        await pool.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_clients_are_not_reused_across_event_loops():
+    pool = HTTPClientPool(http2=False)
+
+    async def get():
+        return pool.get_client("https://api.example.com/v1")
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+    assert first is not second
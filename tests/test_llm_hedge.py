@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+
+from services.ai_analysis_cache import AIAnalysisCache
+from services.ai_analyzer import AIAnalyzer
+from services.llm_metrics import LLMMetrics
+from utils.metrics import MetricsRegistry
+from utils.mock_llm_server import MockLLMServer
+
+
+@pytest.fixture
+def run_hedge(run_mock_llm, indicator_frame, monkeypatch):
+    """在主服务商和一个备用服务商之间运行对冲请求，返回 (消息, 耗时, 按模型汇总的指标)"""
+    def run(primary, fallback, analysis_cache=None):
+        metrics = LLMMetrics(MetricsRegistry())
+        monkeypatch.setattr('services.llm_hedge.llm_metrics', metrics)
+        monkeypatch.setattr('services.ai_analyzer.llm_metrics', metrics)
+
+        async def consume(analyzer):
+            analyzer.fallback_providers = [{'url': fallback.url, 'key': 'mock', 'model': 'fallback'}]
+            analyzer.hedge_delay = 0.2
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            messages = [json.loads(m) async for m in analyzer.get_ai_analysis(indicator_frame(), '600000', 'A', stream=True)]
+            return messages, loop.time() - started
+
+        messages, elapsed = run_mock_llm(consume, primary, fallback, custom_api_model='primary', analysis_cache=analysis_cache)
+        return messages, elapsed, {item['model']: item for item in metrics.summary()}
+
+    return run
+
+
+def test_stalled_provider_is_hedged(run_hedge):
+    primary = MockLLMServer(ttft=0, tokens_per_second=0, stall_rate=1.0, stall_seconds=5)
+    fallback = MockLLMServer(ttft=0, tokens_per_second=0)
+
+    messages, elapsed, summary = run_hedge(primary, fallback)
+
+    assert elapsed < 2
+    assert messages[-1]['status'] == 'completed'
+    assert "".join(m.get('ai_analysis_chunk', '') for m in messages).startswith(fallback.build_content("分析A股 600000：")[:20])
+    assert summary['fallback']['hedge'] == {'won': 1, 'lost': 0, 'win_rate': 1.0}
+    assert summary['primary']['hedge']['lost'] == 1
+    assert summary['primary']['requests'] == {'cancelled': 1}
+
+
+def test_fast_provider_is_not_hedged(run_hedge):
+    primary = MockLLMServer(ttft=0, tokens_per_second=0)
+    fallback = MockLLMServer(ttft=0, tokens_per_second=0)
+
+    messages, _, summary = run_hedge(primary, fallback)
+
+    assert messages[-1]['status'] == 'completed'
+    assert fallback.stats['requests'] == 0
+    assert 'hedge' not in summary['primary']
+
+
+def test_failed_provider_falls_back_immediately(run_hedge):
+    primary = MockLLMServer(ttft=0, tokens_per_second=0, error_rate=1.0)
+    fallback = MockLLMServer(ttft=0, tokens_per_second=0)
+
+    messages, _, summary = run_hedge(primary, fallback)
+
+    assert not any(m.get('status') == 'error' for m in messages)
+    assert messages[-1]['status'] == 'completed'
+    assert summary['fallback']['hedge']['won'] == 1
+
+
+def test_fallback_result_is_cached_under_the_fallback_provider(tmp_path, run_hedge):
+    primary = MockLLMServer(ttft=0, tokens_per_second=0, error_rate=1.0)
+    fallback = MockLLMServer(ttft=0, tokens_per_second=0)
+    cache = AIAnalysisCache(db_path=str(tmp_path / 'ai.db'))
+
+    messages, _, _ = run_hedge(primary, fallback, analysis_cache=cache)
+
+    rows = cache._conn.execute("SELECT model FROM ai_analysis").fetchall()
+    assert messages[-1]['status'] == 'completed'
+    assert rows == [('fallback',)]
+
+
+def test_fallback_provider_uses_only_its_own_credentials(monkeypatch):
+    monkeypatch.setenv('AI_FALLBACK_PROVIDERS', json.dumps([{'url': 'https://b.example.com', 'key': 'sk-b'}]))
+    assert AIAnalyzer._load_fallback_providers() == []
+
+    analyzer = AIAnalyzer(custom_api_url='https://a.example.com', custom_api_key='sk-primary', custom_api_model='primary',
+                          fallback_providers=[{'url': 'https://b.example.com', 'model': 'local'}])
+    fallback = analyzer._fallback_analyzer(analyzer.fallback_providers[0])
+    api_url, request_data, headers = fallback._build_request('prompt', True)
+
+    assert api_url.startswith('https://b.example.com')
+    assert request_data['model'] == 'local'
+    assert 'Authorization' not in headers
+    assert analyzer._build_request('prompt', True)[2]['Authorization'] == 'Bearer sk-primary'
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import httpx
+
+from services.ai_analyzer import AIAnalyzer
+from services.llm_metrics import LLMMetrics
+from services.llm_scheduler import LLMScheduler
+from utils.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_quantiles():
+    histogram = Histogram((1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.observe(value)
+
+    assert histogram.count == 5
+    assert histogram.quantile(0.5) == 1.75
+    assert histogram.quantile(1.0) == 4
+    assert Histogram((1,)).quantile(0.5) is None
+
+
+def test_analyzer_records_latency_per_model_and_host(monkeypatch, indicator_frame):
+    registry = MetricsRegistry()
+    metrics = LLMMetrics(registry)
+    monkeypatch.setattr('services.ai_analyzer.llm_metrics', metrics)
+
+    def handler(request):
+        if json.loads(request.content)['model'] == 'bad-model':
+            return httpx.Response(429, json={"error": {"message": "rate limited"}})
+        body = "".join(
+            f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}\n\n" for piece in ('a', 'b', 'c')
+        ) + "data: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode('utf-8'))
+
+    df = indicator_frame()
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        for model in ('good-model', 'bad-model'):
+            analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', custom_api_model=model,
+                                  scheduler=LLMScheduler(max_retries=0), fallback_providers=[])
+            async for _ in analyzer.get_ai_analysis(df, '600000', 'A', stream=True):
+                pass
+        await client.aclose()
+
+    asyncio.run(run())
+
+    summary = {item['model']: item for item in metrics.summary()}
+    assert summary['good-model']['host'] == 'api.example.com'
+    assert summary['good-model']['requests'] == {'ok': 1}
+    assert summary['good-model']['ttft_seconds']['count'] == 1
+    assert summary['good-model']['inter_token_seconds']['count'] == 2
+    assert summary['bad-model']['requests'] == {'error': 1}
+    assert 'ttft_seconds' not in summary['bad-model']
+
+    text = registry.render_prometheus()
+    assert '# TYPE llm_ttft_seconds histogram' in text
+    assert 'llm_ttft_seconds_bucket{host="api.example.com",model="good-model",le="+Inf"} 1' in text
+    assert 'llm_requests_total{host="api.example.com",model="bad-model",status="error"} 1' in text
+
+
+def test_non_json_error_body_is_reported(monkeypatch, indicator_frame):
+    metrics = LLMMetrics(MetricsRegistry())
+    monkeypatch.setattr('services.ai_analyzer.llm_metrics', metrics)
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', custom_api_model='test-model',
+                          scheduler=LLMScheduler(max_retries=0), fallback_providers=[])
+    df = indicator_frame()
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(502, content=b'<html>Bad Gateway</html>')))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        results = []
+        for stream in (True, False):
+            results.append([json.loads(m) async for m in analyzer.get_ai_analysis(df, '600000', 'A', stream=stream)])
+        await client.aclose()
+        return results
+
+    for messages in asyncio.run(run()):
+        assert messages[-1]['status'] == 'error'
+        assert 'Bad Gateway' in messages[-1]['error']
+    assert metrics.summary()[0]['requests'] == {'error': 2}
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import httpx
+
+from services.ai_analyzer import AIAnalyzer
+from services.llm_scheduler import LLMScheduler, parse_retry_after
+
+
+def test_round_robin_across_users(monkeypatch):
+    monkeypatch.setenv('AI_MAX_CONCURRENCY', '1')
+    scheduler = LLMScheduler()
+    order = []
+    positions = {}
+
+    async def request(user, name, hold):
+        async with scheduler.ticket('https://api.example.com/v1', user) as ticket:
+            async for position in ticket.wait():
+                positions.setdefault(name, position)
+            order.append(name)
+            await hold.wait()
+
+    async def run():
+        holds = [asyncio.Event() for _ in range(5)]
+        # 用户a先提交3个请求，用户b随后提交2个
+        names = [('a', 'a1'), ('a', 'a2'), ('a', 'a3'), ('b', 'b1'), ('b', 'b2')]
+        tasks = []
+        for (user, name), hold in zip(names, holds):
+            tasks.append(asyncio.create_task(request(user, name, hold)))
+            await asyncio.sleep(0)
+        for hold in holds:
+            await asyncio.sleep(0.01)
+            hold.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert order == ['a1', 'a2', 'b1', 'a3', 'b2']
+    assert positions['b1'] == 2
+
+
+def test_retry_after_parsing():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT', now=1445412480) == 10.0
+    assert parse_retry_after('soon') is None
+
+
+def test_concurrency_limit_is_shared_with_analyzer(monkeypatch):
+    monkeypatch.setenv('AI_MAX_CONCURRENCY', '0')
+    monkeypatch.setenv('AI_MAX_CONCURRENCY_MAP', 'API.example.com=6,bad.example.com=x')
+
+    assert LLMScheduler.concurrency_limit('https://api.example.com/v1') == 6
+    assert LLMScheduler.concurrency_limit('https://bad.example.com/v1') == 1
+    analyzer = AIAnalyzer(custom_api_url='https://other.example.com', custom_api_key='sk-test', fallback_providers=[])
+    assert analyzer.max_concurrency == 1
+    assert analyzer.with_config(custom_api_url='https://api.example.com').max_concurrency == 6
+
+
+def test_rate_limited_request_is_retried(monkeypatch, indicator_frame):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={'Retry-After': '0.05'}, json={"error": {"message": "rate limited"}})
+        event = json.dumps({'choices': [{'delta': {'content': "## 投资建议\n持有"}}]}, ensure_ascii=False)
+        body = f"data: {event}\n\ndata: [DONE]\n\n"
+        return httpx.Response(200, content=body.encode('utf-8'))
+
+    df = indicator_frame()
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', scheduler=LLMScheduler(),
+                          fallback_providers=[])
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        messages = [json.loads(m) async for m in analyzer.get_ai_analysis(df, '600000', 'A', stream=True)]
+        await client.aclose()
+        return messages
+
+    messages = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert any('retry_after' in m for m in messages)
+    assert not any(m.get('status') == 'error' for m in messages)
+    assert messages[-1]['recommendation'] == '持有'
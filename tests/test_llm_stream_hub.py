@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import httpx
+
+from services.ai_analyzer import AIAnalyzer
+from services.llm_scheduler import LLMScheduler
+from services.llm_stream_hub import LLMStreamHub
+
+
+class _SlowStream(httpx.AsyncByteStream):
+    """逐个事件发送并在事件之间等待，模拟进行中的上游流"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            await asyncio.sleep(0.01)
+            event = json.dumps({'choices': [{'delta': {'content': piece}}]}, ensure_ascii=False)
+            yield f"data: {event}\n\n".encode('utf-8')
+        yield b"data: [DONE]\n\n"
+
+
+def test_identical_requests_share_one_upstream_stream(monkeypatch, indicator_frame):
+    requests = []
+    pieces = ["## 投资建议\n", "建议", "买入"]
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, stream=_SlowStream(pieces))
+
+    hub = LLMStreamHub()
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test',
+                          scheduler=LLMScheduler(), stream_hub=hub, fallback_providers=[])
+    df = indicator_frame()
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        return [json.loads(m) async for m in analyzer.get_ai_analysis(df, '600000', 'A', stream=True)]
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        # 第二个请求在第一个请求的流进行中加入
+        results = await asyncio.gather(consume(0), consume(0.015))
+        await client.aclose()
+        return results
+
+    first, second = asyncio.run(run())
+
+    assert len(requests) == 1
+    assert hub.metrics == {"started": 1, "joined": 1}
+    assert len(hub) == 0
+    assert first == second
+    assert "".join(m.get('ai_analysis_chunk', '') for m in second) == "".join(pieces) + "\n"
+    assert second[-1]['recommendation'] == '买入'
+
+
+def test_requests_with_different_api_keys_are_not_shared(monkeypatch, indicator_frame):
+    requests = []
+
+    def handler(request):
+        requests.append(request.headers['Authorization'])
+        return httpx.Response(200, stream=_SlowStream(["## 投资建议\n", "持有"]))
+
+    hub = LLMStreamHub()
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test',
+                          scheduler=LLMScheduler(), stream_hub=hub, fallback_providers=[])
+    other = analyzer.with_config(custom_api_key='sk-other')
+    assert analyzer.api_key_hash != other.api_key_hash
+    assert 'sk-other' not in other.api_key_hash
+    df = indicator_frame()
+
+    async def consume(service):
+        return [m async for m in service.get_ai_analysis(df, '600000', 'A', stream=True)]
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        await asyncio.gather(consume(analyzer), consume(other))
+        await client.aclose()
+
+    asyncio.run(run())
+
+    assert sorted(requests) == ['Bearer sk-other', 'Bearer sk-test']
+    assert hub.metrics == {"started": 2, "joined": 0}
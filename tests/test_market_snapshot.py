@@ -0,0 +1,86 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.history_store import HistoryStore
+from services.market_snapshot import MarketSnapshot
+from services.stock_scorer import StockScorer
+from services.technical_indicator import TechnicalIndicator
+
+
+def _synthetic_history(seed: int, rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.005, rows)),
+        'High': close * (1 + rng.uniform(0, 0.02, rows)),
+        'Low': close * (1 - rng.uniform(0, 0.02, rows)),
+        'Close': close,
+        'Volume': rng.uniform(1e5, 3e5, rows),
+    }, index=pd.bdate_range('2022-01-03', periods=rows))
+
+
+def test_refresh_matches_per_stock_calculation(tmp_path):
+    store = HistoryStore(base_dir=str(tmp_path))
+    histories = {f"{i:06d}": _synthetic_history(i, rows) for i, rows in enumerate([120, 90, 200])}
+    for code, df in histories.items():
+        store.save(code, 'A', df)
+
+    snapshot = MarketSnapshot(history_store=store)
+    assert snapshot.refresh_from_history('A') == 3
+
+    indicator, scorer = TechnicalIndicator(), StockScorer()
+    table = snapshot.get_table('A').set_index('stock_code')
+    for code, df in histories.items():
+        expected = indicator.calculate_indicators(df)
+        breakdown = scorer.calculate_score_breakdown(expected)
+        row = table.loc[code]
+        assert row['last_bar_date'] == df.index[-1]
+        assert np.isclose(row['RSI'], expected['RSI'].iloc[-1])
+        assert np.isclose(row['price'], df['Close'].iloc[-1])
+        assert row['score'] == breakdown['score']
+        assert row['score_ma'] == breakdown['ma']
+
+    # 行情没有更新时不重新计算
+    assert snapshot.refresh_from_history('A') == 0
+
+    # 只有更新过的股票会被重新计算
+    time.sleep(0.01)
+    store.save('000001', 'A', _synthetic_history(1, 91))
+    assert snapshot.refresh_from_history('A') == 1
+    assert snapshot.get('000001', 'A')['last_bar_date'] == histories['000001'].index[-1] + pd.offsets.BDay(1)
+
+
+def test_update_ignores_older_bars(tmp_path):
+    snapshot = MarketSnapshot(history_store=HistoryStore(base_dir=str(tmp_path)))
+    df = TechnicalIndicator().calculate_indicators(_synthetic_history(3, 80))
+
+    snapshot.update('AAPL', 'US', df, 60, {'ma': 25}, '推荐')
+    snapshot.update('AAPL', 'US', df.iloc[:-1], 40, {'ma': 0}, '观望')
+
+    assert len(snapshot) == 1
+    assert snapshot.get('AAPL', 'US')['score'] == 60
+    assert list(snapshot.get_table('A')['stock_code']) == []
+
+
+def test_updates_in_place_beyond_initial_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(MarketSnapshot, 'INITIAL_CAPACITY', 4)
+    snapshot = MarketSnapshot(history_store=HistoryStore(base_dir=str(tmp_path)))
+    df = TechnicalIndicator().calculate_indicators(_synthetic_history(4, 80))
+
+    for i in range(10):
+        snapshot.update(f'{i:06d}', 'A', df, i, {'ma': i}, '观望')
+    snapshot.update('AAPL', 'US', df, 70, {'ma': 30}, '推荐')
+    before = snapshot.get_table('A')
+    snapshot.update('000003', 'A', df, 99, {'ma': 40}, '推荐')
+
+    table = snapshot.get_table('A').set_index('stock_code')
+    assert len(snapshot) == 11
+    assert len(table) == 10
+    assert table.loc['000003', 'score'] == 99
+    assert table.loc['000004', 'score'] == 4
+    assert before.set_index('stock_code').loc['000003', 'score'] == 3
+    assert snapshot.get('000003', 'A')['score'] == 99
+    assert list(snapshot.get_table('US')['stock_code']) == ['AAPL']
@@ -0,0 +1,39 @@
+import json
+
+from utils.mock_llm_server import MockLLMServer
+
+
+def test_fragmented_stream_is_reassembled(run_mock_llm, indicator_frame):
+    # 每个网络分块只有5个字节，SSE事件的行被拆到多个分块中
+    server = MockLLMServer(ttft=0, tokens_per_second=0, fragment_size=5)
+
+    async def consume(analyzer):
+        return [json.loads(m) async for m in analyzer.get_ai_analysis(indicator_frame(), '600000', 'A', stream=True)]
+
+    messages = run_mock_llm(consume, server)
+
+    text = "".join(m.get('ai_analysis_chunk', '') for m in messages)
+    assert text == server.build_content("分析A股 600000：")
+    assert messages[-1]['status'] == 'completed'
+    assert messages[-1]['recommendation'] == '持有'
+    assert server.stats['streams'] == 1
+
+
+def test_batch_prompt_and_error_injection(run_mock_llm, indicator_frame):
+    server = MockLLMServer(ttft=0, tokens_per_second=0, fragment_size=16)
+
+    async def consume(analyzer):
+        stocks = [('600000', indicator_frame(0)), ('000001', indicator_frame(1))]
+        batch = [json.loads(m) async for m in analyzer.get_batch_ai_analysis(stocks, 'A', stream=True)]
+        # 之后的请求全部返回错误
+        server.error_rate = 1.0
+        failed = [json.loads(m) async for m in analyzer.get_ai_analysis(indicator_frame(2), '600001', 'A', stream=True)]
+        return batch, failed
+
+    batch, failed = run_mock_llm(consume, server)
+
+    completed = {m['stock_code']: m for m in batch if m.get('status') == 'completed'}
+    assert set(completed) == {'600000', '000001'}
+    assert server.stats['requests'] == 2
+    assert failed[-1]['status'] == 'error'
+    assert '模拟的上游错误' in failed[-1]['error']
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from services.prompt_encoder import PromptEncoder, estimate_tokens, format_summary
+
+
+def _frame(rows=30):
+    index = pd.bdate_range('2024-01-01', periods=rows)
+    return pd.DataFrame({
+        'Close': np.linspace(10, 12, rows),
+        'Volume': np.full(rows, 123456.7),
+        'RSI': np.r_[np.nan, np.full(rows - 1, 45.678)],
+        'BB_Upper': np.full(rows, 13.0),
+    }, index=index)
+
+
+def test_encodes_needed_columns_as_rounded_csv():
+    encoder = PromptEncoder(columns=['Close', 'Volume', 'RSI', 'MACD'], max_rows=14, token_budget=1000)
+    table, rows = encoder.encode_table(_frame())
+    lines = table.split('\n')
+
+    assert rows == 14
+    assert lines[0] == 'Date,Close,Volume,RSI'
+    assert lines[-1] == '2024-02-09,12,123457,45.7'
+    assert 'BB_Upper' not in table
+
+
+def test_token_budget_drops_oldest_rows():
+    encoder = PromptEncoder(columns=['Close', 'Volume', 'RSI'], max_rows=14)
+    full, _ = encoder.encode_table(_frame())
+    table, rows = encoder.encode_table(_frame(), max_tokens=60)
+
+    assert rows < 14
+    assert estimate_tokens(table) <= 60 or rows == PromptEncoder.MIN_ROWS
+    assert full.endswith(table.split('\n', 1)[1])
+
+    encoder.record(table, rows)
+    assert encoder.metrics['prompts'] == 1 and encoder.metrics['truncated'] == 1
+
+
+def test_estimate_tokens_and_summary():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('分析A股') == 3 + 1
+    assert format_summary({'trend': 'upward', 'rsi_level': np.float64(45.678)}) == 'trend=upward, rsi_level=45.68'
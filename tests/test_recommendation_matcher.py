@@ -0,0 +1,86 @@
+import asyncio
+import json
+import random
+import re
+
+import httpx
+
+from services.ai_analyzer import AIAnalyzer
+from services.llm_scheduler import LLMScheduler
+from services.recommendation_matcher import KeywordMatcher, RecommendationTracker
+
+
+def _regex_recommendation(text):
+    match = re.search(r"##\s*投资建议\s*\n(.*?)(?:\n##|\Z)", text, re.DOTALL)
+    if match:
+        advice = match.group(1)
+        if "买入" in advice or "增持" in advice:
+            return "买入"
+        if "卖出" in advice or "减持" in advice:
+            return "卖出"
+        if "持有" in advice:
+            return "持有"
+    return "观望"
+
+
+def test_keyword_matcher_reports_overlapping_matches():
+    matcher = KeywordMatcher(['买入', '强烈买入', '入场'])
+    matches = [word for ch in '建议强烈买入场' for word in matcher.step(ch)]
+    assert sorted(matches) == ['买入', '入场', '强烈买入']
+
+
+def test_tracker_matches_regex_on_random_fragments():
+    rng = random.Random(0)
+    tokens = ['##', '#', ' ', '\n', '投资建议', '投资', '建议', '买', '入', '买入', '增持', '卖出', '减持',
+              '持有', '看涨', '强烈', '显著下跌', '观望', '。']
+    for _ in range(2000):
+        text = ''.join(rng.choice(tokens) for _ in range(rng.randint(0, 30)))
+        tracker = RecommendationTracker()
+        position = 0
+        while position < len(text):
+            size = rng.randint(1, 5)
+            tracker.feed(text[position:position + size])
+            position += size
+        assert tracker.recommendation == _regex_recommendation(text), repr(text)
+
+
+def test_tracker_announces_provisional_and_final_recommendation():
+    tracker = RecommendationTracker()
+    assert not tracker.feed("## 技术面\n短期看涨，可以持有。\n## 投资")
+    assert tracker.feed("建议\n谨慎持有")
+    assert (tracker.recommendation, tracker.final) == ('持有', False)
+    assert not tracker.feed("，不宜追高")
+    assert tracker.feed("；回调时增持。")
+    assert (tracker.recommendation, tracker.final) == ('买入', True)
+    assert tracker.keyword_score == 10
+
+
+def test_stream_pushes_recommendation_before_completion(monkeypatch, indicator_frame):
+    chunks = ["## 趋势\n震荡。\n## 投资", "建议\n逢低买", "入，止损9.5元。\n", "## 风险\n注意量能。\n"]
+
+    def handler(request):
+        events = []
+        for chunk in chunks:
+            events.append("data: " + json.dumps({'choices': [{'delta': {'content': chunk}}]}, ensure_ascii=False) + "\n\n")
+        return httpx.Response(200, content=("".join(events) + "data: [DONE]\n\n").encode('utf-8'))
+
+    analyzer = AIAnalyzer(custom_api_url='https://api.example.com', custom_api_key='sk-test', scheduler=LLMScheduler(),
+                          fallback_providers=[])
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr('services.ai_analyzer.http_client_pool.get_client', lambda url: client)
+        messages = [json.loads(m) async for m in analyzer.get_ai_analysis(indicator_frame(1), '600000', 'A', stream=True)]
+        await client.aclose()
+        return messages
+
+    messages = asyncio.run(run())
+
+    provisional = [i for i, m in enumerate(messages) if m.get('status') == 'analyzing' and 'recommendation' in m]
+    last_chunk = max(i for i, m in enumerate(messages) if 'ai_analysis_chunk' in m)
+    assert len(provisional) == 1
+    assert messages[provisional[0]]['recommendation'] == '买入'
+    assert messages[provisional[0]]['recommendation_final'] is True
+    assert provisional[0] < last_chunk
+    assert messages[-1]['status'] == 'completed'
+    assert messages[-1]['recommendation'] == '买入'
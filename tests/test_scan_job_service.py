@@ -0,0 +1,119 @@
+import asyncio
+
+import pandas as pd
+
+from services.scan_job_service import ScanJobService
+
+
+class FakePipeline:
+    """按代码返回固定评分的扫描流水线，可在指定分片上模拟崩溃"""
+
+    def __init__(self, crash_on=None):
+        self.crash_on = crash_on
+        self.scanned = []
+
+    async def run(self, codes, market_type='A'):
+        if self.crash_on is not None and self.crash_on in codes:
+            raise asyncio.CancelledError()
+        for code in codes:
+            self.scanned.append(code)
+            if code.endswith('9'):
+                yield {"stock_code": code, "error": "no data"}
+            else:
+                yield {"stock_code": code, "summary": {"stock_code": code, "score": int(code) % 100}}
+
+
+class FakeStockList:
+    async def get_stock_list(self, force_refresh=False):
+        return pd.DataFrame({
+            'symbol': ['000001', '600000', '600036'],
+            'industry': ['银行', '银行', '银行'],
+            'area': ['深圳', '上海', '深圳'],
+            'market': ['主板', '主板', '主板'],
+        })
+
+
+async def _wait(service, job_id):
+    while service.get_job(job_id)['status'] in ('pending', 'running'):
+        await asyncio.sleep(0.01)
+    return service.get_job(job_id)
+
+
+def test_job_runs_all_shards_and_aggregates(tmp_path):
+    async def scenario():
+        service = ScanJobService(FakePipeline(), jobs_dir=str(tmp_path), shard_size=4)
+        codes = [f"{i:06d}" for i in range(10)]
+        job = await service.create_job({"type": "codes", "codes": codes}, min_score=3)
+        done = await _wait(service, job['job_id'])
+        return done, service.get_results(job['job_id'], top=3)
+
+    done, results = asyncio.run(scenario())
+    assert done['status'] == 'completed'
+    assert done['shard_count'] == 3 and done['progress'] == 100.0
+    assert done['errors'] == 1
+    assert [item['stock_code'] for item in results['items']] == ['000008', '000007', '000006']
+    assert results['failed_codes'] == [{"stock_code": "000009", "error": "no data"}]
+
+
+def test_job_resumes_from_checkpoint_after_crash(tmp_path):
+    codes = [f"{i:06d}" for i in range(1, 9)]
+
+    async def crash_then_resume():
+        crashing = ScanJobService(FakePipeline(crash_on='000005'), jobs_dir=str(tmp_path), shard_size=4)
+        job = await crashing.create_job({"type": "codes", "codes": codes})
+        await asyncio.sleep(0.1)
+        # 模拟进程退出：任务状态仍为running，仅第一个分片有检查点
+        await crashing.shutdown()
+        assert crashing.get_job(job['job_id'])['status'] == 'running'
+
+        pipeline = FakePipeline()
+        restarted = ScanJobService(pipeline, jobs_dir=str(tmp_path), shard_size=4)
+        assert restarted.resume_jobs() == [job['job_id']]
+        done = await _wait(restarted, job['job_id'])
+        return done, pipeline.scanned
+
+    done, rescanned = asyncio.run(crash_then_resume())
+    assert done['status'] == 'completed'
+    assert done['processed'] == 8
+    assert rescanned == codes[4:]
+
+
+def test_filter_universe_uses_stock_list(tmp_path):
+    async def scenario():
+        service = ScanJobService(FakePipeline(), a_stock_list_service=FakeStockList(), jobs_dir=str(tmp_path))
+        job = await service.create_job({"type": "filter", "area": ["深圳"]})
+        await service.cancel_job(job['job_id'])
+        return job
+
+    job = asyncio.run(scenario())
+    assert job['total'] == 2
+
+
+class SlowPipeline(FakePipeline):
+    async def run(self, codes, market_type='A'):
+        await asyncio.sleep(0.05)
+        async for result in super().run(codes, market_type):
+            yield result
+
+
+def test_cancel_and_resume_are_not_overwritten_by_running_task(tmp_path):
+    codes = [f"{i:06d}" for i in range(1, 9)]
+
+    async def scenario():
+        service = ScanJobService(SlowPipeline(), jobs_dir=str(tmp_path), shard_size=2)
+        job = await service.create_job({"type": "codes", "codes": codes})
+        await asyncio.sleep(0.08)
+        cancelled = await service.cancel_job(job['job_id'])
+        await asyncio.sleep(0.1)
+        on_disk = ScanJobService(FakePipeline(), jobs_dir=str(tmp_path)).get_job(job['job_id'])
+        resumed = await service.resume_job(job['job_id'])
+        done = await _wait(service, job['job_id'])
+        return cancelled, on_disk, resumed, done
+
+    cancelled, on_disk, resumed, done = asyncio.run(scenario())
+    assert cancelled['status'] == on_disk['status'] == 'cancelled'
+    assert 0 < on_disk['completed_shard_count'] < 4
+    assert resumed['status'] == 'pending'
+    assert done['status'] == 'completed'
+    assert done['processed'] == 8
+    assert not list(tmp_path.rglob('*.tmp'))
@@ -0,0 +1,75 @@
+import asyncio
+
+import pandas as pd
+
+from services.scan_pipeline import ScanPipeline
+from services.stock_scorer import StockScorer
+from services.technical_indicator import TechnicalIndicator
+
+
+class FakeProvider:
+    def __init__(self, history, delays=None, failing=()):
+        self.history = history
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.fetched = []
+
+    async def get_stock_data(self, code, market_type='A', start_date=None, end_date=None):
+        await asyncio.sleep(self.delays.get(code, 0))
+        self.fetched.append(code)
+        if code in self.failing:
+            raise RuntimeError("network down")
+        if code == 'empty':
+            return pd.DataFrame()
+        return self.history(int(code), 90)
+
+
+def _pipeline(provider, **kwargs):
+    return ScanPipeline(provider, TechnicalIndicator(), StockScorer(), **kwargs)
+
+
+async def _collect(pipeline, codes):
+    return [result async for result in pipeline.run(codes)]
+
+
+def test_results_stream_in_completion_order(ohlcv_frame):
+    provider = FakeProvider(ohlcv_frame, delays={'000001': 0.2})
+    results = asyncio.run(_collect(_pipeline(provider), ['000001', '000002', '000003']))
+
+    assert [r['stock_code'] for r in results][-1] == '000001'
+    scorer = StockScorer()
+    for result in results:
+        df = TechnicalIndicator().calculate_indicators(ohlcv_frame(int(result['stock_code']), 90))
+        assert result['score'] == scorer.calculate_score(df)
+        assert result['recommendation'] == scorer.get_recommendation(result['score'])
+
+
+def test_errors_are_reported_per_stock(ohlcv_frame):
+    provider = FakeProvider(ohlcv_frame, failing={'000002'})
+    results = {r['stock_code']: r for r in asyncio.run(_collect(_pipeline(provider), ['000001', '000002', 'empty']))}
+
+    assert 'score' in results['000001']
+    assert 'error' in results['000002']
+    assert 'error' in results['empty']
+
+
+def test_bounded_queues_apply_backpressure(ohlcv_frame):
+    provider = FakeProvider(ohlcv_frame)
+    codes = [f"{i:06d}" for i in range(1, 60)]
+
+    async def consume_slowly():
+        pipeline = _pipeline(provider, fetch_concurrency=2, compute_concurrency=1, queue_size=2)
+        seen = 0
+        async for _ in pipeline.run(codes):
+            seen += 1
+            if seen == 3:
+                await asyncio.sleep(0.2)
+                # 消费方停滞时，已获取的数量受队列容量和并发数限制
+                fetched_while_stalled = len(provider.fetched)
+                break
+        await asyncio.sleep(0.05)
+        return fetched_while_stalled
+
+    fetched = asyncio.run(consume_slowly())
+    assert fetched <= 3 + 2 + 1 + 2 + 2
+    assert len(provider.fetched) < len(codes)
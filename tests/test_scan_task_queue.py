@@ -0,0 +1,105 @@
+import asyncio
+
+from services.scan_task_queue import ScanTaskQueue
+
+
+def test_make_key_normalizes_code_order():
+    assert ScanTaskQueue.make_key(['600000', '000001'], 'A') == ScanTaskQueue.make_key(['000001', ' 600000'], 'A')
+    assert ScanTaskQueue.make_key(['600000'], 'A') != ScanTaskQueue.make_key(['600000'], 'A', min_score=60)
+    assert ScanTaskQueue.make_key(['600000'], 'A', top_k=5) != ScanTaskQueue.make_key(['600000'], 'A', top_k=10)
+
+
+def test_identical_scans_share_one_run():
+    runs = []
+
+    def factory():
+        async def scan():
+            runs.append(1)
+            for i in range(5):
+                await asyncio.sleep(0.01)
+                yield f"chunk{i}"
+        return scan()
+
+    async def collect(queue, delay):
+        await asyncio.sleep(delay)
+        return [chunk async for chunk in queue.subscribe('key', factory)]
+
+    async def scenario():
+        queue = ScanTaskQueue()
+        # 第二个订阅者在扫描进行中加入，第三个在扫描结束后加入
+        results = await asyncio.gather(collect(queue, 0), collect(queue, 0.025), collect(queue, 0.2))
+        await queue.shutdown()
+        return results
+
+    results = asyncio.run(scenario())
+    expected = [f"chunk{i}" for i in range(5)]
+    assert results == [expected, expected, expected]
+    assert len(runs) == 1
+
+
+def test_failed_scan_is_not_cached():
+    runs = []
+
+    def factory():
+        async def scan():
+            runs.append(1)
+            yield "partial"
+            raise RuntimeError("upstream failed")
+        return scan()
+
+    async def scenario():
+        queue = ScanTaskQueue()
+        for _ in range(2):
+            received = []
+            try:
+                async for chunk in queue.subscribe('key', factory):
+                    received.append(chunk)
+            except RuntimeError:
+                pass
+            assert received == ["partial"]
+
+    asyncio.run(scenario())
+    assert len(runs) == 2
+
+
+def test_scan_yielding_error_is_not_cached():
+    runs = []
+
+    def factory():
+        async def scan():
+            runs.append(1)
+            yield '{"stock_code": "600000", "score": 80}'
+            yield '{"error": "批量扫描股票时出错: upstream failed"}'
+        return scan()
+
+    async def scenario():
+        queue = ScanTaskQueue()
+        for _ in range(2):
+            received = [chunk async for chunk in queue.subscribe('key', factory)]
+            assert received[-1].startswith('{"error"')
+        assert queue.get_stats()['finished'] == 0
+
+    asyncio.run(scenario())
+    assert len(runs) == 2
+
+
+def test_scan_with_per_stock_errors_is_cached():
+    runs = []
+
+    def factory():
+        async def scan():
+            runs.append(1)
+            yield '{"stock_code": "600000", "score": 80}'
+            yield '{"stock_code": "999999", "error": "获取数据失败", "status": "error"}'
+            yield '{"scan_completed": true}'
+        return scan()
+
+    async def scenario():
+        queue = ScanTaskQueue()
+        first = [chunk async for chunk in queue.subscribe('key', factory)]
+        second = [chunk async for chunk in queue.subscribe('key', factory)]
+        assert first == second
+        assert queue.get_stats()['finished'] == 1
+
+    asyncio.run(scenario())
+    assert len(runs) == 1
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import random
+
+from utils.sse import SSEDecoder, iter_sse_data, loads
+
+
+def _decode(body: bytes, sizes):
+    decoder = SSEDecoder()
+    events, position = [], 0
+    for size in sizes:
+        events += decoder.feed(body[position:position + size])
+        position += size
+    events += decoder.feed(body[position:])
+    return events + decoder.flush()
+
+
+def test_events_survive_arbitrary_chunk_boundaries():
+    payloads = [json.dumps({"choices": [{"delta": {"content": f"内容{i}"}}]}, ensure_ascii=False) for i in range(50)]
+    body = "".join(f"data: {p}\r\n\r\n" for p in payloads).encode('utf-8') + b"data: [DONE]\n\n"
+
+    rng = random.Random(0)
+    for _ in range(20):
+        # 随机切块，边界可能落在多字节字符或\r\n中间
+        sizes = [rng.randint(1, 40) for _ in range(len(body) // 10)]
+        assert _decode(body, sizes) == payloads + ["[DONE]"]
+
+
+def test_multiline_data_comments_and_raw_json_lines():
+    body = (b": keep-alive\n"
+            b"event: message\nid: 1\ndata: line1\ndata: line2\n\n"
+            b'{"error": {"message": "quota"}}\n'
+            b"data: tail-without-newline")
+    events = _decode(body, [7, 13, 5])
+
+    assert events[0] == "line1\nline2"
+    assert loads(events[1])["error"]["message"] == "quota"
+    assert events[2] == "tail-without-newline"
+
+
+def test_iter_sse_data():
+    async def chunks():
+        for piece in (b"da", b"ta: {\"a\"", b": 1}\n", b"\n"):
+            yield piece
+
+    async def collect():
+        return [loads(data) async for data in iter_sse_data(chunks())]
+
+    assert asyncio.run(collect()) == [{"a": 1}]
@@ -0,0 +1,18 @@
+from services.stock_analyzer_service import StockAnalyzerService
+
+
+def test_with_api_config_shares_components():
+    service = StockAnalyzerService()
+
+    assert service.with_api_config() is service
+
+    custom = service.with_api_config(custom_api_url="https://example.com/v1", custom_api_key="sk-test", custom_api_timeout="30")
+    assert custom is not service
+    assert custom.data_provider is service.data_provider
+    assert custom.scan_pipeline is service.scan_pipeline
+    assert custom.ai_analyzer.API_URL == "https://example.com/v1"
+    assert custom.ai_analyzer.API_KEY == "sk-test"
+    assert custom.ai_analyzer.API_TIMEOUT == 30
+    assert custom.ai_analyzer.API_MODEL == service.ai_analyzer.API_MODEL
+    # 原实例的配置不受影响
+    assert service.ai_analyzer.API_KEY != "sk-test"
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.scoring_rules import ScoringRuleEngine, compile_expression
+from services.stock_scorer import StockScorer
+
+
+def _legacy_score(row) -> int:
+    """原硬编码评分逻辑，用于校验规则引擎的等价性"""
+    score = 0
+    if row['MA5'] > row['MA20'] > row['MA60']:
+        score += 25
+    elif row['MA5'] > row['MA20']:
+        score += 15
+    elif row['Close'] > row['MA20']:
+        score += 10
+
+    rsi = row['RSI']
+    if 45 <= rsi <= 55:
+        score += 15
+    elif 55 < rsi < 70:
+        score += 25
+    elif 30 < rsi < 45:
+        score += 10
+    elif rsi >= 70:
+        score += 5
+    elif rsi <= 30:
+        score += 15
+
+    if row['MACD'] > row['Signal']:
+        score += 20
+
+    if row['Volume_Ratio'] > 1.5:
+        score += 30
+    elif row['Volume_Ratio'] > 1:
+        score += 15
+    return score
+
+
+def _random_indicators(rows: int = 500, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Close': rng.uniform(8, 12, rows),
+        'MA5': rng.uniform(8, 12, rows),
+        'MA20': rng.uniform(8, 12, rows),
+        'MA60': rng.uniform(8, 12, rows),
+        'RSI': rng.choice([30, 45, 55, 70], rows) + rng.choice([0, 0.5, -0.5], rows),
+        'MACD': rng.normal(0, 1, rows),
+        'Signal': rng.normal(0, 1, rows),
+        'Volume_Ratio': rng.choice([0.5, 1.0, 1.2, 1.5, 2.0], rows),
+    })
+    # 加入缺失值，验证NaN比较与原逻辑一致
+    df.loc[df.sample(frac=0.05, random_state=seed).index, 'RSI'] = np.nan
+    return df
+
+
+def test_default_rules_match_legacy_scoring():
+    df = _random_indicators()
+    scorer = StockScorer()
+
+    scores = scorer.score_frame(df)['score']
+    expected = df.apply(_legacy_score, axis=1)
+
+    assert (scores.to_numpy() == expected.to_numpy()).all()
+    assert scorer.calculate_score(df) == expected.iloc[-1]
+
+
+def test_breakdown_sums_to_total():
+    df = _random_indicators(rows=50)
+    breakdown = StockScorer().calculate_score_breakdown(df)
+
+    assert set(breakdown) == {'ma', 'rsi', 'macd', 'volume', 'score'}
+    assert breakdown['score'] == sum(v for k, v in breakdown.items() if k != 'score')
+
+
+def test_batch_score_stocks_sorted_and_recommended():
+    df = _random_indicators(rows=40)
+    stock_dfs = {f"{i:06d}": df.iloc[: i + 1] for i in range(40)}
+    scorer = StockScorer()
+
+    results = scorer.batch_score_stocks(stock_dfs)
+
+    assert len(results) == 40
+    assert [r[1] for r in results] == sorted((r[1] for r in results), reverse=True)
+    for code, score, rec in results:
+        assert score == _legacy_score(stock_dfs[code].iloc[-1])
+        assert rec == scorer.get_recommendation(score)
+
+
+def test_batch_skips_only_stocks_with_non_numeric_fields():
+    df = _random_indicators(rows=3)
+    bad = df.astype({'RSI': object})
+    bad.iloc[-1, bad.columns.get_loc('RSI')] = 'n/a'
+    missing = df.copy()
+    missing.iloc[-1, missing.columns.get_loc('RSI')] = np.nan
+    scorer = StockScorer()
+
+    results = scorer.batch_score_stocks({'600000': df, '600001': bad, '600002': missing})
+
+    assert sorted(code for code, _, _ in results) == ['600000', '600002']
+    assert dict((code, score) for code, score, _ in results)['600000'] == _legacy_score(df.iloc[-1])
+
+
+@pytest.mark.parametrize("score,expected", [
+    (100, "强烈推荐"), (80, "强烈推荐"), (75, "推荐"), (60, "谨慎推荐"),
+    (45, "观望"), (20, "不推荐"), (5, "强烈不推荐"),
+])
+def test_recommendation_thresholds(score, expected):
+    assert StockScorer().get_recommendation(score) == expected
+
+
+def test_custom_rules_and_panel_evaluation():
+    engine = ScoringRuleEngine({
+        "name": "momentum",
+        "components": [
+            {"name": "trend", "rules": [{"when": "Close > MA20 and not (RSI >= 80)", "score": 60}]},
+            {"name": "volume", "rules": ["Volume_Ratio > 2 → +40"]},
+        ],
+        "recommendations": [{"min_score": 60, "label": "买入"}],
+        "default_recommendation": "观望",
+    })
+    panel = {
+        'Close': np.array([[10.0, 9.0], [11.0, 12.0]]),
+        'MA20': np.array([[9.5, 9.5], [10.0, 10.0]]),
+        'RSI': np.array([[50.0, 50.0], [85.0, 60.0]]),
+        'Volume_Ratio': np.array([[3.0, 1.0], [1.0, 2.5]]),
+    }
+
+    result = engine.evaluate(panel)
+
+    assert result['score'].tolist() == [[100, 0], [0, 100]]
+    assert engine.recommend(result['score']).tolist() == [["买入", "观望"], ["观望", "买入"]]
+
+
+def test_expression_rejects_unsafe_syntax():
+    with pytest.raises(ValueError):
+        compile_expression("__import__('os').system('ls')")
+    with pytest.raises(ValueError):
+        compile_expression("Close.__class__")
+
+
+def test_expression_string_membership():
+    expr = compile_expression("industry in ['银行', '证券'] and RSI < 30")
+    ns = {'industry': np.array(['银行', '白酒', '证券'], dtype=object), 'RSI': np.array([20.0, 10.0, 40.0])}
+    assert expr(ns).tolist() == [True, False, False]
@@ -0,0 +1,70 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.history_store import HistoryStore
+from services.market_snapshot import MarketSnapshot
+from services.stock_screener import StockScreener
+from services.technical_indicator import TechnicalIndicator
+
+
+class _FakeStockList:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_stock_list(self):
+        self.calls += 1
+        return pd.DataFrame({
+            'ts_code': ['600000.SH', '000001.SZ', '600519.SH'],
+            'symbol': ['600000', '000001', '600519'],
+            'name': ['浦发银行', '平安银行', '贵州茅台'],
+            'area': ['上海', '深圳', '贵州'],
+            'industry': ['银行', '银行', '白酒'],
+            'market': ['主板', '主板', '主板'],
+            'list_date': ['19991110', '19910403', '20010827'],
+        })
+
+
+def _snapshot(tmp_path):
+    snapshot = MarketSnapshot(history_store=HistoryStore(base_dir=str(tmp_path)))
+    indicator = TechnicalIndicator()
+    for i, (code, score) in enumerate([('600000', 40), ('000001', 75), ('600519', 90)]):
+        rng = np.random.default_rng(i)
+        close = 10 + np.cumsum(rng.normal(0, 0.2, 80))
+        df = pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close,
+                           'Volume': rng.uniform(1e5, 2e5, 80)}, index=pd.bdate_range('2024-01-01', periods=80))
+        snapshot.update(code, 'A', indicator.calculate_indicators(df), score, {}, '观望')
+    return snapshot
+
+
+def test_screen_filters_joined_metadata_and_sorts(tmp_path):
+    stock_list = _FakeStockList()
+    screener = StockScreener(_snapshot(tmp_path), stock_list)
+
+    result = asyncio.run(screener.screen("industry == '银行' and score > 30", page_size=1))
+    assert result['total'] == 2
+    assert [item['stock_code'] for item in result['items']] == ['000001']
+    assert result['items'][0]['name'] == '平安银行'
+
+    page2 = asyncio.run(screener.screen("industry in ['银行'] and not score > 50", sort_by='price', ascending=True))
+    assert [item['stock_code'] for item in page2['items']] == ['600000']
+
+    everything = asyncio.run(screener.screen('', columns=['stock_code', 'score']))
+    assert [item['stock_code'] for item in everything['items']] == ['600519', '000001', '600000']
+    assert everything['columns'] == ['stock_code', 'score']
+    # 基础信息每个交易日只加载一次
+    assert stock_list.calls == 1
+
+
+def test_screen_rejects_unknown_fields(tmp_path):
+    screener = StockScreener(_snapshot(tmp_path), _FakeStockList())
+    with pytest.raises(ValueError):
+        asyncio.run(screener.screen("PE < 10"))
+    with pytest.raises(ValueError):
+        asyncio.run(screener.screen("__import__('os')"))
+    with pytest.raises(ValueError):
+        asyncio.run(screener.screen("industry > 3"))
+    with pytest.raises(ValueError):
+        asyncio.run(screener.screen("", sort_by='PE'))
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from services.top_k_collector import TopKCollector
+
+
+def test_keeps_only_highest_scores():
+    scores = list(range(100))
+    random.Random(3).shuffle(scores)
+    collector = TopKCollector(k=10)
+
+    for i, score in enumerate(scores):
+        collector.push(f"{i:06d}", score)
+
+    top = collector.snapshot()
+    assert len(collector) == 10
+    assert [score for _, score, _ in top] == list(range(99, 89, -1))
+    assert collector.threshold == 90
+    assert collector.total_seen == 100
+
+
+def test_min_score_filters_and_counts():
+    collector = TopKCollector(k=3, min_score=50)
+
+    for code, score in [("a", 10), ("b", 60), ("c", 49), ("d", 70)]:
+        collector.push(code, score)
+
+    assert [code for code, _, _ in collector.snapshot()] == ["d", "b"]
+    assert collector.total_seen == 4
+    assert collector.total_matched == 2
+    assert collector.threshold is None
+
+
+def test_ties_prefer_earlier_results_and_track_changes():
+    collector = TopKCollector(k=2)
+    assert collector.push("first", 80, "payload-1")
+    assert collector.push("second", 80)
+    collector.snapshot()
+
+    assert not collector.push("third", 80)
+    assert not collector.changed
+    assert collector.push("fourth", 90)
+    assert collector.changed
+    assert collector.snapshot() == [("fourth", 90, None), ("first", 80, "payload-1")]
+
+
+def test_rejects_non_positive_k():
+    with pytest.raises(ValueError):
+        TopKCollector(k=0)
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pandas as pd
+
+from services.us_stock_service_async import USStockServiceAsync
+from utils.refresh_cache import RefreshingCache
+from utils.search_index import SearchIndex
+
+
+def _spot_frame():
+    return pd.DataFrame({
+        'name': ['Apple Hospitality REIT Inc', 'Apple Inc', 'Pineapple Energy Inc', 'Applied Materials Inc', None],
+        'symbol': ['106.APLE', '105.AAPL', '105.PEGY', '105.AMAT', '105.NONE'],
+        'price': [11.94, 210.14, 1.2, None, 3.0],
+        'market_value': [2.85e9, 3.2e12, 1.0e7, 1.4e11, None],
+        'price_change_percent': ['1.5%', '0.41%', '-2%', None, '0%'],
+    })
+
+
+def test_search_index_ranks_exact_then_prefix_then_substring():
+    index = SearchIndex([('105.AAPL', 'AAPL', 'Apple Inc'), ('106.APLE', 'APLE', 'Apple Hospitality'),
+                         ('105.PEGY', 'PEGY', 'Pineapple Energy'), ('105.ZZZ', 'ZZZ', 'Zeta')])
+
+    assert index.search('aple') == [1]
+    assert index.search('APPLE') == [0, 1, 2]
+    assert index.search('pple', limit=2) == [0, 1]
+    assert index.search('p', limit=10) == [2, 0, 1]
+    assert index.search('xyz') == []
+
+
+def test_search_uses_cached_table(monkeypatch):
+    service = USStockServiceAsync()
+    calls = []
+    monkeypatch.setattr(service, '_get_us_stocks_data', lambda: calls.append(1) or _spot_frame())
+
+    async def run():
+        first = await service.search_us_stocks('apple')
+        second = await asyncio.gather(*(service.search_us_stocks('aapl') for _ in range(5)))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert len(calls) == 1
+    # 市值大的排在前面
+    assert [item['symbol'] for item in first] == ['105.AAPL', '106.APLE', '105.PEGY']
+    assert first[0] == {'name': 'Apple Inc', 'symbol': '105.AAPL', 'price': 210.14, 'market_value': 3.2e12}
+    assert second[0][0]['symbol'] == '105.AAPL'
+
+
+def test_aclose_cancels_background_refresh(monkeypatch):
+    service = USStockServiceAsync()
+    monkeypatch.setattr(service, '_get_us_stocks_data', _spot_frame)
+
+    async def run():
+        await service.search_us_stocks('apple')
+        service._cache.timestamp = time.monotonic() - service.CACHE_TTL - 1
+        # 过期后先返回旧值并在后台刷新，关闭服务时取消该刷新
+        stale = await service.search_us_stocks('apple')
+        refreshing = list(service._cache._tasks)
+        await service.aclose()
+        return stale, refreshing
+
+    stale, refreshing = asyncio.run(run())
+
+    assert stale[0]['symbol'] == '105.AAPL'
+    assert len(refreshing) == 1 and refreshing[0].cancelled()
+
+
+def test_refreshing_cache_serves_stale_value_while_revalidating():
+    loads = []
+
+    async def loader():
+        loads.append(len(loads))
+        await asyncio.sleep(0.05)
+        return len(loads)
+
+    async def run():
+        cache = RefreshingCache(loader, ttl=60)
+        # 并发的未命中只加载一次
+        first = await asyncio.gather(*(cache.get() for _ in range(5)))
+        cache.timestamp = time.monotonic() - 61
+        stale = await cache.get()
+        await asyncio.sleep(0.1)
+        fresh = await cache.get()
+        return first, stale, fresh
+
+    first, stale, fresh = asyncio.run(run())
+
+    assert first == [1] * 5
+    assert stale == 1
+    assert fresh == 2
+    assert len(loads) == 2
+
+
+def test_detail_uses_symbol_index_with_normalized_columns(monkeypatch):
+    service = USStockServiceAsync()
+    monkeypatch.setattr(service, '_get_us_stocks_data', _spot_frame)
+
+    async def run():
+        return await service.get_us_stock_detail('106.APLE'), await service.get_us_stock_detail('105.AMAT')
+
+    aple, amat = asyncio.run(run())
+
+    assert aple['price_change_percent'] == 0.015
+    assert aple['price'] == 11.94
+    assert aple['pe_ratio'] == 0.0
+    assert amat['price'] == 0.0 and amat['price_change_percent'] == 0.0
+    assert list(aple)[:3] == ['name', 'symbol', 'price']
@@ -0,0 +1,71 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, Iterable, TypeVar
+
+T = TypeVar('T')
+
+# 单个生成器结束的标记
+_FINISHED = object()
+
+
+async def merge_async_generators(generators: Iterable[AsyncIterator[T]], max_concurrency: int = 3,
+                                 buffer_size: int = 64) -> AsyncGenerator[T, None]:
+    """
+    以有界并发同时消费多个异步生成器，并按产出顺序交错合并输出
+
+    同一时刻最多运行max_concurrency个生成器，任意一个结束后再启动下一个；
+    调用方提前退出时会取消并关闭所有仍在运行的生成器
+
+    Args:
+        generators: 异步生成器序列（按启动顺序）
+        max_concurrency: 最大并发数
+        buffer_size: 合并缓冲区大小，消费方变慢时对生成器形成反压
+
+    Returns:
+        合并后的异步生成器
+    """
+    pending = iter(generators)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+    tasks = set()
+
+    async def pump(generator: AsyncIterator[T]):
+        try:
+            async for item in generator:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            # 确保生成器内部的资源（如HTTP流）被释放
+            if hasattr(generator, 'aclose'):
+                await generator.aclose()
+        await queue.put(_FINISHED)
+
+    def start_next() -> bool:
+        generator = next(pending, None)
+        if generator is None:
+            return False
+        tasks.add(asyncio.create_task(pump(generator)))
+        return True
+
+    active = 0
+    for _ in range(max(1, max_concurrency)):
+        if not start_next():
+            break
+        active += 1
+
+    try:
+        while active:
+            item = await queue.get()
+            if item is _FINISHED:
+                active -= 1
+                if start_next():
+                    active += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,83 @@
+import asyncio
+from typing import AsyncGenerator, Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class BroadcastStream(Generic[T]):
+    """
+    单生产者、多订阅者的广播流
+
+    生产者产出的每条消息都保存在重放缓冲区中：订阅者加入时先重放已有消息，再跟随实时输出，
+    流结束后新的订阅者可直接获取完整结果
+    """
+
+    def __init__(self):
+        self._items: List[T] = []
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._updated = asyncio.Event()
+        self.subscriber_count = 0
+
+    @property
+    def closed(self) -> bool:
+        """流是否已结束"""
+        return self._closed
+
+    @property
+    def items(self) -> List[T]:
+        """已产出的全部消息"""
+        return list(self._items)
+
+    def publish(self, item: T) -> None:
+        """
+        发布一条消息
+
+        Args:
+            item: 消息
+        """
+        if self._closed:
+            raise RuntimeError("广播流已结束")
+        self._items.append(item)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """
+        结束广播流
+
+        Args:
+            error: 生产者出错时的异常，会在订阅者读完缓冲区后抛出
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        # 唤醒所有等待中的订阅者，并为下一轮等待准备新的事件
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def subscribe(self) -> AsyncGenerator[T, None]:
+        """
+        订阅广播流：先重放已产出的消息，再跟随实时输出直到流结束
+
+        Returns:
+            异步生成器，逐条生成消息
+        """
+        self.subscriber_count += 1
+        position = 0
+        try:
+            while True:
+                while position < len(self._items):
+                    item = self._items[position]
+                    position += 1
+                    yield item
+                if self._closed:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                await self._updated.wait()
+        finally:
+            self.subscriber_count -= 1
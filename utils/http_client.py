@@ -0,0 +1,103 @@
+import asyncio
+import importlib.util
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import httpx
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+
+class HTTPClientPool:
+    """
+    进程级HTTP客户端池
+
+    按API的源地址（协议、主机、端口）复用httpx.AsyncClient，保持长连接，
+    避免每次AI调用都重新建立TCP和TLS连接；超时时间由每个请求单独指定
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None, http2: Optional[bool] = None):
+        """
+        初始化HTTP客户端池
+
+        Args:
+            max_connections: 每个源地址的最大连接数，默认读取HTTP_MAX_CONNECTIONS（20）
+            max_keepalive_connections: 每个源地址保持的空闲连接数，默认读取HTTP_MAX_KEEPALIVE（10）
+            keepalive_expiry: 空闲连接的保持时间（秒），默认读取HTTP_KEEPALIVE_EXPIRY（60）
+            http2: 是否启用HTTP/2，默认读取HTTP2_ENABLED；需要安装h2，未安装时退回HTTP/1.1
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv('HTTP_MAX_CONNECTIONS', 20)),
+            max_keepalive_connections=max_keepalive_connections or int(os.getenv('HTTP_MAX_KEEPALIVE', 10)),
+            keepalive_expiry=keepalive_expiry or float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60)),
+        )
+
+        if http2 is None:
+            http2 = os.getenv('HTTP2_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        if http2 and importlib.util.find_spec('h2') is None:
+            logger.warning("未安装h2，HTTP/2不可用，使用HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+    @staticmethod
+    def origin(url: str) -> str:
+        """获取URL的源地址，作为客户端池的键"""
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """
+        获取与URL源地址对应的共享客户端
+
+        Args:
+            url: 请求URL
+
+        Returns:
+            共享的httpx.AsyncClient，调用方不应关闭
+        """
+        key = self.origin(url)
+        loop = asyncio.get_running_loop()
+
+        entry = self._clients.get(key)
+        if entry is not None:
+            client, client_loop = entry
+            # 客户端只能在创建它的事件循环中使用
+            if client_loop is loop and not client.is_closed:
+                return client
+
+        client = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+        self._clients[key] = (client, loop)
+        logger.debug(f"创建共享HTTP客户端: {key}, HTTP/2: {self.http2}")
+        return client
+
+    @asynccontextmanager
+    async def client(self, url: str) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        以上下文管理器的形式获取共享客户端，退出时不关闭连接
+
+        Args:
+            url: 请求URL
+
+        Returns:
+            共享的httpx.AsyncClient
+        """
+        yield self.get_client(url)
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环中创建的全部客户端"""
+        loop = asyncio.get_running_loop()
+        clients = [client for client, client_loop in self._clients.values() if client_loop is loop]
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        logger.debug(f"已关闭 {len(clients)} 个共享HTTP客户端")
+
+
+# 进程内共享的HTTP客户端池
+http_client_pool = HTTPClientPool()
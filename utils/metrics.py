@@ -0,0 +1,210 @@
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 标签以排序后的 (名称, 值) 元组表示，作为指标序列的键
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = ['{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in items]
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """
+    固定分桶的直方图
+
+    记录观测值的分桶计数、总和与数量，分位数按桶内线性插值估算
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        """
+        初始化直方图
+
+        Args:
+            buckets: 升序排列的桶上界（不含+Inf）
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """记录一个观测值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        估算分位数
+
+        Args:
+            q: 分位（0~1）
+
+        Returns:
+            估算值，没有观测值时返回None；落在最后一个桶之外时返回最大的桶上界
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1] if self.buckets else None
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1] if self.buckets else None
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """返回数量、均值和常用分位数"""
+        def rounded(value):
+            return None if value is None else round(value, 4)
+
+        return {
+            "count": self.count,
+            "mean": rounded(self.sum / self.count) if self.count else None,
+            "p50": rounded(self.quantile(0.5)),
+            "p95": rounded(self.quantile(0.95)),
+            "p99": rounded(self.quantile(0.99)),
+        }
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表
+
+    支持带标签的计数器和直方图，可输出Prometheus文本格式；
+    各服务线程（主应用和管理接口）共享同一个实例，内部加锁保护
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    def register_counter(self, name: str, help_text: str = '') -> None:
+        """注册计数器"""
+        with self._lock:
+            self._help[name] = ('counter', help_text)
+            self._counters.setdefault(name, {})
+
+    def register_histogram(self, name: str, buckets: Sequence[float], help_text: str = '') -> None:
+        """注册直方图"""
+        with self._lock:
+            self._help[name] = ('histogram', help_text)
+            self._buckets[name] = tuple(buckets)
+            self._histograms.setdefault(name, {})
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1) -> None:
+        """
+        增加计数器
+
+        Args:
+            name: 指标名称
+            labels: 标签
+            value: 增加的值
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        向直方图记录观测值
+
+        Args:
+            name: 指标名称（需先注册）
+            value: 观测值
+            labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def counters(self, name: str) -> Dict[LabelKey, float]:
+        """返回计数器各标签序列的值"""
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    def quantile(self, name: str, labels: Optional[Dict[str, str]], q: float, min_count: int = 1) -> Optional[float]:
+        """
+        估算单个标签序列的分位数
+
+        Args:
+            name: 直方图名称
+            labels: 标签
+            q: 分位（0~1）
+            min_count: 观测值少于该数量时视为样本不足
+
+        Returns:
+            估算值，序列不存在或样本不足时返回None
+        """
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_label_key(labels))
+            if histogram is None or histogram.count < min_count:
+                return None
+            return histogram.quantile(q)
+
+    def histograms(self, name: str) -> Dict[LabelKey, Dict[str, Optional[float]]]:
+        """返回直方图各标签序列的数量、均值和分位数"""
+        with self._lock:
+            return {key: histogram.summary() for key, histogram in self._histograms.get(name, {}).items()}
+
+    def render_prometheus(self) -> str:
+        """
+        输出Prometheus文本格式
+
+        Returns:
+            指标文本
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+                if kind == 'counter':
+                    for key, value in sorted(self._counters.get(name, {}).items()):
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                    continue
+
+                for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + [math.inf], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内共享的指标注册表
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+# 批量分析提示词中的股票标记行
+_MARKER_PATTERN = re.compile(r'^=== (\S+) ===$', re.MULTILINE)
+
+# 单只股票的模拟分析内容
+_ANALYSIS_TEMPLATE = """## 趋势分析
+{code} 短期均线位于长期均线上方，整体呈震荡上行趋势，下方支撑位关注近期低点，上方压力位关注前高。
+
+## 成交量分析
+成交量较前期温和放大，量价配合良好，资金关注度有所提升。
+
+## 风险评估
+波动率处于中等水平，需关注大盘系统性风险及行业政策变化。
+
+## 目标价位
+短期目标价位参考前高附近，中期目标价位视量能持续情况而定。
+
+## 投资建议
+建议持有，回调至支撑位附近可逢低关注，跌破支撑位止损。
+"""
+
+
+class MockLLMServer:
+    """
+    本地模拟的OpenAI兼容流式接口
+
+    实现 /v1/chat/completions（流式SSE与非流式）和 /v1/models，无需API密钥和网络。
+    可配置首个内容片段延迟（TTFT）、输出速率、网络分块大小（分块边界会落在一行的中间）和错误注入，
+    用于离线测试、压测和分析AI分析链路的吞吐与内存
+    """
+
+    def __init__(self, ttft: float = 0.2, tokens_per_second: float = 50, chars_per_token: int = 2,
+                 fragment_size: int = 0, error_rate: float = 0.0, error_status: int = 500,
+                 retry_after: Optional[float] = None, stream_error_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 20.0, content: Optional[str] = None,
+                 seed: Optional[int] = None):
+        """
+        初始化模拟服务
+
+        Args:
+            ttft: 收到请求到首个内容片段的延迟（秒）
+            tokens_per_second: 每秒输出的内容片段数，0为不限速
+            chars_per_token: 每个内容片段的字符数
+            fragment_size: 网络分块的字节数，0为每个SSE事件一个分块；较小的值会把一行拆到多个分块中
+            error_rate: 直接返回错误响应的概率
+            error_status: 错误响应的HTTP状态码，为429时附带Retry-After
+            retry_after: 429响应的Retry-After秒数
+            stream_error_rate: 输出中途发送错误事件并结束的概率
+            stall_rate: 首个内容片段前额外停顿的概率，用于模拟上游偶发卡顿
+            stall_seconds: 额外停顿的秒数
+            content: 固定的回复内容，默认按提示词中的股票代码生成
+            seed: 随机数种子，用于复现错误注入
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chars_per_token = max(1, chars_per_token)
+        self.fragment_size = fragment_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stream_error_rate = stream_error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.content = content
+        self._random = random.Random(seed)
+
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "stream_errors": 0, "stalls": 0,
+                      "active": 0, "max_active": 0}
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def port(self) -> int:
+        """监听端口"""
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        """API地址，可直接作为API_URL使用"""
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> 'MockLLMServer':
+        """
+        启动服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0为随机端口
+
+        Returns:
+            当前实例
+        """
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"模拟AI接口已启动: {self.url}")
+        return self
+
+    async def stop(self) -> None:
+        """停止服务"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> 'MockLLMServer':
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    def build_content(self, prompt: str) -> str:
+        """
+        生成回复内容：批量分析提示词按其中的股票标记分节回复，否则回复单只股票的分析
+
+        Args:
+            prompt: 提示词
+
+        Returns:
+            回复内容
+        """
+        if self.content is not None:
+            return self.content
+        codes = _MARKER_PATTERN.findall(prompt)
+        if codes:
+            return "\n".join(f"=== {code} ===\n{_ANALYSIS_TEMPLATE.format(code=code)}" for code in codes)
+        match = re.search(r'分析\S*\s+(\S+?)[：:]', prompt)
+        return _ANALYSIS_TEMPLATE.format(code=match.group(1) if match else '该股票')
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个连接上的请求（支持长连接）"""
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._handle_request(method, path, body, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # 客户端断开或服务停止时保持的空闲长连接被取消
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        method, path, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+        return method, path, headers, body
+
+    async def _handle_request(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        path = path.split('?', 1)[0].rstrip('/')
+        if method == 'GET' and path.endswith('/models'):
+            await self._send_json(writer, 200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+            return
+        if method != 'POST' or not path.endswith('/chat/completions'):
+            await self._send_json(writer, 404, {"error": {"message": f"未知接口: {method} {path}"}})
+            return
+
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            await self._send_json(writer, 400, {"error": {"message": "请求体不是合法的JSON"}})
+            return
+
+        self.stats["requests"] += 1
+        self.stats["active"] += 1
+        self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+        try:
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                headers = {}
+                if self.error_status == 429 and self.retry_after is not None:
+                    headers['Retry-After'] = f"{self.retry_after:g}"
+                await self._send_json(writer, self.error_status, {"error": {"message": "模拟的上游错误"}}, headers)
+                return
+
+            messages = payload.get('messages') or []
+            prompt = "\n".join(str(message.get('content', '')) for message in messages if isinstance(message, dict))
+            content = self.build_content(prompt)
+            model = payload.get('model') or 'mock-model'
+
+            if payload.get('stream'):
+                self.stats["streams"] += 1
+                await self._send_stream(writer, content, model)
+            else:
+                await asyncio.sleep(self._first_delay())
+                await self._send_json(writer, 200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                })
+        finally:
+            self.stats["active"] -= 1
+
+    def _first_delay(self) -> float:
+        delay = self.ttft
+        if self.stall_rate and self._random.random() < self.stall_rate:
+            self.stats["stalls"] += 1
+            delay += self.stall_seconds
+        return delay
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, data: Dict[str, Any],
+                         headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        extra = ''.join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n{extra}\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+    async def _send_stream(self, writer: asyncio.StreamWriter, content: str, model: str) -> None:
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+        await writer.drain()
+
+        await asyncio.sleep(self._first_delay())
+
+        pieces = [content[i:i + self.chars_per_token] for i in range(0, len(content), self.chars_per_token)]
+        fail_at = self._random.randrange(len(pieces)) if pieces and self._random.random() < self.stream_error_rate else None
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        started = time.perf_counter()
+
+        for index, piece in enumerate(pieces):
+            if index == fail_at:
+                self.stats["stream_errors"] += 1
+                await self._write_chunked(writer, self._event({"error": {"message": "模拟的流式错误"}}))
+                break
+            await self._write_chunked(writer, self._event({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }))
+            if interval:
+                # 按绝对时间调度，避免累积误差
+                delay = started + (index + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        else:
+            await self._write_chunked(writer, self._event({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }) + b'data: [DONE]\n\n')
+
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def _event(data: Dict[str, Any]) -> bytes:
+        return b'data: ' + json.dumps(data, ensure_ascii=False).encode('utf-8') + b'\n\n'
+
+    async def _write_chunked(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        """以HTTP分块发送数据，配置了分块大小时按字节切分"""
+        size = self.fragment_size or len(data)
+        for start in range(0, len(data), size):
+            fragment = data[start:start + size]
+            writer.write(f"{len(fragment):x}\r\n".encode() + fragment + b'\r\n')
+            await writer.drain()
+
+
+async def _load_test(server: MockLLMServer, concurrency: int, total: int) -> None:
+    """在模拟服务上并发运行AI分析，输出吞吐、延迟和内存峰值"""
+    import tracemalloc
+    import numpy as np
+    import pandas as pd
+    from services.ai_analyzer import AIAnalyzer
+    from services.llm_scheduler import LLMScheduler
+    from services.technical_indicator import TechnicalIndicator
+    from utils.http_client import http_client_pool
+
+    rng = np.random.default_rng(0)
+    close = 10 + np.cumsum(rng.normal(0, 0.2, 120))
+    df = TechnicalIndicator().calculate_indicators(pd.DataFrame(
+        {'Open': close, 'High': close + 0.1, 'Low': close - 0.1, 'Close': close, 'Volume': rng.uniform(1e5, 2e5, 120)},
+        index=pd.bdate_range('2024-01-01', periods=120)))
+
+    scheduler = LLMScheduler()
+    # 压测只针对模拟服务，不向.env中配置的备用服务商发起对冲请求
+    analyzer = AIAnalyzer(custom_api_url=server.url, custom_api_key='mock', custom_api_model='mock-model', scheduler=scheduler,
+                          fallback_providers=[])
+    scheduler.provider(server.url).max_concurrency = concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+    durations: List[float] = []
+    errors = 0
+
+    async def one(index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            # 不同的股票代码使提示词互不相同，避免被共享流合并
+            async for message in analyzer.get_ai_analysis(df, f"{600000 + index:06d}", 'A', stream=True):
+                if '"error"' in message:
+                    errors += 1
+            durations.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await http_client_pool.aclose()
+
+    durations.sort()
+    print(f"请求: {total}  并发: {concurrency}  错误: {errors}  总耗时: {elapsed:.2f}s  吞吐: {total / elapsed:.1f} 次/秒")
+    print(f"耗时 p50: {durations[len(durations) // 2]:.3f}s  p95: {durations[int(len(durations) * 0.95) - 1]:.3f}s  "
+          f"内存峰值: {peak / 1e6:.1f} MB  服务端统计: {server.stats}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """启动模拟AI接口，或在其上运行AI分析压测"""
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容流式接口")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8900, help="监听端口")
+    parser.add_argument('--ttft', type=float, default=0.2, help="首个内容片段延迟（秒）")
+    parser.add_argument('--tokens-per-second', type=float, default=50, help="每秒输出的内容片段数，0为不限速")
+    parser.add_argument('--chars-per-token', type=int, default=2, help="每个内容片段的字符数")
+    parser.add_argument('--fragment-size', type=int, default=0, help="网络分块字节数，0为每个事件一个分块")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="直接返回错误响应的概率")
+    parser.add_argument('--error-status', type=int, default=500, help="错误响应的状态码")
+    parser.add_argument('--retry-after', type=float, default=None, help="429响应的Retry-After秒数")
+    parser.add_argument('--stream-error-rate', type=float, default=0.0, help="输出中途发送错误事件的概率")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="首个片段前额外停顿的概率")
+    parser.add_argument('--stall-seconds', type=float, default=20.0, help="额外停顿的秒数")
+    parser.add_argument('--seed', type=int, default=None, help="随机数种子")
+    parser.add_argument('--load-test', type=int, default=0, metavar='N', help="运行N次AI分析压测后退出")
+    parser.add_argument('--concurrency', type=int, default=10, help="压测并发数")
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer(
+        ttft=args.ttft, tokens_per_second=args.tokens_per_second, chars_per_token=args.chars_per_token,
+        fragment_size=args.fragment_size, error_rate=args.error_rate, error_status=args.error_status,
+        retry_after=args.retry_after, stream_error_rate=args.stream_error_rate, stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds, seed=args.seed
+    )
+
+    async def run() -> None:
+        if args.load_test:
+            async with server:
+                await _load_test(server, args.concurrency, args.load_test)
+            return
+        await server.start(args.host, args.port)
+        print(f"模拟AI接口: {server.url}（API_URL={server.url}）")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
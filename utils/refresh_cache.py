@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, Optional, Set, TypeVar
+from utils.logger import get_logger
+
+# 获取日志器
+logger = get_logger()
+
+T = TypeVar('T')
+
+
+class RefreshingCache(Generic[T]):
+    """
+    异步加载的单值缓存（stale-while-revalidate）
+
+    未过期时直接返回缓存值，临近过期时提前在后台刷新；过期后在最长陈旧时间内先返回旧值，同时在后台刷新；
+    没有缓存值或超过最长陈旧时间时等待刷新完成。刷新由锁串行化，并发的未命中只触发一次加载
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[T]], ttl: float, max_stale: Optional[float] = None,
+                 refresh_ahead: float = 0, name: str = ''):
+        """
+        初始化缓存
+
+        Args:
+            loader: 加载最新值的异步函数
+            ttl: 缓存有效期（秒）
+            max_stale: 过期后仍可先返回旧值的最长时间（秒），为空时不限制
+            refresh_ahead: 距离过期不足该时间（秒）时在后台提前刷新，为0时不提前刷新
+            name: 缓存名称，用于日志
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.refresh_ahead = refresh_ahead
+        self.name = name
+        self.value: Optional[T] = None
+        self.timestamp: Optional[float] = None
+        self._generation = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def age(self) -> Optional[float]:
+        """缓存值的年龄（秒），没有缓存值时为None"""
+        return None if self.timestamp is None else time.monotonic() - self.timestamp
+
+    async def get(self) -> T:
+        """
+        获取缓存值
+
+        Returns:
+            缓存值，必要时等待加载
+
+        Raises:
+            Exception: 没有可用的旧值且加载失败
+        """
+        age = self.age
+        if age is not None:
+            if age < self.ttl:
+                if self.refresh_ahead and age >= self.ttl - self.refresh_ahead:
+                    self.refresh_in_background()
+                return self.value
+            if self.max_stale is None or age < self.ttl + self.max_stale:
+                self.refresh_in_background()
+                return self.value
+        return await self.refresh()
+
+    async def refresh(self) -> T:
+        """
+        加载最新值
+
+        等待锁期间已有其他刷新完成时直接返回其结果
+
+        Returns:
+            最新值
+        """
+        return await self._refresh(self._generation)
+
+    async def _refresh(self, generation: int) -> T:
+        """加载最新值，generation之后已有刷新完成时直接返回其结果"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._generation != generation:
+                return self.value
+            started = time.perf_counter()
+            value = await self.loader()
+            self.value = value
+            self.timestamp = time.monotonic()
+            self._generation += 1
+            logger.debug(f"刷新缓存{self.name}完成，耗时 {time.perf_counter() - started:.2f} 秒")
+            return value
+
+    def refresh_in_background(self) -> None:
+        """在后台刷新，已有后台刷新进行中时不重复发起"""
+        if self._tasks:
+            return
+        task = asyncio.create_task(self._background_refresh(self._generation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _background_refresh(self, generation: int) -> None:
+        try:
+            await self._refresh(generation)
+        except Exception as e:
+            # 刷新失败时继续使用旧值，下次读取时再重试
+            logger.error(f"后台刷新缓存{self.name}失败: {str(e)}")
+
+    async def aclose(self) -> None:
+        """取消进行中的后台刷新"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def invalidate(self) -> None:
+        """清除缓存值"""
+        self.value = None
+        self.timestamp = None
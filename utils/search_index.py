@@ -0,0 +1,94 @@
+from typing import Dict, List, Sequence, Set
+
+
+class SearchIndex:
+    """
+    代码和名称的子串搜索索引
+
+    每行有若干检索词（如完整代码、去掉市场前缀的代码、名称），统一转为小写后建立一元和二元字符倒排索引。
+    查询时取关键词各二元字符倒排表的交集作为候选，再逐个确认子串匹配。
+    结果按匹配程度（与检索词完全相同 > 前缀 > 子串）排序，同等匹配按行号（调用方预先排好的顺序）排序
+    """
+
+    def __init__(self, terms: Sequence[Sequence[str]]):
+        """
+        构建索引
+
+        Args:
+            terms: 每行的检索词列表，行号即结果中的位置
+        """
+        self.terms: List[tuple] = [tuple(term.lower() for term in row if term) for row in terms]
+        self._exact: Dict[str, List[int]] = {}
+        postings: Dict[str, Set[int]] = {}
+
+        for position, row in enumerate(self.terms):
+            for term in row:
+                self._exact.setdefault(term, []).append(position)
+                grams = set(term)
+                grams.update(term[i:i + 2] for i in range(len(term) - 1))
+                for gram in grams:
+                    postings.setdefault(gram, set()).add(position)
+
+        # 倒排表按行号升序保存，候选按行号顺序确认，前缀匹配足够时可以提前结束
+        self._postings: Dict[str, List[int]] = {gram: sorted(rows) for gram, rows in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def search(self, keyword: str, limit: int = 10) -> List[int]:
+        """
+        搜索关键词
+
+        Args:
+            keyword: 关键词（不区分大小写）
+            limit: 最多返回的结果数
+
+        Returns:
+            匹配行的行号列表，按相关程度排序
+        """
+        keyword = keyword.strip().lower()
+        if not keyword or limit <= 0:
+            return []
+
+        exact = self._exact.get(keyword, [])
+        if len(exact) >= limit:
+            return exact[:limit]
+
+        candidates = self._candidates(keyword)
+        seen = set(exact)
+        prefix: List[int] = []
+        contains: List[int] = []
+        wanted = limit - len(exact)
+        for position in candidates:
+            if position in seen:
+                continue
+            row = self.terms[position]
+            if any(term.startswith(keyword) for term in row):
+                prefix.append(position)
+                if len(prefix) >= wanted:
+                    break
+            elif len(contains) < wanted and any(keyword in term for term in row):
+                contains.append(position)
+
+        return (exact + prefix + contains)[:limit]
+
+    def _candidates(self, keyword: str) -> List[int]:
+        """取关键词各二元字符倒排表的交集，按行号升序返回"""
+        if len(keyword) == 1:
+            return self._postings.get(keyword, [])
+
+        grams = {keyword[i:i + 2] for i in range(len(keyword) - 1)}
+        lists = []
+        for gram in grams:
+            rows = self._postings.get(gram)
+            if not rows:
+                return []
+            lists.append(rows)
+        lists.sort(key=len)
+
+        candidates = set(lists[0])
+        for rows in lists[1:]:
+            candidates.intersection_update(rows)
+            if not candidates:
+                return []
+        return sorted(candidates) if len(lists) > 1 else lists[0]
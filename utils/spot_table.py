@@ -0,0 +1,79 @@
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+
+
+class SpotTable:
+    """
+    标准化的行情表
+
+    加载时一次性完成类型转换：文本列缺失值转为空字符串，数值列转为float，百分比列（如“1.5%”或1.5）转为小数，
+    并为每行预先生成详情字典，按代码建立行号索引，详情查询为常数时间且不再分配内存。
+    子类通过类属性声明各列的类型和详情包含的字段
+    """
+
+    # 文本列
+    TEXT_COLUMNS: Tuple[str, ...] = ('name', 'symbol')
+
+    # 数值列
+    NUMERIC_COLUMNS: Tuple[str, ...] = ()
+
+    # 百分比列，转换为小数
+    PERCENT_COLUMNS: Tuple[str, ...] = ()
+
+    # 详情包含的字段（按输出顺序），缺失值为空字符串或0.0
+    DETAIL_COLUMNS: Tuple[str, ...] = ('name', 'symbol')
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        标准化行情表并建立索引
+
+        Args:
+            df: 转换列名后的行情DataFrame
+        """
+        df = df.copy()
+        for column in self.TEXT_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].where(df[column].notna(), '').astype(str)
+        for column in self.NUMERIC_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], errors='coerce').astype(float)
+        for column in self.PERCENT_COLUMNS:
+            if column in df.columns:
+                df[column] = self._parse_percent(df[column])
+        self.df = df
+
+        details = pd.DataFrame(index=df.index)
+        for column in self.DETAIL_COLUMNS:
+            if column in self.TEXT_COLUMNS:
+                details[column] = df[column] if column in df.columns else ''
+            else:
+                details[column] = df[column].fillna(0.0) if column in df.columns else 0.0
+        self.records: List[Dict[str, Any]] = details.to_dict('records')
+
+        # 代码重复时保留第一行
+        self.positions: Dict[str, int] = {}
+        for position, symbol in enumerate(df['symbol']):
+            self.positions.setdefault(symbol, position)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """
+        按代码获取详情
+
+        Args:
+            symbol: 代码
+
+        Returns:
+            详情字典（各请求共用，应视为只读），不存在时返回None
+        """
+        position = self.positions.get(symbol)
+        return None if position is None else self.records[position]
+
+    @staticmethod
+    def _parse_percent(series: pd.Series) -> pd.Series:
+        """把百分比文本或百分数转换为小数"""
+        if not pd.api.types.is_numeric_dtype(series):
+            series = series.astype(str).str.strip().str.rstrip('%')
+        return pd.to_numeric(series, errors='coerce').astype(float) / 100
@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, AsyncGenerator, AsyncIterable, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def loads(data: Any) -> Any:
+    """
+    解析JSON，已安装orjson时使用orjson
+
+    Args:
+        data: JSON文本（str或bytes）
+
+    Returns:
+        解析结果
+
+    Raises:
+        ValueError: JSON格式错误（json.JSONDecodeError和orjson.JSONDecodeError均为其子类）
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class SSEDecoder:
+    """
+    增量SSE（Server-Sent Events）解码器
+
+    按字节接收网络数据块，跨数据块保留不完整的行，只在遇到完整的行时解析；
+    同一事件的多行data按规范以换行连接，空行结束一个事件。
+    兼容不带data:前缀、直接逐行返回JSON的非标准实现
+    """
+
+    # SSE规范中的非data字段，解码时忽略
+    _IGNORED_FIELDS = (b'event', b'id', b'retry')
+
+    def __init__(self):
+        self._carry = b''
+        self._data_lines: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """
+        输入一个数据块
+
+        Args:
+            chunk: 网络数据块
+
+        Returns:
+            本数据块中完成的事件data列表
+        """
+        if not chunk:
+            return []
+
+        data = self._carry + chunk if self._carry else chunk
+        lines = data.splitlines(keepends=True)
+
+        # 最后一行没有换行符说明不完整，留到下一个数据块；以\r结尾时可能是\r\n的前半部分，也先保留
+        if lines[-1].endswith(b'\n'):
+            self._carry = b''
+        else:
+            self._carry = lines.pop()
+
+        events = []
+        for line in lines:
+            self._process_line(line.rstrip(b'\r\n'), events)
+        return events
+
+    def flush(self) -> List[str]:
+        """
+        结束输入，输出剩余的事件
+
+        Returns:
+            剩余的事件data列表
+        """
+        events = []
+        if self._carry:
+            self._process_line(self._carry.rstrip(b'\r\n'), events)
+            self._carry = b''
+        self._dispatch(events)
+        return events
+
+    def _process_line(self, line: bytes, events: List[str]) -> None:
+        if not line:
+            # 空行结束当前事件
+            self._dispatch(events)
+            return
+        if line.startswith(b':'):
+            # 注释（心跳）
+            return
+
+        field, sep, value = line.partition(b':')
+        if sep and field == b'data':
+            self._data_lines.append(value[1:] if value.startswith(b' ') else value)
+        elif sep and field in self._IGNORED_FIELDS:
+            return
+        else:
+            # 非标准实现直接返回的JSON行，视为一个完整事件
+            self._dispatch(events)
+            self._data_lines.append(line.strip())
+            self._dispatch(events)
+
+    def _dispatch(self, events: List[str]) -> None:
+        if self._data_lines:
+            events.append(b'\n'.join(self._data_lines).decode('utf-8', errors='replace'))
+            self._data_lines = []
+
+
+async def iter_sse_data(byte_chunks: AsyncIterable[bytes]) -> AsyncGenerator[str, None]:
+    """
+    从字节流中逐个解码SSE事件的data
+
+    Args:
+        byte_chunks: 字节数据块的异步迭代器，如httpx响应的aiter_bytes()
+
+    Returns:
+        异步生成器，逐个生成事件data文本
+    """
+    decoder = SSEDecoder()
+    async for chunk in byte_chunks:
+        for data in decoder.feed(chunk):
+            yield data
+    for data in decoder.flush():
+        yield data
+
+
+def _legacy_parse(chunks: List[str]) -> int:
+    """原有的逐数据块按行切分的解析方式，仅用于基准测试对比，返回解析出的内容片段数"""
+    buffer = ""
+    count = 0
+    for chunk in chunks:
+        for line in chunk.strip().split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("data: "):
+                line = line[6:]
+            if line == "[DONE]" or "error" in line.lower():
+                continue
+            try:
+                content = json.loads(line)["choices"][0]["delta"].get("content", "")
+            except (ValueError, KeyError, IndexError):
+                continue
+            if content:
+                count += 1
+                buffer += content
+    return count
+
+
+def _build_stream(tokens: int, chunk_size: int) -> List[bytes]:
+    """构造模拟的SSE响应体，并按固定字节数切块（数据块边界可能落在一行的中间）"""
+    body = b''.join(
+        b'data: ' + json.dumps({"choices": [{"delta": {"content": f"分析{i % 10}"}}]}, ensure_ascii=False).encode('utf-8') + b'\n\n'
+        for i in range(tokens)
+    ) + b'data: [DONE]\n\n'
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+async def _serve_mock(chunks: List[bytes], port: int = 0):
+    """启动本地模拟SSE服务，使用HTTP分块传输逐块发送"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.readuntil(b'\r\n\r\n')
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n')
+        for chunk in chunks:
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b'\r\n')
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', port)
+
+
+async def _benchmark(tokens: int, chunk_size: int, rounds: int) -> None:
+    import httpx
+
+    chunks = _build_stream(tokens, chunk_size)
+    server = await _serve_mock(chunks)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1/chat/completions"
+    total_bytes = sum(len(c) for c in chunks)
+
+    async with httpx.AsyncClient() as client:
+        for name in ('legacy', 'decoder'):
+            best = None
+            parsed = 0
+            for _ in range(rounds):
+                started = time.perf_counter()
+                async with client.stream('POST', url) as response:
+                    if name == 'legacy':
+                        parsed = _legacy_parse([text async for text in response.aiter_text()])
+                    else:
+                        parts = []
+                        async for data in iter_sse_data(response.aiter_bytes()):
+                            if data == '[DONE]':
+                                continue
+                            content = loads(data)["choices"][0]["delta"].get("content")
+                            if content:
+                                parts.append(content)
+                        parsed = len(parts)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:8s} 片段: {parsed}/{tokens}  耗时: {best * 1000:.1f}ms  "
+                  f"吞吐: {tokens / best:,.0f} 片段/秒, {total_bytes / best / 1e6:.1f} MB/秒")
+
+    server.close()
+    await server.wait_closed()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """基准测试：对比原有解析方式与增量解码器在本地模拟SSE服务上的单流吞吐量"""
+    parser = argparse.ArgumentParser(description="SSE解析基准测试")
+    parser.add_argument('--tokens', type=int, default=20000, help="模拟的内容片段数")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="网络数据块大小（字节）")
+    parser.add_argument('--rounds', type=int, default=3, help="重复次数，取最快一次")
+    args = parser.parse_args(argv)
+    asyncio.run(_benchmark(args.tokens, args.chunk_size, args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    ZoneInfo = None
+
+# 各市场的时区和交易时段（开盘、收盘，当地时间）
+# 只按工作日判断，不包含节假日；节假日最多导致一次多余的数据刷新
+MARKET_SESSIONS = {
+    'A': ('Asia/Shanghai', time(9, 30), time(15, 0)),
+    'ETF': ('Asia/Shanghai', time(9, 30), time(15, 0)),
+    'LOF': ('Asia/Shanghai', time(9, 30), time(15, 0)),
+    'HK': ('Asia/Hong_Kong', time(9, 30), time(16, 10)),
+    'US': ('America/New_York', time(9, 30), time(16, 0)),
+}
+
+# 时区数据不可用时的固定偏移
+_FALLBACK_OFFSETS = {
+    'Asia/Shanghai': 8,
+    'Asia/Hong_Kong': 8,
+    'America/New_York': -5,
+}
+
+
+def market_timezone(market_type: str):
+    """获取市场所在时区"""
+    tz_name = MARKET_SESSIONS.get(market_type, MARKET_SESSIONS['A'])[0]
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(tz_name)
+        except Exception:
+            pass
+    return timezone(timedelta(hours=_FALLBACK_OFFSETS[tz_name]))
+
+
+def market_now(market_type: str, now: Optional[datetime] = None) -> datetime:
+    """
+    获取市场当地时间
+
+    Args:
+        market_type: 市场类型
+        now: 参考时间，默认为当前时间；不带时区时视为本机时间
+
+    Returns:
+        带时区的市场当地时间
+    """
+    tz = market_timezone(market_type)
+    if now is None:
+        return datetime.now(tz)
+    if now.tzinfo is None:
+        now = now.astimezone()
+    return now.astimezone(tz)
+
+
+def session_bounds(market_type: str, day: date) -> Tuple[datetime, datetime]:
+    """获取某日的开盘和收盘时间（市场当地时间）"""
+    tz = market_timezone(market_type)
+    _, open_time, close_time = MARKET_SESSIONS.get(market_type, MARKET_SESSIONS['A'])
+    return datetime.combine(day, open_time, tz), datetime.combine(day, close_time, tz)
+
+
+def is_trading_day(day: date) -> bool:
+    """是否为交易日（仅按工作日判断）"""
+    return day.weekday() < 5
+
+
+def is_session_open(market_type: str, now: Optional[datetime] = None) -> bool:
+    """
+    当前是否处于交易时段
+
+    Args:
+        market_type: 市场类型
+        now: 参考时间
+
+    Returns:
+        是否处于交易时段
+    """
+    local_now = market_now(market_type, now)
+    if not is_trading_day(local_now.date()):
+        return False
+    session_open, session_close = session_bounds(market_type, local_now.date())
+    return session_open <= local_now < session_close
+
+
+def next_session_open(market_type: str, now: Optional[datetime] = None) -> datetime:
+    """
+    获取下一次开盘时间（即下一根日线开始出现的时间）
+
+    Args:
+        market_type: 市场类型
+        now: 参考时间
+
+    Returns:
+        带时区的下一次开盘时间
+    """
+    local_now = market_now(market_type, now)
+    day = local_now.date()
+    while True:
+        if is_trading_day(day):
+            session_open, _ = session_bounds(market_type, day)
+            if session_open > local_now:
+                return session_open
+        day += timedelta(days=1)
+
+
+def current_trading_day(market_type: str, now: Optional[datetime] = None) -> date:
+    """
+    获取当前对应的交易日：开盘后为当天，开盘前或非交易日为上一个交易日
+
+    Args:
+        market_type: 市场类型
+        now: 参考时间
+
+    Returns:
+        交易日日期
+    """
+    local_now = market_now(market_type, now)
+    day = local_now.date()
+    if is_trading_day(day) and local_now >= session_bounds(market_type, day)[0]:
+        return day
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
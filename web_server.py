@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request, Response, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
@@ -9,10 +9,22 @@ from services.stock_analyzer_service import StockAnalyzerService
 from services.us_stock_service_async import USStockServiceAsync
 from services.fund_service_async import FundServiceAsync
 from services.a_stock_list_service import AStockListService
+from services.backtest_engine import BacktestEngine
+from services.scan_job_service import ScanJobService
+from services.analysis_result_cache import AnalysisResultCache
+from services.scan_task_queue import ScanTaskQueue
+from services.market_snapshot import MarketSnapshot
+from services.stock_screener import StockScreener
+from services.ai_analysis_cache import AIAnalysisCache
+from services.llm_metrics import llm_metrics
+from services.llm_scheduler import llm_scheduler
+from services.llm_stream_hub import llm_stream_hub
 import os
 import httpx
 from utils.logger import get_logger
 from utils.api_utils import APIUtils
+from utils.http_client import http_client_pool
+from utils.metrics import metrics_registry
 from dotenv import load_dotenv
 import uvicorn
 import json
@@ -23,6 +35,8 @@ from jose import JWTError, jwt
 import time
 import psutil
 import threading
+import asyncio
+from contextlib import asynccontextmanager
 
 load_dotenv()
 
@@ -46,13 +60,33 @@ REQUIRE_LOGIN = bool(LOGIN_PASSWORD.strip())
 
 MODE = os.getenv("MODE", "RELEASE")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时恢复未完成的扫描任务、开始刷新市场快照并预加载基金行情，关闭时停止后台任务（含行情缓存的后台刷新）并关闭共享HTTP连接"""
+    # 管理接口运行在独立线程中，读取运行状态时需切换到主事件循环
+    app.state.loop = asyncio.get_running_loop()
+    scan_job_service.resume_jobs()
+    fund_service.warm_up()
+    snapshot_task = asyncio.create_task(
+        market_snapshot.run_refresh_loop(float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", 300)))
+    )
+    yield
+    snapshot_task.cancel()
+    await asyncio.gather(snapshot_task, return_exceptions=True)
+    await fund_service.aclose()
+    await us_stock_service.aclose()
+    await scan_task_queue.shutdown()
+    await scan_job_service.shutdown()
+    await http_client_pool.aclose()
+
 app = FastAPI(
     title="Stock Scanner API",
     description="异步股票分析API，支持A股、美股、港股及ETF基金的AI智能分析",
     version="1.0.0",
     docs_url="/docs" if MODE == "DEBUG" else None,
     redoc_url=None,
-    openapi_url="/openapi.json" if MODE == "DEBUG" else None
+    openapi_url="/openapi.json" if MODE == "DEBUG" else None,
+    lifespan=lifespan
 )
 
 # 添加CORS中间件
@@ -68,6 +102,27 @@ app.add_middleware(
 us_stock_service = USStockServiceAsync()
 fund_service = FundServiceAsync()
 a_stock_list_service = AStockListService()
+backtest_engine = BacktestEngine()
+# 基本分析结果缓存，在各请求的分析器实例之间共享
+analysis_result_cache = AnalysisResultCache()
+# 全市场最新指标快照，由分析、扫描结果实时更新并定期从本地行情历史增量刷新
+market_snapshot = MarketSnapshot()
+# 长期复用的股票分析服务，请求级的API配置通过with_api_config传入
+stock_analyzer_service = StockAnalyzerService(
+    result_cache=analysis_result_cache,
+    market_snapshot=market_snapshot,
+    # AI分析结果持久化缓存，同一交易日内相同的提示词不重复调用AI
+    analysis_cache=AIAnalysisCache() if os.getenv("AI_CACHE_ENABLED", "true").lower() in ("1", "true", "yes") else None
+)
+# 基于市场快照的条件选股
+stock_screener = StockScreener(market_snapshot, a_stock_list_service)
+# 批量扫描任务队列，相同的扫描请求只运行一次
+scan_task_queue = ScanTaskQueue(max_running=int(os.getenv("SCAN_TASK_MAX_RUNNING", 2)))
+scan_job_service = ScanJobService(
+    stock_analyzer_service.scan_pipeline,
+    a_stock_list_service=a_stock_list_service,
+    shard_size=int(os.getenv("SCAN_JOB_SHARD_SIZE", 200))
+)
 
 # 定义请求和响应模型
 class AnalyzeRequest(BaseModel):
@@ -77,6 +132,7 @@ class AnalyzeRequest(BaseModel):
     api_key: Optional[str] = Field(None, description="自定义API Key", example="sk-xxxxxx")
     api_model: Optional[str] = Field(None, description="自定义AI模型", example="gpt-4o")
     api_timeout: Optional[str] = Field(None, description="自定义API超时时间(秒)", example="60")
+    top_k: Optional[int] = Field(None, description="批量扫描时排行榜保留的股票数量", example=50)
 
 class TestAPIRequest(BaseModel):
     api_url: str = Field(..., description="API URL", example="https://api.openai.com/v1")
@@ -84,6 +140,33 @@ class TestAPIRequest(BaseModel):
     api_model: Optional[str] = Field(None, description="AI模型", example="gpt-4o")
     api_timeout: Optional[int] = Field(10, description="API超时时间(秒)", example=10)
 
+class BacktestRequest(BaseModel):
+    market_type: str = Field("A", description="市场类型(A/US/HK/ETF/LOF)", example="A")
+    stock_codes: Optional[List[str]] = Field(None, description="股票代码列表，为空时使用全部本地缓存行情", example=["600000"])
+    horizons: List[int] = Field([1, 5, 20], description="持有期（交易日）", example=[1, 5, 20])
+    min_score: Optional[float] = Field(None, description="评分阈值，提供时额外统计不低于该评分的样本", example=80)
+    start_date: Optional[str] = Field(None, description="信号开始日期", example="2024-01-01")
+    end_date: Optional[str] = Field(None, description="信号结束日期", example="2025-04-30")
+
+class ScanJobRequest(BaseModel):
+    universe: str = Field("codes", description="股票池类型: codes(指定代码)/all(全部A股)/filter(按条件筛选A股)", example="filter")
+    stock_codes: Optional[List[str]] = Field(None, description="股票代码列表，universe为codes时必填", example=["600000"])
+    industry: Optional[List[str]] = Field(None, description="行业筛选，universe为filter时有效", example=["银行"])
+    area: Optional[List[str]] = Field(None, description="地区筛选，universe为filter时有效", example=["深圳"])
+    board: Optional[List[str]] = Field(None, description="板块筛选（主板/创业板/科创板），universe为filter时有效", example=["主板"])
+    market_type: str = Field("A", description="市场类型(A/US/HK/ETF/LOF)", example="A")
+    min_score: int = Field(0, description="最低评分阈值", example=60)
+    shard_size: Optional[int] = Field(None, description="分片大小", example=200)
+
+class ScreenRequest(BaseModel):
+    expression: str = Field("", description="筛选表达式，可使用快照中的指标字段及行业(industry)、地区(area)、板块(market)、名称(name)", example="RSI < 30 and Volume_Ratio > 1.5 and industry == '银行'")
+    market_type: str = Field("A", description="市场类型(A/US/HK/ETF/LOF)", example="A")
+    sort_by: str = Field("score", description="排序字段", example="score")
+    ascending: bool = Field(False, description="是否升序", example=False)
+    page: int = Field(1, ge=1, description="页码", example=1)
+    page_size: int = Field(50, ge=1, le=500, description="每页数量", example=50)
+    columns: Optional[List[str]] = Field(None, description="返回的字段，为空时使用默认字段", example=["stock_code", "name", "RSI", "score"])
+
 class LoginRequest(BaseModel):
     password: str = Field(..., description="登录密码", example="your_password")
 
@@ -251,7 +334,7 @@ async def get_config():
     401: {"description": "未授权", "model": ErrorResponse},
     500: {"description": "服务器内部错误", "model": ErrorResponse}
 })
-async def analyze(request: AnalyzeRequest, username: str = Depends(verify_token)):
+async def analyze(request: AnalyzeRequest, http_request: Request, username: str = Depends(verify_token)):
     """
     AI分析股票
     
@@ -263,6 +346,7 @@ async def analyze(request: AnalyzeRequest, username: str = Depends(verify_token)
     - **api_key**: 自定义API Key，可选
     - **api_model**: 自定义API模型，可选
     - **api_timeout**: 自定义API超时时间，可选
+    - **top_k**: 批量扫描时排行榜保留的股票数量，可选，设置后会逐步推送临时排行榜
     
     响应示例:
     ```
@@ -293,12 +377,15 @@ async def analyze(request: AnalyzeRequest, username: str = Depends(verify_token)
         
         logger.debug(f"自定义API配置: URL={custom_api_url}, 模型={custom_api_model}, API Key={'已提供' if custom_api_key else '未提供'}, Timeout={custom_api_timeout}")
         
-        # 创建新的分析器实例，使用自定义配置
-        custom_analyzer = StockAnalyzerService(
+        # 复用共享的分析服务组件，仅替换请求级的API配置；
+        # 以客户端地址（经nginx转发时取X-Real-IP）区分用户，AI请求排队时在用户之间轮转放行
+        client_ip = http_request.headers.get("x-real-ip") or (http_request.client.host if http_request.client else None)
+        custom_analyzer = stock_analyzer_service.with_api_config(
             custom_api_url=custom_api_url,
             custom_api_key=custom_api_key,
             custom_api_model=custom_api_model,
-            custom_api_timeout=custom_api_timeout
+            custom_api_timeout=custom_api_timeout,
+            user=client_ip
         )
         
         if not stock_codes:
@@ -336,13 +423,28 @@ async def analyze(request: AnalyzeRequest, username: str = Depends(verify_token)
                 logger.debug(f"开始处理批量股票的流式响应")
                 chunk_count = 0
                 
+                # 相同的扫描（代码集合、市场、参数及AI配置一致）共享同一个后台任务的输出；
+                # 键中包含实际使用的API密钥的哈希，使用不同密钥的用户不会共享彼此的上游调用
+                scan_codes = [code.strip() for code in stock_codes]
+                scan_key = ScanTaskQueue.make_key(
+                    scan_codes, market_type, min_score=0,
+                    top_k=request.top_k, api_url=custom_api_url, api_model=custom_api_model,
+                    api_key_hash=custom_analyzer.ai_analyzer.api_key_hash
+                )
+                scan_stream = scan_task_queue.subscribe(
+                    scan_key,
+                    lambda: custom_analyzer.scan_stocks(
+                        scan_codes, 
+                        min_score=0, 
+                        market_type=market_type,
+                        stream=True,
+                        top_k=request.top_k
+                    ),
+                    summary=f"{market_type} {len(scan_codes)}只股票"
+                )
+                
                 # 使用异步生成器
-                async for chunk in custom_analyzer.scan_stocks(
-                    [code.strip() for code in stock_codes], 
-                    min_score=0, 
-                    market_type=market_type,
-                    stream=True
-                ):
+                async for chunk in scan_stream:
                     chunk_count += 1
                     yield chunk + '\n'
                 
@@ -361,6 +463,240 @@ async def analyze(request: AnalyzeRequest, username: str = Depends(verify_token)
             logger.exception(e)
         raise HTTPException(status_code=500, detail=error_msg)
 
+# 评分历史回测
+@app.post("/api/backtest", responses={
+    200: {"description": "回测成功"},
+    400: {"description": "请求参数错误或无可用数据", "model": ErrorResponse},
+    401: {"description": "未授权", "model": ErrorResponse},
+    500: {"description": "服务器内部错误", "model": ErrorResponse}
+})
+async def backtest(request: BacktestRequest, username: str = Depends(verify_token)):
+    """
+    评分历史回测
+    
+    基于本地缓存的行情历史，计算每只股票每个交易日的评分，统计各评分区间的未来收益、胜率和回撤
+    
+    - **market_type**: 市场类型
+    - **stock_codes**: 股票代码列表，可选，为空时使用全部本地缓存行情
+    - **horizons**: 持有期（交易日）列表
+    - **min_score**: 评分阈值，可选
+    - **start_date**: 信号开始日期，可选
+    - **end_date**: 信号结束日期，可选
+    
+    示例响应:
+    ```json
+    {
+      "market_type": "A",
+      "symbols": 300,
+      "observations": 52000,
+      "horizons": [5],
+      "buckets": {"5": [{"min_score": 80, "max_score": null, "recommendation": "强烈推荐", "count": 1200, "mean_return": 0.0123, "hit_rate": 0.56, ...}]},
+      "threshold": {"min_score": 80, "5": {"selected": {...}, "baseline": {...}}}
+    }
+    ```
+    """
+    try:
+        logger.info(f"开始回测: market_type={request.market_type}, horizons={request.horizons}, min_score={request.min_score}")
+        
+        # 回测为CPU密集型计算，放到线程池中执行
+        return await asyncio.to_thread(
+            backtest_engine.run,
+            market_type=request.market_type,
+            stock_codes=request.stock_codes,
+            horizons=request.horizons,
+            min_score=request.min_score,
+            start_date=request.start_date,
+            end_date=request.end_date
+        )
+        
+    except ValueError as e:
+        logger.warning(f"回测参数错误: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        error_msg = f"回测时出错: {str(e)}"
+        logger.error(error_msg)
+        if TRACE_ENABLED:
+            trace_info = traceback.format_exc()
+            logger.error(f"错误堆栈: \n{trace_info}")
+        else:
+            logger.exception(e)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+# 条件选股
+@app.post("/api/screen", responses={
+    200: {"description": "筛选成功"},
+    400: {"description": "筛选表达式或排序字段错误", "model": ErrorResponse},
+    401: {"description": "未授权", "model": ErrorResponse},
+    500: {"description": "服务器内部错误", "model": ErrorResponse}
+})
+async def screen_stocks(request: ScreenRequest, username: str = Depends(verify_token)):
+    """
+    条件选股
+    
+    在市场快照（最新价格、技术指标、评分）与A股基础信息关联后的表格上向量化筛选，不访问上游数据源
+    
+    - **expression**: 筛选表达式，支持比较、and/or/not、in、四则运算，如 `RSI < 30 and Volume_Ratio > 1.5 and industry == '银行'`
+    - **market_type**: 市场类型
+    - **sort_by**: 排序字段
+    - **ascending**: 是否升序
+    - **page**: 页码
+    - **page_size**: 每页数量
+    - **columns**: 返回的字段，可选
+    
+    示例响应:
+    ```json
+    {
+      "market_type": "A",
+      "expression": "RSI < 30 and industry == '银行'",
+      "total": 3,
+      "universe": 5120,
+      "page": 1,
+      "page_size": 50,
+      "columns": ["stock_code", "name", "industry", "price", "score", "RSI"],
+      "items": [{"stock_code": "600000", "name": "浦发银行", "industry": "银行", "price": 8.12, "score": 55, "RSI": 27.3}],
+      "elapsed_ms": 3.2
+    }
+    ```
+    """
+    try:
+        return await stock_screener.screen(
+            expression=request.expression,
+            market_type=request.market_type,
+            sort_by=request.sort_by,
+            ascending=request.ascending,
+            page=request.page,
+            page_size=request.page_size,
+            columns=request.columns
+        )
+        
+    except ValueError as e:
+        logger.warning(f"条件选股参数错误: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        error_msg = f"条件选股时出错: {str(e)}"
+        logger.error(error_msg)
+        if TRACE_ENABLED:
+            trace_info = traceback.format_exc()
+            logger.error(f"错误堆栈: \n{trace_info}")
+        else:
+            logger.exception(e)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+# 创建全市场扫描任务
+@app.post("/api/scan_jobs", responses={
+    200: {"description": "任务已创建"},
+    400: {"description": "请求参数错误", "model": ErrorResponse},
+    401: {"description": "未授权", "model": ErrorResponse},
+    500: {"description": "服务器内部错误", "model": ErrorResponse}
+})
+async def create_scan_job(request: ScanJobRequest, username: str = Depends(verify_token)):
+    """
+    创建扫描任务
+    
+    在后台分片扫描股票池，每个分片完成后写入检查点，服务重启后自动从未完成的分片继续
+    
+    - **universe**: 股票池类型，codes/all/filter
+    - **stock_codes**: 股票代码列表（codes）
+    - **industry** / **area** / **board**: 筛选条件（filter）
+    - **market_type**: 市场类型
+    - **min_score**: 最低评分阈值
+    - **shard_size**: 分片大小，可选
+    
+    返回任务ID和进度信息
+    """
+    try:
+        universe = {"type": request.universe}
+        if request.universe == 'codes':
+            universe['codes'] = request.stock_codes or []
+        elif request.universe == 'filter':
+            universe.update({"industry": request.industry, "area": request.area, "market": request.board})
+        
+        return await scan_job_service.create_job(universe, request.market_type, request.min_score, request.shard_size)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        error_msg = f"创建扫描任务时出错: {str(e)}"
+        logger.error(error_msg)
+        logger.exception(e)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+# 扫描任务列表
+@app.get("/api/scan_jobs")
+async def list_scan_jobs(username: str = Depends(verify_token)):
+    """
+    获取所有扫描任务及其进度
+    """
+    return {"jobs": scan_job_service.list_jobs()}
+
+# 扫描任务进度
+@app.get("/api/scan_jobs/{job_id}", responses={
+    200: {"description": "获取成功"},
+    404: {"description": "任务不存在", "model": ErrorResponse}
+})
+async def get_scan_job(job_id: str, username: str = Depends(verify_token)):
+    """
+    获取扫描任务进度
+    
+    - **job_id**: 任务ID
+    """
+    try:
+        return scan_job_service.get_job(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# 扫描任务结果
+@app.get("/api/scan_jobs/{job_id}/results", responses={
+    200: {"description": "获取成功"},
+    404: {"description": "任务不存在", "model": ErrorResponse}
+})
+async def get_scan_job_results(job_id: str, top: int = 100, min_score: Optional[int] = None, username: str = Depends(verify_token)):
+    """
+    获取扫描任务结果
+    
+    汇总已完成分片的结果，任务运行中也可以查询当前已有的排行
+    
+    - **job_id**: 任务ID
+    - **top**: 返回评分最高的股票数量，默认100
+    - **min_score**: 最低评分阈值，默认使用任务创建时的阈值
+    """
+    try:
+        return await asyncio.to_thread(scan_job_service.get_results, job_id, top, min_score)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# 取消扫描任务
+@app.post("/api/scan_jobs/{job_id}/cancel", responses={
+    200: {"description": "已取消"},
+    404: {"description": "任务不存在", "model": ErrorResponse}
+})
+async def cancel_scan_job(job_id: str, username: str = Depends(verify_token)):
+    """
+    取消扫描任务，已完成分片的结果会保留
+    
+    - **job_id**: 任务ID
+    """
+    try:
+        return await scan_job_service.cancel_job(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# 恢复扫描任务
+@app.post("/api/scan_jobs/{job_id}/resume", responses={
+    200: {"description": "已恢复"},
+    404: {"description": "任务不存在", "model": ErrorResponse}
+})
+async def resume_scan_job(job_id: str, username: str = Depends(verify_token)):
+    """
+    恢复失败或已取消的扫描任务，从未完成的分片继续
+    
+    - **job_id**: 任务ID
+    """
+    try:
+        return await scan_job_service.resume_job(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 # 搜索美股代码
 @app.get("/api/search_us_stocks", response_model=SearchResponse, responses={
     200: {"description": "搜索成功", "model": SearchResponse},
@@ -637,10 +973,11 @@ async def test_api_connection(request: TestAPIRequest, username: str = Depends(v
         logger.debug(f"完整API测试URL: {test_url}")
         print(f"完整API测试URL: {test_url}")
         
-        # 使用异步HTTP客户端发送测试请求
-        async with httpx.AsyncClient(timeout=float(api_timeout)) as client:
+        # 使用共享连接池发送测试请求，测试成功后的分析可直接复用该连接
+        async with http_client_pool.client(test_url) as client:
             response = await client.post(
                 test_url,
+                timeout=float(api_timeout),
                 headers={
                     "Authorization": f"Bearer {api_key}",
                     "Content-Type": "application/json"
@@ -896,6 +1233,44 @@ async def health_check():
             content={"status": "error", "detail": error_msg}
         )
 
+# 指标接口（Prometheus文本格式）
+@health_app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    导出Prometheus格式的指标
+    
+    包含按模型和API主机统计的AI请求延迟直方图：首个内容片段延迟、片段间隔、总耗时、
+    每秒片段数、提示词与响应大小，以及按结果统计的请求数
+    """
+    return PlainTextResponse(metrics_registry.render_prometheus())
+
+# AI请求延迟汇总接口
+@health_app.get("/metrics/llm")
+async def llm_metrics_summary():
+    """
+    按模型和API主机汇总AI请求的延迟与吞吐
+    
+    返回各直方图的数量、均值和p50/p95/p99估算值、提示词编码的累计指标、各服务商的排队情况
+    以及相同请求共享上游输出的次数，用于按实测延迟选择模型和服务商
+    """
+    # 调度器、请求共享中心和提示词编码的状态由主事件循环修改，在主事件循环中读取快照，
+    # 避免迭代时字典被修改；直方图指标由指标注册表加锁，可直接读取
+    loop = getattr(app.state, 'loop', None)
+    if loop is not None and loop.is_running() and loop is not asyncio.get_running_loop():
+        future = asyncio.run_coroutine_threadsafe(_llm_runtime_stats(), loop)
+        runtime_stats = await asyncio.wait_for(asyncio.wrap_future(future), timeout=5)
+    else:
+        runtime_stats = await _llm_runtime_stats()
+    return {"models": llm_metrics.summary(), **runtime_stats}
+
+async def _llm_runtime_stats() -> Dict[str, Any]:
+    """在主事件循环中复制AI请求的运行状态"""
+    return {
+        "scheduler": llm_scheduler.get_stats(),
+        "shared_streams": {**llm_stream_hub.metrics, "in_flight": len(llm_stream_hub)},
+        "prompt_encoder": dict(stock_analyzer_service.ai_analyzer.prompt_encoder.metrics)
+    }
+
 # 启动健康检查服务的函数
 def start_health_service():
     uvicorn.run(health_app, host="0.0.0.0", port=8080)
@@ -907,4 +1282,9 @@ if __name__ == '__main__':
     logger.info("健康检查服务已在端口8080启动")
     
     # 启动主应用
-    uvicorn.run("web_server:app", host="0.0.0.0", port=8888, reload=True)
\ No newline at end of file
+    # 热重载会在子进程中运行主应用，管理接口看不到其中的指标，因此只在调试模式下启用；
+    # 其他模式直接传入应用对象，与管理接口共享同一组服务实例
+    if MODE == "DEBUG":
+        uvicorn.run("web_server:app", host="0.0.0.0", port=8888, reload=True)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8888)
\ No newline at end of file